@@ -0,0 +1,40 @@
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+from app.config import get_settings
+
+router = APIRouter()
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    """Allow the request only if it carries `Authorization: Bearer <ADMIN_TOKEN>`"""
+    token = get_settings().admin_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorization or not secrets.compare_digest(authorization, f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def _profiler(request: Request):
+    profiler = getattr(request.app.state, "profiler", None)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    return profiler
+
+@router.get("/profile", dependencies=[Depends(require_admin)])
+async def download_profile(request: Request):
+    """Download aggregated stack samples in folded format (flamegraph.pl / speedscope)"""
+    profiler = _profiler(request)
+    return PlainTextResponse(
+        profiler.folded(),
+        headers={
+            "Content-Disposition": 'attachment; filename="profile.folded"',
+            "X-Profile-Samples": str(profiler.samples),
+            "X-Profiled-Requests": str(profiler.profiled_requests),
+        },
+    )
+
+@router.delete("/profile", dependencies=[Depends(require_admin)])
+async def reset_profile(request: Request):
+    """Discard collected samples"""
+    _profiler(request).reset()
+    return {"status": "reset"}
@@ -0,0 +1,44 @@
+from starlette.requests import HTTPConnection
+from app.utils.maps_client import MapsClient
+from app.utils.llm_client import LLMClient
+from app.utils.admission import AdmissionController
+from app.utils.rate_limiter import RateLimiter
+from app.utils.cache import TTLCache
+from app.utils.jobs import JobQueue
+from app.utils.offload import Offloader
+from app.utils.place_pager import PlacePager
+from app.utils.result_cache import ResultCache
+from app.utils.sessions import SessionStore
+
+# Clients are created once in the app lifespan (see app.main) and shared by all requests.
+# HTTPConnection lets the same dependencies serve HTTP routes and WebSocket endpoints
+
+def get_maps_client(conn: HTTPConnection) -> MapsClient:
+    return conn.app.state.maps_client
+
+def get_llm_client(conn: HTTPConnection) -> LLMClient:
+    return conn.app.state.llm_client
+
+def get_admission(conn: HTTPConnection) -> AdmissionController:
+    return conn.app.state.llm_admission
+
+def get_rate_limiter(conn: HTTPConnection) -> RateLimiter:
+    return conn.app.state.rate_limiter
+
+def get_place_details_cache(conn: HTTPConnection) -> TTLCache:
+    return conn.app.state.place_details_cache
+
+def get_place_pager(conn: HTTPConnection) -> PlacePager:
+    return conn.app.state.place_pager
+
+def get_result_cache(conn: HTTPConnection) -> ResultCache:
+    return conn.app.state.results
+
+def get_session_store(conn: HTTPConnection) -> SessionStore:
+    return conn.app.state.sessions
+
+def get_offloader(conn: HTTPConnection) -> Offloader:
+    return conn.app.state.offloader
+
+def get_llm_jobs(conn: HTTPConnection) -> JobQueue:
+    return conn.app.state.llm_jobs
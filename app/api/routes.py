@@ -1,41 +1,210 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
-from typing import List, Optional
-from app.models.location import LocationResponse, DirectionsResponse
-from app.utils.maps_client import MapsClient
-from app.utils.llm_client import LLMClient
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.config import get_settings
+from app.models.location import (
+    LocationResponse, DirectionsResponse, OptimizedRouteResponse, Place, PlaceDetailsResponse, UserLocation
+)
+from app.utils.maps_client import MapsClient, PLACE_DETAIL_FIELDS, DEFAULT_DETAIL_FIELDS, render_directions_map_html
+from app.utils.gazetteer import GAZETTEER_ID_PREFIX
+from app.utils.llm_client import LLMClient, is_fallback
+from app.utils.offload import Offloader
+from app.utils.metrics import LLM_REQUEST_STAGE_SECONDS, ROUTE_SOLVE_SECONDS, SESSION_CONTEXT_SAVES
+from app.utils.admission import AdmissionController, AdmissionRejected
+from app.utils.cache import TTLCache
+from app.utils.jobs import Job, JobQueue
+from app.utils.place_pager import InvalidCursor, PlacePager
+from app.utils.result_cache import ResultCache
+from app.utils.ranking import rank_places
+from app.utils.route_optimizer import MAX_ROUTE_STOPS, UNREACHABLE_COST, order_stops, route_cost
+from app.utils.sessions import ConversationState, SessionStore
+from app.api.deps import (
+    get_maps_client, get_admission, get_llm_jobs, get_offloader, get_place_details_cache, get_place_pager,
+    get_result_cache, get_session_store
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-maps_client = MapsClient()
-llm_client = LLMClient()
 
 class LocationQuery(BaseModel):
+    query: str = ""
+    # `next_cursor` from a previous page; when set, `query` is ignored
+    cursor: Optional[str] = None
+    user_location: Optional[UserLocation] = None
+
+class LocationStreamQuery(BaseModel):
     query: str
+    max_pages: int = Field(3, ge=1, le=3)
+    user_location: Optional[UserLocation] = None
+
+def rank_for_user(response: LocationResponse, user_location: Optional[UserLocation]) -> LocationResponse:
+    """Re-rank a page of results nearest/best first for the user; no extra upstream calls"""
+    if user_location is None or not response.places or response.status != "OK":
+        return response
+    places = rank_places(response.places, user_location.lat, user_location.lng, user_location.radius_km)
+    return response.model_copy(update={"places": places, "status": "OK" if places else "ZERO_RESULTS"})
+
+def route_steps(directions: Optional[DirectionsResponse]) -> int:
+    if directions is None:
+        return 0
+    return sum(len(leg.steps) for route in directions.routes for leg in route.legs)
+
+async def model_response(
+    model: BaseModel,
+    offloader: Offloader,
+    size: int,
+    response: Optional[Response] = None
+) -> Response:
+    """`model` as a JSON response, serialized in a single pass
+
+    Returned as a model, FastAPI would validate it against `response_model`
+    again and go through plain dicts before encoding: about 7x the cost of
+    `model_dump_json` for a long route, all on the event loop. Past the offload
+    threshold (`size` in route steps) the one pass runs off the loop as well.
+    Headers set on the injected `response` (session cookies) are carried over.
+    """
+    body = await offloader.run("response_json", model.model_dump_json, size=size, allow_process=False)
+    result = Response(content=body, media_type="application/json")
+    if response is not None:
+        result.raw_headers.extend(h for h in response.raw_headers if h[0] != b"content-length")
+    return result
 
 @router.post("/search", response_model=LocationResponse)
-async def search_location(query: LocationQuery):
-    """Search for a location based on a query string"""
+async def search_location(query: LocationQuery, pager: PlacePager = Depends(get_place_pager)):
+    """Search for a location based on a query string, one page at a time"""
+    if not query.query and not query.cursor:
+        raise HTTPException(status_code=400, detail="Either 'query' or 'cursor' is required")
     try:
-        result = maps_client.search_place(query.query)
-        return result
+        result = await pager.page(query.query, query.cursor)
+        return rank_for_user(result, query.user_location)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/search/stream")
+async def stream_search(query: LocationStreamQuery, pager: PlacePager = Depends(get_place_pager)):
+    """Stream search result pages as newline-delimited JSON, each as soon as it arrives"""
+    async def pages():
+        async for page in pager.pages(query.query, query.max_pages):
+            yield rank_for_user(page, query.user_location).model_dump_json() + "\n"
+    return StreamingResponse(pages(), media_type="application/x-ndjson")
+
+@router.get("/suggest", response_model=LocationResponse)
+async def suggest_places(
+    q: str = Query(..., min_length=1, description="Beginning of a place name"),
+    limit: int = Query(10, ge=1, le=50),
+    maps_client: MapsClient = Depends(get_maps_client)
+):
+    """Well-known places whose name starts with `q`, from the offline gazetteer (no Google call)"""
+    return await run_in_threadpool(maps_client.suggest_places, q, limit)
+
 @router.get("/directions", response_model=DirectionsResponse)
 async def get_directions(
     origin: str = Query(..., description="Origin address or coordinates"),
     destination: str = Query(..., description="Destination address or coordinates"),
-    mode: str = Query("driving", description="Travel mode: driving, walking, bicycling, transit")
+    mode: str = Query("driving", description="Travel mode: driving, walking, bicycling, transit"),
+    results: ResultCache = Depends(get_result_cache),
+    offloader: Offloader = Depends(get_offloader)
 ):
     """Get directions from origin to destination"""
     try:
-        result = maps_client.get_directions(origin, destination, mode)
-        return result
+        result = await results.get_directions(origin, destination, mode)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return await model_response(result, offloader, route_steps(result))
+
+class MultiStopQuery(BaseModel):
+    origin: str
+    stops: List[str] = Field(..., min_length=1, max_length=MAX_ROUTE_STOPS)
+    # Where the route must end; without it, it ends at whichever stop suits best
+    destination: Optional[str] = None
+    # Come back to `origin` after the last stop
+    round_trip: bool = False
+    mode: str = "driving"
+
+def _known_cost(matrix: List[List[float]], order: List[int]) -> Optional[float]:
+    cost = route_cost(matrix, order)
+    return None if cost >= UNREACHABLE_COST else round(cost, 1)
+
+@router.post("/directions/optimize", response_model=OptimizedRouteResponse)
+async def optimize_route(
+    query: MultiStopQuery,
+    results: ResultCache = Depends(get_result_cache),
+    offloader: Offloader = Depends(get_offloader)
+):
+    """Directions from origin through every stop, in the order that takes least time"""
+    if query.round_trip and query.destination:
+        raise HTTPException(status_code=400, detail="'destination' and 'round_trip' can't be combined")
+    points = [query.origin, *query.stops] + ([query.destination] if query.destination else [])
+    try:
+        matrix, matrix_requests = await results.travel_time_matrix(points, query.mode)
+        with ROUTE_SOLVE_SECONDS.time():
+            order = await run_in_threadpool(order_stops, matrix, query.round_trip, query.destination is not None)
+        given = list(range(len(points)))
+        if query.round_trip:
+            order, given = order + [0], given + [0]
+        directions = await results.get_route([points[i] for i in order], query.mode)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    optimized = OptimizedRouteResponse(
+        order=[i - 1 for i in order if 1 <= i <= len(query.stops)],
+        duration=_known_cost(matrix, order),
+        given_order_duration=_known_cost(matrix, given),
+        matrix_requests=matrix_requests,
+        directions=directions,
+        status=directions.status
+    )
+    return await model_response(optimized, offloader, route_steps(directions))
+
+@router.get("/place/{place_id}", response_model=PlaceDetailsResponse, response_model_exclude_none=True)
+async def get_place_details(
+    place_id: str,
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated fields to fetch, e.g. website,opening_hours "
+                    "(default: opening_hours,website,international_phone_number)"
+    ),
+    maps_client: MapsClient = Depends(get_maps_client),
+    cache: TTLCache = Depends(get_place_details_cache)
+):
+    """Get details for a place from a search result; only the requested fields are fetched and billed"""
+    requested = sorted({f.strip() for f in fields.split(",") if f.strip()}) if fields else sorted(DEFAULT_DETAIL_FIELDS)
+    unknown = [f for f in requested if f not in PLACE_DETAIL_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PLACE_DETAIL_FIELDS)}"
+        )
+    if place_id == "web-fallback" or place_id.startswith(GAZETTEER_ID_PREFIX):
+        # Not Google places; there are no details to fetch
+        raise HTTPException(status_code=404, detail="Place not found")
+
+    try:
+        # Concurrent requests for the same place and fields share one upstream call
+        result = await cache.get_or_load(
+            (place_id, tuple(requested)),
+            lambda: run_in_threadpool(maps_client.get_place_details, place_id, requested),
+            cacheable=lambda response: response.status == "OK"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if result.status in ("NOT_FOUND", "INVALID_REQUEST"):
+        raise HTTPException(status_code=404, detail="Place not found")
+    if result.status != "OK":
+        raise HTTPException(status_code=502, detail="Place details are temporarily unavailable")
+    return result
 
 class LLMRequest(BaseModel):
     prompt: str
+    # When given, the place shown is the best nearby match rather than Google's first result
+    user_location: Optional[UserLocation] = None
 
 class LLMResponse(BaseModel):
     text: str
@@ -43,59 +212,284 @@ class LLMResponse(BaseModel):
     directions: Optional[DirectionsResponse] = None
     map_html: Optional[str] = None
     web_url: Optional[str] = None
+    # Whether clients may reuse this answer for the same prompt; not for keyword fallbacks or failed lookups
+    cacheable: bool = False
 
-@router.post("/llm", response_model=LLMResponse)
-async def process_llm_request(request: LLMRequest):
-    """Process a natural language request through the LLM and return relevant map data"""
-    try:
-        # Process the prompt with LLM to extract location information
-        llm_result = llm_client.process_prompt(request.prompt)
-        
-        # If locations were identified, search for them
-        locations = None
-        directions = None
-        map_html = None
-        web_url = None
-        
-        if llm_result.get("location_query"):
-            try:
-                location_response = maps_client.search_place(llm_result["location_query"])
-                
-                # Check if we have a web fallback
-                if location_response and location_response.status == "WEB_FALLBACK":
-                    web_url = location_response.web_url
-                    # Don't generate map HTML for web fallback
-                    map_html = None
-                    locations = [location_response]  # Wrap in list
-                elif location_response and location_response.places:
-                    # Generate map HTML for regular locations
+async def resolve_map_data(
+    llm_result: Dict[str, Any],
+    maps_client: MapsClient,
+    results: ResultCache,
+    emit: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None,
+    session: Optional[ConversationState] = None,
+    user_location: Optional[UserLocation] = None
+) -> LLMResponse:
+    """Look up the places and directions an LLM result asks for and build the response
+
+    Searches and directions go through the `results` cache; uncached Maps
+    calls run in the threadpool. If `emit` is given it is awaited with
+    ("locations", ...) and ("directions", ...) as soon as each part is ready,
+    so streaming callers can show results before the whole response is done.
+    With a `session`, references to earlier places are filled in and places
+    the conversation already resolved are reused instead of looked up again.
+    With a `user_location`, search results are ranked nearest/best first.
+    """
+    if session is not None:
+        llm_result = session.fill_references(llm_result)
+    
+    # If locations were identified, search for them
+    locations = None
+    directions = None
+    map_html = None
+    web_url = None
+    
+    if llm_result.get("location_query"):
+        try:
+            known_place = session.find_place(llm_result["location_query"]) if session is not None else None
+            if known_place is not None:
+                SESSION_CONTEXT_SAVES.labels("place_search").inc()
+                location_response = LocationResponse(places=[known_place], status="OK")
+            else:
+                with LLM_REQUEST_STAGE_SECONDS.labels("places").time():
+                    location_response = await results.search_place(llm_result["location_query"])
+                location_response = rank_for_user(location_response, user_location)
+                if session is not None and location_response.status == "OK":
+                    session.remember_places(location_response.places, llm_result["location_query"])
+            
+            # Check if we have a web fallback
+            if location_response and location_response.status == "WEB_FALLBACK":
+                web_url = location_response.web_url
+                # Don't generate map HTML for web fallback
+                map_html = None
+                locations = [location_response]  # Wrap in list
+            elif location_response and location_response.places:
+                # Generate map HTML for regular locations
+                with LLM_REQUEST_STAGE_SECONDS.labels("map_html").time():
                     map_html = maps_client.generate_map_html(location_response.places[0])
-                    locations = [location_response]  # Wrap in list
-            except Exception as e:
-                print(f"Error processing location query: {str(e)}")
-                # Return the web fallback response when API fails
-                location_response = maps_client.search_place(llm_result["location_query"])
                 locations = [location_response]  # Wrap in list
+        except Exception as e:
+            logger.warning("Error processing location query: %s", e)
+            # Return the web fallback response when API fails
+            location_response = await run_in_threadpool(maps_client.search_place, llm_result["location_query"])
+            locations = [location_response]  # Wrap in list
+        if emit is not None and locations:
+            await emit("locations", {
+                "locations": [loc.model_dump() for loc in locations],
+                "map_html": map_html,
+                "web_url": web_url
+            })
+    
+    # If directions were requested, get them
+    if llm_result.get("directions_query"):
+        origin = llm_result.get("origin", "")
+        destination = llm_result.get("destination", "")
+        mode = llm_result.get("travel_mode", "driving")
         
-        # If directions were requested, get them
-        if llm_result.get("directions_query"):
-            origin = llm_result.get("origin", "")
-            destination = llm_result.get("destination", "")
-            mode = llm_result.get("travel_mode", "driving")
+        if origin and destination:
+            origin_param, destination_param = origin, destination
+            if session is not None:
+                # Endpoints the conversation already resolved go to Google as place ids
+                origin_param = session.directions_endpoint(origin) or origin
+                destination_param = session.directions_endpoint(destination) or destination
+                saved = (origin_param != origin) + (destination_param != destination)
+                if saved:
+                    SESSION_CONTEXT_SAVES.labels("geocode").inc(saved)
+            with LLM_REQUEST_STAGE_SECONDS.labels("directions").time():
+                directions = await results.get_directions(origin_param, destination_param, mode)
+            if session is not None and directions.status == "OK":
+                session.remember_route(origin, destination, mode)
             
-            if origin and destination:
-                directions = maps_client.get_directions(origin, destination, mode)
-                
-                # Generate directions map
-                if directions and directions.routes:
-                    map_html = maps_client.generate_directions_map_html(directions)
+            # Generate directions map
+            map_args = maps_client.directions_map_args(directions) if directions else None
+            if map_args is not None:
+                with LLM_REQUEST_STAGE_SECONDS.labels("directions_map_html").time():
+                    # A long route's page is built off the event loop
+                    map_html = await maps_client.offloader.run(
+                        "directions_map_html", render_directions_map_html, *map_args,
+                        size=len(directions.routes[0].legs[0].steps)
+                    )
+            if emit is not None and directions:
+                await emit("directions", {"directions": directions.model_dump(), "map_html": map_html})
+    
+    return LLMResponse(
+        text=llm_result.get("response", ""),
+        locations=locations,
+        directions=directions,
+        map_html=map_html,
+        web_url=web_url,
+        cacheable=(
+            not is_fallback(llm_result)
+            and all(location.status == "OK" for location in locations or [])
+            and (directions is None or directions.status == "OK")
+        )
+    )
+
+def admitted_generation(
+    llm_client: LLMClient,
+    admission: AdmissionController,
+    prompt: str,
+    context: Optional[str]
+) -> Callable[[], Awaitable[Dict[str, Any]]]:
+    """Loader for a cached prompt that holds an admission slot, also when it runs as a background refresh"""
+    async def generate() -> Dict[str, Any]:
+        cheap = len(prompt) <= get_settings().llm_cheap_prompt_chars
+        async with admission.slot(priority=cheap):
+            with LLM_REQUEST_STAGE_SECONDS.labels("llm").time():
+                # Run the blocking call off the event loop so the slot limit bounds real concurrency
+                return await run_in_threadpool(llm_client.process_prompt, prompt, context)
+    return generate
+
+@router.post("/llm", response_model=LLMResponse)
+async def process_llm_request(
+    request: LLMRequest,
+    http_request: Request,
+    response: Response,
+    maps_client: MapsClient = Depends(get_maps_client),
+    admission: AdmissionController = Depends(get_admission),
+    results: ResultCache = Depends(get_result_cache),
+    sessions: SessionStore = Depends(get_session_store),
+    offloader: Offloader = Depends(get_offloader)
+):
+    """Process a natural language request through the LLM and return relevant map data"""
+    # Conversation state, so follow-ups can refer back to earlier places
+    session = sessions.for_connection(http_request, response)
+    context = session.prompt_context()
+    try:
+        # Process the prompt with LLM to extract location information. Generations are
+        # admission-controlled, and short prompts get the priority lane
+        llm_result = await results.process_prompt(
+            request.prompt, context, generate=admitted_generation(results.llm_client, admission, request.prompt, context)
+        )
         
-        return LLMResponse(
-            text=llm_result.get("response", ""),
-            locations=locations,
-            directions=directions,
-            map_html=map_html,
-            web_url=web_url
+        llm_response = await resolve_map_data(
+            llm_result, maps_client, results, session=session, user_location=request.user_location
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail="LLM is at capacity, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    return await model_response(llm_response, offloader, route_steps(llm_response.directions), response)
+
+class SessionTurn(BaseModel):
+    """The places and route of an answer the client already has, e.g. from its own cache"""
+    places: List[Place] = Field([], max_length=ConversationState.MAX_PLACES)
+    origin: Optional[str] = Field(None, max_length=200)
+    destination: Optional[str] = Field(None, max_length=200)
+    mode: Optional[str] = Field(None, pattern="^(driving|walking|bicycling|transit)$")
+
+@router.post("/session/turn", status_code=204)
+async def record_session_turn(
+    turn: SessionTurn,
+    http_request: Request,
+    response: Response,
+    sessions: SessionStore = Depends(get_session_store)
+):
+    """Record an answer shown without asking the server, so follow-ups can refer to it (no LLM or Maps call)"""
+    session = sessions.for_connection(http_request, response)
+    # In the order resolve_map_data remembers them: the route's destination ends up in focus
+    session.remember_places(turn.places)
+    if turn.origin and turn.destination:
+        session.remember_route(turn.origin, turn.destination, turn.mode or "driving")
+    response.status_code = 204
+
+class LLMJobResponse(BaseModel):
+    id: str
+    # queued, running, done or failed
+    status: str
+    result: Optional[LLMResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+
+def job_response(job: Job) -> LLMJobResponse:
+    return LLMJobResponse(
+        id=job.id,
+        status=job.status,
+        result=job.result,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at
+    )
+
+def encode_job(job: Job) -> bytes:
+    """A job's poll response body, as stored in the shared job directory"""
+    return job_response(job).model_dump_json().encode()
+
+def patient_generation(generate: Callable[[], Awaitable[Dict[str, Any]]]) -> Callable[[], Awaitable[Dict[str, Any]]]:
+    """Loader that waits out admission rejections: nobody holds a connection open for a job, so it can queue longer"""
+    async def patient() -> Dict[str, Any]:
+        while True:
+            try:
+                return await generate()
+            except AdmissionRejected as e:
+                await asyncio.sleep(e.retry_after)
+    return patient
+
+@router.post("/llm/jobs", response_model=LLMJobResponse, status_code=202)
+async def submit_llm_job(
+    request: LLMRequest,
+    http_request: Request,
+    response: Response,
+    maps_client: MapsClient = Depends(get_maps_client),
+    admission: AdmissionController = Depends(get_admission),
+    results: ResultCache = Depends(get_result_cache),
+    sessions: SessionStore = Depends(get_session_store),
+    jobs: JobQueue = Depends(get_llm_jobs)
+):
+    """Start `/api/llm` as a background job and return its id right away; poll `GET /api/llm/jobs/{id}` for the result"""
+    session = sessions.for_connection(http_request, response)
+    context = session.prompt_context()
+    prompt = request.prompt
+    user_location = request.user_location
+
+    async def run() -> LLMResponse:
+        generate = admitted_generation(results.llm_client, admission, prompt, context)
+        llm_result = await results.process_prompt(prompt, context, generate=patient_generation(generate))
+        return await resolve_map_data(llm_result, maps_client, results, session=session, user_location=user_location)
+
+    # The same question, in the same conversation state, from the same session. The unfinished job
+    # keeps `session` alive, so its id can't be reused by another session in the meantime
+    key = (
+        id(session),
+        " ".join(prompt.lower().split()),
+        context,
+        user_location.model_dump_json() if user_location is not None else None
+    )
+    try:
+        job = jobs.submit(run, key=key)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many LLM jobs queued, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    response.headers["Location"] = f"{http_request.url.path}/{job.id}"
+    return job_response(job)
+
+@router.get("/llm/jobs/{job_id}", response_model=LLMJobResponse)
+async def get_llm_job(
+    job_id: str,
+    response: Response,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish before answering (long poll)"),
+    jobs: JobQueue = Depends(get_llm_jobs),
+    offloader: Offloader = Depends(get_offloader)
+):
+    """Status of an LLM job, with its result once it is done"""
+    wait = min(wait, get_settings().llm_job_max_wait)
+    job = jobs.get(job_id)
+    if job is not None:
+        await job.wait(wait)
+        if not job.done:
+            response.headers["Retry-After"] = "1"
+        size = route_steps(job.result.directions) if job.result is not None else 0
+        return await model_response(job_response(job), offloader, size, response)
+
+    # Submitted to another worker process: answer from the shared job directory
+    stored = await jobs.read_stored(job_id, wait)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    body, done = stored
+    return Response(content=body, media_type="application/json", headers=None if done else {"Retry-After": "1"})
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.api.deps import get_maps_client, get_llm_client, get_admission, get_rate_limiter, get_result_cache, get_session_store
+from app.api.routes import resolve_map_data, admitted_generation
+from app.models.location import UserLocation
+from app.utils.admission import AdmissionController, AdmissionRejected
+from app.utils.llm_client import LLMClient, CancelToken, GenerationCancelled
+from app.utils.log import request_id_var
+from app.utils.maps_client import MapsClient
+from app.utils.metrics import LLM_REQUEST_STAGE_SECONDS, RATE_LIMIT_REJECTIONS, WS_CONNECTIONS, WS_MESSAGES, LLM_CANCELLATIONS
+from app.utils.rate_limiter import RateLimiter
+from app.utils.result_cache import ResultCache
+from app.utils.sessions import ConversationState, SessionStore
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Chat requests one connection may have running at once
+MAX_IN_FLIGHT_PER_CONNECTION = 4
+
+class ChatSession:
+    """One /ws/chat connection: runs chat requests concurrently and multiplexes their replies
+
+    Client messages:
+        {"type": "chat", "id": "<id>", "prompt": "...", "user_location": {"lat": .., "lng": ..}}
+        {"type": "cancel", "id": "<id>"}
+
+    Server messages, all tagged with the request id:
+        token       one piece of the LLM output as it is generated
+        locations   place results, as soon as they are resolved
+        directions  directions results, as soon as they are resolved
+        result      the full response, same fields as POST /api/llm
+        cancelled   the request was cancelled and will send nothing more
+        error       the request failed ("status", "detail", optional "retry_after")
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        maps_client: MapsClient,
+        llm_client: LLMClient,
+        admission: AdmissionController,
+        rate_limiter: RateLimiter,
+        results: ResultCache,
+        conversation: ConversationState
+    ):
+        self.websocket = websocket
+        self.maps_client = maps_client
+        self.llm_client = llm_client
+        self.admission = admission
+        self.rate_limiter = rate_limiter
+        self.results = results
+        self.conversation = conversation
+        self.connection_id = uuid.uuid4().hex[:12]
+        self.client_ip = websocket.client.host if websocket.client else "unknown"
+        # Replies are queued and written by a single task, so concurrent requests never interleave frames
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.in_flight: Dict[str, Tuple[asyncio.Task, CancelToken]] = {}
+
+    def send(self, message: Dict[str, Any]):
+        self.outbox.put_nowait(message)
+
+    def _send_for(self, msg_id: str, message: Dict[str, Any]):
+        # Drop late output of requests that were cancelled in the meantime
+        if msg_id in self.in_flight:
+            self.send(message)
+
+    def _error(self, msg_id: Optional[str], status: int, detail: str, **extra):
+        self.send({"type": "error", "id": msg_id, "status": status, "detail": detail, **extra})
+
+    async def run(self):
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                frame = await self.websocket.receive()
+                if frame["type"] == "websocket.disconnect":
+                    break
+                raw = frame.get("text")
+                if raw is None:
+                    self._error(None, 400, "Messages must be text frames")
+                    continue
+                try:
+                    message = json.loads(raw)
+                except json.JSONDecodeError:
+                    self._error(None, 400, "Messages must be JSON")
+                    continue
+                if not isinstance(message, dict):
+                    self._error(None, 400, "Messages must be JSON objects")
+                    continue
+                msg_type = message.get("type")
+                WS_MESSAGES.labels(str(msg_type)).inc()
+                if msg_type == "chat":
+                    self._start(message)
+                elif msg_type == "cancel":
+                    self.cancel(str(message.get("id", "")))
+                else:
+                    self._error(message.get("id"), 400, f"Unknown message type {msg_type!r}")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # The client is gone: stop every generation it started
+            for msg_id in list(self.in_flight):
+                self.cancel(msg_id, notify=False)
+            writer.cancel()
+
+    async def _write(self):
+        while True:
+            message = await self.outbox.get()
+            await self.websocket.send_text(json.dumps(message))
+
+    def _start(self, message: Dict[str, Any]):
+        msg_id = str(message.get("id") or "")
+        prompt = message.get("prompt")
+        if not msg_id or not isinstance(prompt, str) or not prompt.strip():
+            self._error(msg_id or None, 400, "A chat message needs an 'id' and a non-empty 'prompt'")
+            return
+        if msg_id in self.in_flight:
+            self._error(msg_id, 409, "A request with this id is already running")
+            return
+        if len(self.in_flight) >= MAX_IN_FLIGHT_PER_CONNECTION:
+            self._error(msg_id, 429, "Too many requests in flight on this connection")
+            return
+        if not self.rate_limiter.is_allowed(self.client_ip):
+            RATE_LIMIT_REJECTIONS.inc()
+            self._error(msg_id, 429, "Rate limit exceeded")
+            return
+
+        user_location = None
+        if message.get("user_location") is not None:
+            try:
+                user_location = UserLocation.model_validate(message["user_location"])
+            except ValidationError:
+                self._error(msg_id, 400, "'user_location' needs 'lat' and 'lng' (and optionally 'radius_km')")
+                return
+
+        cancel = CancelToken()
+        task = asyncio.create_task(self._handle(msg_id, prompt, cancel, user_location))
+        self.in_flight[msg_id] = (task, cancel)
+
+    def cancel(self, msg_id: str, notify: bool = True):
+        entry = self.in_flight.pop(msg_id, None)
+        if entry is None:
+            return
+        task, cancel = entry
+        # Closing the upstream response stops Ollama; cancelling the task skips the Maps lookups
+        cancel.cancel()
+        task.cancel()
+        LLM_CANCELLATIONS.inc()
+        if notify:
+            self.send({"type": "cancelled", "id": msg_id})
+
+    async def _handle(self, msg_id: str, prompt: str, cancel: CancelToken, user_location: Optional[UserLocation]):
+        request_id_var.set(f"{self.connection_id}:{msg_id}")
+        loop = asyncio.get_running_loop()
+
+        def on_token(text: str):
+            # Called from the worker thread that reads the stream
+            if not cancel.cancelled:
+                loop.call_soon_threadsafe(self._send_for, msg_id, {"type": "token", "id": msg_id, "text": text})
+
+        async def emit(kind: str, payload: Dict[str, Any]):
+            self._send_for(msg_id, {"type": kind, "id": msg_id, **payload})
+
+        try:
+            context = self.conversation.prompt_context()
+            llm_result = self.results.cached_prompt(
+                prompt, context, generate=admitted_generation(self.llm_client, self.admission, prompt, context)
+            )
+            if llm_result is not None:
+                # Answered from cache: the whole text arrives as a single token
+                self._send_for(msg_id, {"type": "token", "id": msg_id, "text": llm_result.get("response", "")})
+            else:
+                cheap = len(prompt) <= get_settings().llm_cheap_prompt_chars
+                async with self.admission.slot(priority=cheap):
+                    with LLM_REQUEST_STAGE_SECONDS.labels("llm").time():
+                        llm_result = await run_in_threadpool(
+                            self.llm_client.stream_prompt, prompt, on_token, cancel, context
+                        )
+                self.results.remember_prompt(prompt, context, llm_result)
+            response = await resolve_map_data(
+                llm_result, self.maps_client, self.results, emit, self.conversation, user_location
+            )
+            self._send_for(msg_id, {"type": "result", "id": msg_id, **response.model_dump()})
+        except GenerationCancelled:
+            pass
+        except AdmissionRejected as e:
+            self._send_for(msg_id, {
+                "type": "error", "id": msg_id, "status": 503,
+                "detail": "LLM is at capacity, please retry shortly", "retry_after": e.retry_after
+            })
+        except Exception as e:
+            logger.exception("Chat request failed")
+            self._send_for(msg_id, {"type": "error", "id": msg_id, "status": 500, "detail": str(e)})
+        finally:
+            entry = self.in_flight.get(msg_id)
+            if entry is not None and entry[1] is cancel:
+                del self.in_flight[msg_id]
+
+def origin_allowed(websocket: WebSocket, allowed: List[str]) -> bool:
+    """Whether the page that opened the socket may drive the session its cookie names
+
+    Browsers send the cookie with a WebSocket handshake from any site, so a
+    foreign origin could otherwise act as the user (cross-site WebSocket
+    hijacking). Clients that send no Origin are not browsers and carry no
+    victim's cookie.
+    """
+    origin = websocket.headers.get("origin")
+    if origin is None:
+        return True
+    origin = origin.rstrip("/").lower()
+    if origin in allowed:
+        return True
+    host = websocket.headers.get("host", "").lower()
+    return bool(host) and urlsplit(origin).netloc == host
+
+@router.websocket("/ws/chat")
+async def chat_socket(
+    websocket: WebSocket,
+    maps_client: MapsClient = Depends(get_maps_client),
+    llm_client: LLMClient = Depends(get_llm_client),
+    admission: AdmissionController = Depends(get_admission),
+    rate_limiter: RateLimiter = Depends(get_rate_limiter),
+    results: ResultCache = Depends(get_result_cache),
+    sessions: SessionStore = Depends(get_session_store)
+):
+    """Chat over one long-lived connection instead of a POST /api/llm per message"""
+    if not origin_allowed(websocket, get_settings().ws_allowed_origins):
+        logger.warning("Rejected /ws/chat from origin %s", websocket.headers.get("origin"))
+        # Closing before accept() answers the handshake with 403
+        await websocket.close(code=1008)
+        return
+    # The page load sets the session cookie, so the socket shares context with /api/llm
+    conversation, headers = sessions.for_websocket(websocket)
+    await websocket.accept(headers=headers)
+    WS_CONNECTIONS.inc()
+    try:
+        await ChatSession(websocket, maps_client, llm_client, admission, rate_limiter, results, conversation).run()
+    finally:
+        WS_CONNECTIONS.dec()
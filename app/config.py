@@ -0,0 +1,142 @@
+import os
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+
+class Settings:
+    """Application configuration, read from the environment (and .env) once at startup"""
+
+    def __init__(self):
+        # Google Maps
+        self.google_maps_api_key: Optional[str] = os.getenv("GOOGLE_MAPS_API_KEY")
+        self.google_maps_base_url = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com")
+
+        # Place details are fetched on demand and cached per (place_id, fields)
+        self.place_details_cache_ttl = float(os.getenv("PLACE_DETAILS_CACHE_TTL", 86400))
+        self.place_details_cache_size = int(os.getenv("PLACE_DETAILS_CACHE_SIZE", 4096))
+
+        # Offline gazetteer of well-known places (built with `python -m app.utils.gazetteer build`).
+        # GAZETTEER_MODE: "first" answers confident matches without calling Google, "fallback"
+        # only uses it when the Places API fails, "off" ignores it
+        self.gazetteer_path = os.getenv("GAZETTEER_PATH", "")
+        self.gazetteer_mode = os.getenv("GAZETTEER_MODE", "first").lower()
+        self.gazetteer_min_confidence = float(os.getenv("GAZETTEER_MIN_CONFIDENCE", 0.9))
+        # Places with fewer inhabitants (or none recorded) get proportionally less confidence
+        self.gazetteer_min_population = int(os.getenv("GAZETTEER_MIN_POPULATION", 100000))
+
+        # Free-text places already resolved to a place_id/coordinates, reused by directions
+        self.resolution_cache_ttl = float(os.getenv("RESOLUTION_CACHE_TTL", 86400))
+        self.resolution_cache_size = int(os.getenv("RESOLUTION_CACHE_SIZE", 10000))
+
+        # Stale-while-revalidate caches for searches, directions and LLM results: entries are
+        # served up to RESULT_CACHE_GRACE seconds past their TTL while being refreshed
+        self.search_cache_ttl = float(os.getenv("SEARCH_CACHE_TTL", 300))
+        self.directions_cache_ttl = float(os.getenv("DIRECTIONS_CACHE_TTL", 900))
+        self.llm_cache_ttl = float(os.getenv("LLM_CACHE_TTL", 3600))
+        self.result_cache_grace = float(os.getenv("RESULT_CACHE_GRACE", 300))
+        self.result_cache_size = int(os.getenv("RESULT_CACHE_SIZE", 4096))
+        # Searches and directions are kept packed (a fraction of the memory) and decoded on each hit
+        self.result_cache_compact = os.getenv("RESULT_CACHE_COMPACT", "true").lower() in ("1", "true", "yes")
+
+        # Stop-to-stop travel times for multi-stop routes, shared by every route touching a pair
+        self.travel_time_cache_ttl = float(os.getenv("TRAVEL_TIME_CACHE_TTL", 3600))
+        self.travel_time_cache_size = int(os.getenv("TRAVEL_TIME_CACHE_SIZE", 100000))
+
+        # Cache warming (opt-in): the most requested searches and routes are fetched again on startup and
+        # every WARMER_INTERVAL seconds, at most WARMER_BUDGET upstream calls per run across all workers.
+        # WARMER_SNAPSHOT persists those queries between restarts; unset keeps them in memory only
+        self.warmer_enabled = os.getenv("WARMER_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.warmer_top_n = int(os.getenv("WARMER_TOP_N", 100))
+        self.warmer_budget = int(os.getenv("WARMER_BUDGET", 50))
+        self.warmer_rate = float(os.getenv("WARMER_RATE", 2))
+        self.warmer_interval = float(os.getenv("WARMER_INTERVAL", 3600))
+        self.warmer_snapshot = os.getenv("WARMER_SNAPSHOT", "") or None
+
+        # Conversation sessions (follow-up prompts reuse earlier places)
+        self.session_ttl = float(os.getenv("SESSION_TTL", 1800))
+        self.session_max = int(os.getenv("SESSION_MAX", 10000))
+
+        # Search pagination: the next page of a query users page through is prefetched once its token becomes
+        # valid, at most SEARCH_PREFETCH_PER_MINUTE times a minute. Cursors are signed with SEARCH_CURSOR_SECRET,
+        # which every worker must share (run_server generates one for its workers when unset)
+        self.search_prefetch = os.getenv("SEARCH_PREFETCH", "true").lower() in ("1", "true", "yes")
+        self.search_page_token_delay = float(os.getenv("SEARCH_PAGE_TOKEN_DELAY", 2.0))
+        self.search_prefetch_per_minute = int(os.getenv("SEARCH_PREFETCH_PER_MINUTE", 30))
+        self.search_cursor_secret = os.getenv("SEARCH_CURSOR_SECRET", "")
+
+        # Ollama
+        self.ollama_host = os.getenv("OLLAMA_HOST", "http://localhost")
+        self.ollama_port = os.getenv("OLLAMA_PORT", "11434")
+        self.ollama_model = os.getenv("OLLAMA_MODEL", "deepseek/deepseek-chat-v3.1:free")
+        # Comma-separated base URLs of several Ollama nodes; defaults to OLLAMA_HOST:OLLAMA_PORT
+        backends = os.getenv("OLLAMA_BACKENDS", "")
+        self.ollama_backends = [b.strip() for b in backends.split(",") if b.strip()] or [f"{self.ollama_host}:{self.ollama_port}"]
+        self.ollama_routing = os.getenv("OLLAMA_ROUTING", "least_outstanding")
+        self.ollama_sticky = os.getenv("OLLAMA_STICKY", "false").lower() in ("1", "true", "yes")
+        self.ollama_failure_threshold = int(os.getenv("OLLAMA_FAILURE_THRESHOLD", 3))
+        self.ollama_ejection_seconds = float(os.getenv("OLLAMA_EJECTION_SECONDS", 10))
+        # Seconds to connect to a node, and at most between two reads of its answer (a stream's tokens included);
+        # a call that times out counts as a failure of that node
+        self.ollama_connect_timeout = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", 5))
+        self.ollama_read_timeout = float(os.getenv("OLLAMA_READ_TIMEOUT", 120))
+
+        # Server
+        self.fastapi_host = os.getenv("FASTAPI_HOST", "0.0.0.0")
+        self.fastapi_port = int(os.getenv("FASTAPI_PORT", 8000))
+        self.max_requests_per_minute = int(os.getenv("MAX_REQUESTS_PER_MINUTE", 60))
+        # Origins, besides the app's own host, whose pages may open /ws/chat (comma-separated, e.g. https://example.com)
+        origins = os.getenv("WS_ALLOWED_ORIGINS", "")
+        self.ws_allowed_origins = [o.strip().rstrip("/").lower() for o in origins.split(",") if o.strip()]
+
+        # Production server tuning (ignored in --dev mode)
+        self.web_concurrency = int(os.getenv("WEB_CONCURRENCY", 0)) or available_cpus()
+        self.keepalive_timeout = int(os.getenv("KEEPALIVE_TIMEOUT", 75))
+        self.backlog = int(os.getenv("BACKLOG", 2048))
+        self.graceful_shutdown_timeout = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", 30))
+        self.limit_max_requests = int(os.getenv("LIMIT_MAX_REQUESTS", 0)) or None
+
+        # LLM admission control
+        self.llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+        self.llm_max_queue = int(os.getenv("LLM_MAX_QUEUE", 32))
+        self.llm_queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))
+        self.llm_cheap_prompt_chars = int(os.getenv("LLM_CHEAP_PROMPT_CHARS", 80))
+
+        # Asynchronous LLM jobs (POST /api/llm/jobs). LLM_JOB_DIR is where worker processes share job states;
+        # unset keeps jobs in memory, and run_server then creates a private directory when it starts several workers
+        self.llm_job_workers = int(os.getenv("LLM_JOB_WORKERS", 4))
+        self.llm_job_max_queued = int(os.getenv("LLM_JOB_MAX_QUEUED", 100))
+        self.llm_job_ttl = float(os.getenv("LLM_JOB_TTL", 600))
+        self.llm_job_store_size = int(os.getenv("LLM_JOB_STORE_SIZE", 1000))
+        self.llm_job_timeout = float(os.getenv("LLM_JOB_TIMEOUT", 300))
+        self.llm_job_max_wait = float(os.getenv("LLM_JOB_MAX_WAIT", 30))
+        self.llm_job_dir = os.getenv("LLM_JOB_DIR", "") or None
+
+        # CPU-bound steps (building long routes, JSON extraction from long LLM answers, directions map
+        # pages) move off the event loop once their payload reaches the OFFLOAD_MIN_* size.
+        # OFFLOAD_MODE: "thread", "process" (sidesteps the GIL) or "inline" (never offload)
+        self.offload_mode = os.getenv("OFFLOAD_MODE", "thread").lower()
+        self.offload_workers = int(os.getenv("OFFLOAD_WORKERS", 2))
+        self.offload_min_route_steps = int(os.getenv("OFFLOAD_MIN_ROUTE_STEPS", 200))
+        self.offload_min_llm_chars = int(os.getenv("OFFLOAD_MIN_LLM_CHARS", 20000))
+        self.offload_min_map_steps = int(os.getenv("OFFLOAD_MIN_MAP_STEPS", 500))
+
+        # Startup warmup
+        self.warmup_enabled = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.warmup_timeout = float(os.getenv("WARMUP_TIMEOUT", 120))
+
+        # Admin and profiling
+        self.admin_token = os.getenv("ADMIN_TOKEN", "")
+        self.profile_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+        self.profile_interval_ms = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects container/affinity limits where the OS exposes them)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load .env and build the settings on first use; later calls return the same object"""
+    load_dotenv()
+    return Settings()
@@ -1,17 +1,177 @@
+import argparse
+import asyncio
+import importlib.util
+import logging
 import os
+import random
+import secrets
+import shutil
+import tempfile
+import time
+import uuid
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-from app.api.routes import router as api_router
+from starlette.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.api.routes import router as api_router, encode_job
+from app.api.admin import router as admin_router
+from app.api.ws import router as ws_router
 from app.utils.rate_limiter import RateLimiter
+from app.utils.metrics import (
+    REGISTRY, HTTP_REQUESTS_IN_FLIGHT, HTTP_REQUEST_SECONDS, RATE_LIMIT_REJECTIONS,
+    STARTUP_SECONDS, FIRST_REQUEST_SECONDS, READY
+)
+from app.utils.log import request_id_var, setup_logging, shutdown_logging
+from app.utils.profiler import create_profiler
+from app.utils.maps_client import MapsClient
+from app.utils.llm_client import LLMClient
+from app.utils.offload import Offloader, monitor_event_loop_lag
+from app.utils.admission import AdmissionController
+from app.utils.cache import TTLCache
+from app.utils.jobs import JobQueue
+from app.utils.place_pager import PlacePager
+from app.utils.result_cache import ResultCache
+from app.utils.sketch import AccessHistory
+from app.utils.warmer import CacheWarmer
+from app.utils.sessions import SessionStore
+from starlette.routing import Match
+
+# Load configuration (including .env) once for the whole process
+settings = get_settings()
+
+setup_logging()
+
+# Named explicitly: under `python -m app.main` __name__ is "__main__", outside the app.* hierarchy
+logger = logging.getLogger("app.main")
+
+async def warmup(app: FastAPI):
+    """Prime upstream connections and the Ollama model, then mark the app ready"""
+    started = time.perf_counter()
+    try:
+        await run_in_threadpool(app.state.offloader.start)
+    except Exception as e:
+        logger.warning("Starting offload workers failed: %s", e)
+    for name, client in (("maps", app.state.maps_client), ("llm", app.state.llm_client)):
+        try:
+            await run_in_threadpool(client.warmup, timeout=settings.warmup_timeout)
+        except Exception as e:
+            # Serving still works without warm connections; it is only slower at first
+            logger.warning("Warmup of %s client failed: %s", name, e)
+    elapsed = time.perf_counter() - started
+    STARTUP_SECONDS.labels("warmup").set(elapsed)
+    app.state.ready = True
+    READY.set(1)
+    logger.info("Warmup finished in %.2fs", elapsed)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    app.state.ready = False
+    app.state.first_request_recorded = False
+    app.state.offloader = Offloader(
+        settings.offload_mode,
+        workers=settings.offload_workers,
+        thresholds={
+            "directions": settings.offload_min_route_steps,
+            "llm_json": settings.offload_min_llm_chars,
+            "directions_map_html": settings.offload_min_map_steps,
+            "response_json": settings.offload_min_route_steps
+        }
+    )
+    app.state.maps_client = MapsClient(settings, offloader=app.state.offloader)
+    app.state.llm_client = LLMClient(settings, offloader=app.state.offloader)
+    app.state.llm_admission = AdmissionController(
+        max_concurrent=settings.llm_max_concurrency,
+        max_queue=settings.llm_max_queue,
+        queue_timeout=settings.llm_queue_timeout
+    )
+    app.state.place_details_cache = TTLCache(
+        "place_details",
+        ttl=settings.place_details_cache_ttl,
+        max_entries=settings.place_details_cache_size
+    )
+    app.state.results = ResultCache(
+        app.state.maps_client,
+        app.state.llm_client,
+        search_ttl=settings.search_cache_ttl,
+        directions_ttl=settings.directions_cache_ttl,
+        llm_ttl=settings.llm_cache_ttl,
+        grace=settings.result_cache_grace,
+        max_entries=settings.result_cache_size,
+        history=AccessHistory(capacity=max(settings.warmer_top_n * 5, 100)) if settings.warmer_enabled else None,
+        travel_time_ttl=settings.travel_time_cache_ttl,
+        travel_time_entries=settings.travel_time_cache_size,
+        compact=settings.result_cache_compact
+    )
+    app.state.place_pager = PlacePager(
+        app.state.maps_client,
+        results=app.state.results,
+        prefetch=settings.search_prefetch,
+        token_delay=settings.search_page_token_delay,
+        secret=settings.search_cursor_secret.encode("utf-8") or None,
+        prefetch_per_minute=settings.search_prefetch_per_minute
+    )
+    app.state.sessions = SessionStore(ttl=settings.session_ttl, max_sessions=settings.session_max)
+    app.state.llm_jobs = JobQueue(
+        encode_job,
+        workers=settings.llm_job_workers,
+        max_queued=settings.llm_job_max_queued,
+        ttl=settings.llm_job_ttl,
+        max_stored=settings.llm_job_store_size,
+        timeout=settings.llm_job_timeout,
+        directory=settings.llm_job_dir
+    )
+    app.state.llm_jobs.start()
+    if settings.warmer_enabled:
+        app.state.warmer = CacheWarmer(
+            app.state.results,
+            app.state.results.history,
+            top_n=settings.warmer_top_n,
+            budget=settings.warmer_budget,
+            rate=settings.warmer_rate,
+            interval=settings.warmer_interval,
+            snapshot_path=settings.warmer_snapshot,
+            workers=settings.web_concurrency
+        )
+    STARTUP_SECONDS.labels("init").set(time.perf_counter() - started)
+
+    # Warm up in the background: the server accepts connections (and answers
+    # liveness probes) right away, while /ready reports 503 until this finishes
+    if settings.warmup_enabled:
+        warmup_task = asyncio.create_task(warmup(app))
+    else:
+        warmup_task = None
+        app.state.ready = True
+        READY.set(1)
+    # Refetch what was popular before this process started, then keep popular entries warm
+    warmer_task = asyncio.create_task(app.state.warmer.run()) if settings.warmer_enabled else None
+    lag_task = asyncio.create_task(monitor_event_loop_lag())
 
-# Load environment variables
-load_dotenv()
+    yield
 
-app = FastAPI(title="LLM with Google Maps Integration")
+    lag_task.cancel()
+
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if warmer_task is not None:
+        warmer_task.cancel()
+        # Keep what this process learned for the next one
+        try:
+            app.state.warmer.save_snapshot()
+        except OSError as e:
+            logger.warning("Could not save cache warming snapshot: %s", e)
+    app.state.llm_jobs.close()
+    app.state.maps_client.close()
+    app.state.llm_client.close()
+    app.state.offloader.close()
+    shutdown_logging()
+
+app = FastAPI(title="LLM with Google Maps Integration", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -30,27 +190,171 @@ templates = Jinja2Templates(directory="app/templates")
 
 # Rate limiter middleware
 rate_limiter = RateLimiter(
-    max_requests=int(os.getenv("MAX_REQUESTS_PER_MINUTE", 60)),
+    max_requests=settings.max_requests_per_minute,
     time_window=60
 )
+# Shared with /ws/chat, which checks it per chat message (WebSockets bypass HTTP middleware)
+app.state.rate_limiter = rate_limiter
+
+# Probes and scrapes should not count against (or be blocked by) client rate limits
+UNLIMITED_PATHS = {"/metrics", "/health", "/ready"}
 
 @app.middleware("http")
 async def rate_limiting_middleware(request: Request, call_next):
+    if request.url.path in UNLIMITED_PATHS:
+        return await call_next(request)
     client_ip = request.client.host
     if not rate_limiter.is_allowed(client_ip):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+        RATE_LIMIT_REJECTIONS.inc()
+        # HTTPException raised from middleware bypasses FastAPI's handlers, so respond directly
+        return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
     response = await call_next(request)
     return response
 
+# Sampling profiler; the middleware is only installed when profiling is configured,
+# so there is no per-request cost at all otherwise
+app.state.profiler = create_profiler(settings)
+
+if app.state.profiler is not None:
+    profile_sample_rate = settings.profile_sample_rate
+    profile_token = settings.admin_token
+
+    @app.middleware("http")
+    async def profiling_middleware(request: Request, call_next):
+        tagged = bool(profile_token) and secrets.compare_digest(request.headers.get("X-Profile", ""), profile_token)
+        if not tagged and random.random() >= profile_sample_rate:
+            return await call_next(request)
+        app.state.profiler.begin()
+        try:
+            return await call_next(request)
+        finally:
+            app.state.profiler.end()
+
+def _route_label(request: Request) -> str:
+    """Label requests by route template so metrics don't grow with every distinct path"""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "other")
+    return "other"
+
+# Registered after the rate limiter so it wraps it and also sees rejected requests
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    route = _route_label(request)
+    in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(route)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        in_flight.dec()
+        HTTP_REQUEST_SECONDS.labels(route, str(status)).observe(elapsed)
+        if not app.state.first_request_recorded and route.startswith("/api"):
+            app.state.first_request_recorded = True
+            FIRST_REQUEST_SECONDS.set(elapsed)
+            logger.info("First API request (%s) took %.3fs", route, elapsed)
+
+# Outermost middleware, so every log line for a request (including rejections) carries its ID
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        request_id_var.reset(token)
+
 # Include API routes
 app.include_router(api_router, prefix="/api")
+app.include_router(admin_router, prefix="/admin", include_in_schema=False)
+app.include_router(ws_router)
+
+# Liveness: the process is up and serving
+@app.get("/health", include_in_schema=False)
+async def health():
+    return {"status": "ok"}
+
+# Readiness: clients are built and warmup has finished
+@app.get("/ready", include_in_schema=False)
+async def ready(request: Request):
+    if not request.app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 # Root endpoint
 @app.get("/")
 async def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    maps_client = request.app.state.maps_client
+    response = templates.TemplateResponse("index.html", {
+        "request": request,
+        # The page draws results on one Maps JavaScript API map of its own; the key is in every map page already
+        "maps_api_key": maps_client.api_key if maps_client.available else ""
+    })
+    # Start the conversation session here so the chat WebSocket handshake carries the cookie
+    request.app.state.sessions.for_connection(request, response)
+    return response
+
+def run_server(argv=None):
+    """Start uvicorn in production mode, or in single-process reload mode with --dev"""
+    parser = argparse.ArgumentParser(description="Run the LLM with Google Maps Integration server")
+    parser.add_argument("--dev", action="store_true", help="Single process with auto-reload, for local development")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: WEB_CONCURRENCY or the number of CPUs)")
+    parser.add_argument("--host", default=settings.fastapi_host)
+    parser.add_argument("--port", type=int, default=settings.fastapi_port)
+    args = parser.parse_args(argv)
+
+    if args.dev:
+        # Read by the worker's settings, e.g. to split the cache warmer's budget
+        os.environ["WEB_CONCURRENCY"] = "1"
+        uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True)
+        return
+
+    # Fall back to the pure-Python implementations when the fast ones aren't installed
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    workers = args.workers or settings.web_concurrency
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # Workers answer each other's job polls through a directory; without one configured, use a fresh
+    # one only this server's user can read (job results are users' answers), removed on exit
+    job_dir = None
+    if workers > 1 and not settings.llm_job_dir:
+        job_dir = os.environ["LLM_JOB_DIR"] = tempfile.mkdtemp(prefix="llm-jobs-")
+    # Every worker must accept the search cursors the others sign
+    if not settings.search_cursor_secret:
+        os.environ["SEARCH_CURSOR_SECRET"] = secrets.token_urlsafe(32)
+    logger.info("Starting %d worker(s) on %s:%d (loop=%s, http=%s)", workers, args.host, args.port, loop, http)
+
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            loop=loop,
+            http=http,
+            # Longer than the usual 60s idle timeout of load balancers, so they close idle connections first
+            timeout_keep_alive=settings.keepalive_timeout,
+            backlog=settings.backlog,
+            # On SIGTERM stop accepting, then give in-flight requests this long to finish
+            timeout_graceful_shutdown=settings.graceful_shutdown_timeout,
+            # Recycle workers after this many requests (unset = never)
+            limit_max_requests=settings.limit_max_requests,
+        )
+    finally:
+        if job_dir:
+            shutil.rmtree(job_dir, ignore_errors=True)
 
 if __name__ == "__main__":
-    host = os.getenv("FASTAPI_HOST", "0.0.0.0")
-    port = int(os.getenv("FASTAPI_PORT", 8000))
-    uvicorn.run("app.main:app", host=host, port=port, reload=True)
\ No newline at end of file
+    run_server()
\ No newline at end of file
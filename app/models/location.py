@@ -17,11 +17,40 @@ class Place(BaseModel):
     opening_hours: Optional[Dict[str, Any]] = None
     website: Optional[str] = None
     international_phone_number: Optional[str] = None
+    # Distance from the user's location, set when results were ranked for one
+    distance_km: Optional[float] = None
+
+class UserLocation(BaseModel):
+    """Where the user is; results are re-ranked nearest-first when given"""
+    lat: float = Field(..., ge=-90, le=90)
+    lng: float = Field(..., ge=-180, le=180)
+    # Drop results farther than this
+    radius_km: Optional[float] = Field(None, gt=0)
 
 class LocationResponse(BaseModel):
     places: List[Place] = []
     status: str
     web_url: Optional[str] = None
+    # Pass back as `cursor` to get the next page of results; None on the last page
+    next_cursor: Optional[str] = None
+
+class PlaceDetails(BaseModel):
+    """Place Details result; only the fields the caller asked for are set"""
+    place_id: str
+    name: Optional[str] = None
+    formatted_address: Optional[str] = None
+    geometry: Optional[Geometry] = None
+    types: Optional[List[str]] = None
+    rating: Optional[float] = None
+    user_ratings_total: Optional[int] = None
+    photos: Optional[List[Dict[str, Any]]] = None
+    opening_hours: Optional[Dict[str, Any]] = None
+    website: Optional[str] = None
+    international_phone_number: Optional[str] = None
+
+class PlaceDetailsResponse(BaseModel):
+    place: Optional[PlaceDetails] = None
+    status: str
 
 class Step(BaseModel):
     distance: Dict[str, Any]
@@ -51,4 +80,19 @@ class Route(BaseModel):
 
 class DirectionsResponse(BaseModel):
     routes: List[Route] = []
+    status: str
+    # Set when an endpoint was passed to Google as an already-resolved place
+    origin_place_id: Optional[str] = None
+    destination_place_id: Optional[str] = None
+
+class OptimizedRouteResponse(BaseModel):
+    """A multi-stop route with the stops put in the order that takes least time"""
+    # Indexes into the request's `stops`, in visiting order
+    order: List[int]
+    # Estimated travel time in seconds, for the optimized order and for the order given
+    duration: Optional[float] = None
+    given_order_duration: Optional[float] = None
+    # Distance Matrix calls made; 0 when every travel time was cached
+    matrix_requests: int = 0
+    directions: DirectionsResponse
     status: str
\ No newline at end of file
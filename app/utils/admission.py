@@ -0,0 +1,108 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque
+from app.utils.metrics import (
+    LLM_ADMISSION_ACTIVE, LLM_ADMISSION_QUEUE_DEPTH, LLM_ADMISSION_WAIT_SECONDS, LLM_ADMISSION_REJECTIONS
+)
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted; callers should answer 503 with Retry-After"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request not admitted: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        """
+        Bound the number of concurrent expensive operations (LLM generations)
+
+        Args:
+            max_concurrent: Operations allowed to run at once
+            max_queue: Requests allowed to wait for a slot, across both lanes
+            queue_timeout: Seconds a request may wait before it is rejected
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        # Waiters are futures resolved by `_release` when a slot is handed to them
+        self._priority: Deque[asyncio.Future] = deque()
+        self._normal: Deque[asyncio.Future] = deque()
+        # Smoothed time a slot is held, used to estimate Retry-After
+        self._avg_hold = 1.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._priority) + len(self._normal)
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queued request would get a slot"""
+        backlog = self.waiting + 1
+        estimate = self._avg_hold * backlog / max(1, self.max_concurrent)
+        return max(1, min(60, math.ceil(estimate)))
+
+    @asynccontextmanager
+    async def slot(self, priority: bool = False):
+        """Hold one concurrency slot for the duration of the block
+
+        Cheap requests pass `priority=True` and are served before the normal
+        lane whenever a slot frees up.
+        """
+        await self._acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            self._release()
+
+    async def _acquire(self, priority: bool):
+        lane_name = "priority" if priority else "normal"
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            LLM_ADMISSION_ACTIVE.set(self.active)
+            LLM_ADMISSION_WAIT_SECONDS.labels(lane_name).observe(0.0)
+            return
+
+        if self.waiting >= self.max_queue:
+            LLM_ADMISSION_REJECTIONS.labels("queue_full").inc()
+            raise AdmissionRejected("queue_full", self.retry_after())
+
+        lane = self._priority if priority else self._normal
+        waiter = asyncio.get_running_loop().create_future()
+        lane.append(waiter)
+        LLM_ADMISSION_QUEUE_DEPTH.labels(lane_name).set(len(lane))
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                lane.remove(waiter)
+            LLM_ADMISSION_QUEUE_DEPTH.labels(lane_name).set(len(lane))
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            LLM_ADMISSION_REJECTIONS.labels("queue_timeout").inc()
+            raise AdmissionRejected("queue_timeout", self.retry_after())
+        LLM_ADMISSION_WAIT_SECONDS.labels(lane_name).observe(time.monotonic() - queued_at)
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, if any, so `active` never dips
+        for lane_name, lane in (("priority", self._priority), ("normal", self._normal)):
+            while lane:
+                waiter = lane.popleft()
+                LLM_ADMISSION_QUEUE_DEPTH.labels(lane_name).set(len(lane))
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+        LLM_ADMISSION_ACTIVE.set(self.active)
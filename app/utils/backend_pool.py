@@ -0,0 +1,153 @@
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+from app.utils.metrics import BACKEND_OUTSTANDING, BACKEND_HEALTHY, BACKEND_EJECTIONS
+
+STRATEGIES = ("least_outstanding", "latency")
+
+class Backend:
+    """One upstream node and the state used to route to it"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        # Smoothed latency of successful calls, in seconds
+        self.ewma_latency = 0.0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        # Set while a readmission probe is in flight, so only one request tests a recovering node
+        self.probing = False
+
+    def available(self, now: float) -> bool:
+        if self.ejected_until == 0.0:
+            return True
+        return now >= self.ejected_until and not self.probing
+
+class Lease:
+    """A backend picked for one call; the call reports failures through `mark_failed()`"""
+
+    def __init__(self, backend: Backend, probe: bool = False):
+        self.backend = backend
+        self.url = backend.url
+        self.failed = False
+        # The one call testing an ejected node; only its outcome readmits or re-ejects the node
+        self.probe = probe
+
+    def mark_failed(self):
+        self.failed = True
+
+class BackendPool:
+    def __init__(
+        self,
+        urls: List[str],
+        strategy: str = "least_outstanding",
+        sticky: bool = False,
+        failure_threshold: int = 3,
+        ejection_seconds: float = 10.0,
+        max_ejection_seconds: float = 300.0,
+        sticky_slack: int = 2,
+    ):
+        """
+        Route calls across several equivalent backends
+
+        Args:
+            urls: Base URLs of the backends
+            strategy: "least_outstanding" picks the node with the fewest calls in flight;
+                "latency" weighs that by each node's smoothed latency
+            sticky: Prefer the same node for the same key (rendezvous hashing), unless
+                it is more than `sticky_slack` calls busier than the least loaded node
+            failure_threshold: Consecutive failures before a node is ejected
+            ejection_seconds: First ejection length; doubles on each repeat, up to
+                `max_ejection_seconds`. After it, one probe call decides readmission
+        """
+        if not urls:
+            raise ValueError("At least one backend URL is required")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r}, expected one of {STRATEGIES}")
+        self.backends = [Backend(url) for url in urls]
+        self.strategy = strategy
+        self.sticky = sticky
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.max_ejection_seconds = max_ejection_seconds
+        self.sticky_slack = sticky_slack
+        self._lock = threading.Lock()
+        for backend in self.backends:
+            BACKEND_HEALTHY.labels(backend.url).set(1)
+
+    def _score(self, backend: Backend) -> float:
+        if self.strategy == "latency":
+            # Unmeasured nodes look fast so they get traffic and a latency estimate
+            return (backend.ewma_latency or 0.001) * (backend.outstanding + 1)
+        return backend.outstanding
+
+    def _choose(self, key: Optional[str]) -> Backend:
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b.available(now)]
+        if not candidates:
+            # Everything is ejected: fail open to the node that should recover first
+            return min(self.backends, key=lambda b: b.ejected_until)
+
+        if self.sticky and key is not None:
+            least = min(b.outstanding for b in candidates)
+            ranked = sorted(candidates, key=lambda b: hashlib.md5(f"{key}|{b.url}".encode()).digest(), reverse=True)
+            for backend in ranked:
+                if backend.outstanding <= least + self.sticky_slack:
+                    return backend
+
+        best = min(self._score(b) for b in candidates)
+        return random.choice([b for b in candidates if self._score(b) == best])
+
+    @contextmanager
+    def acquire(self, key: Optional[str] = None):
+        """Pick a backend for one call and record the outcome when the block exits"""
+        with self._lock:
+            backend = self._choose(key)
+            probe = bool(backend.ejected_until) and not backend.probing
+            if probe:
+                backend.probing = True
+            backend.outstanding += 1
+            BACKEND_OUTSTANDING.labels(backend.url).set(backend.outstanding)
+
+        lease = Lease(backend, probe)
+        started = time.monotonic()
+        try:
+            yield lease
+        except Exception:
+            lease.mark_failed()
+            raise
+        finally:
+            self._finish(lease, time.monotonic() - started)
+
+    def _finish(self, lease: Lease, elapsed: float):
+        backend = lease.backend
+        with self._lock:
+            backend.outstanding -= 1
+            if lease.probe:
+                backend.probing = False
+            BACKEND_OUTSTANDING.labels(backend.url).set(backend.outstanding)
+            if not lease.failed:
+                backend.ewma_latency = elapsed if not backend.ewma_latency else 0.8 * backend.ewma_latency + 0.2 * elapsed
+                backend.consecutive_failures = 0
+                if lease.probe:
+                    # Probe succeeded: readmit
+                    backend.ejected_until = 0.0
+                    backend.ejections = 0
+                    BACKEND_HEALTHY.labels(backend.url).set(1)
+                return
+
+            backend.consecutive_failures += 1
+            if backend.ejected_until and not lease.probe:
+                # A call that started before the ejection; the probe decides what happens next
+                return
+            if lease.probe or backend.consecutive_failures >= self.failure_threshold:
+                # A failed probe ejects again with a longer cooldown
+                backend.ejections += 1
+                cooldown = min(self.max_ejection_seconds, self.ejection_seconds * 2 ** (backend.ejections - 1))
+                backend.ejected_until = time.monotonic() + cooldown
+                BACKEND_HEALTHY.labels(backend.url).set(0)
+                BACKEND_EJECTIONS.labels(backend.url).inc()
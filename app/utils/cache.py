@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from app.utils.metrics import CACHE_ENTRY_BYTES, CACHE_REQUESTS, CACHE_REFRESHES
+
+logger = logging.getLogger(__name__)
+
+# Returned by `TTLCache.get` on a miss, so None can be cached like any other value
+MISSING = object()
+
+class TTLCache:
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        max_entries: int = 1024,
+        grace: float = 0.0,
+        pack: Optional[Callable[[Any], bytes]] = None,
+        unpack: Optional[Callable[[bytes], Any]] = None
+    ):
+        """
+        In-memory cache whose entries expire `ttl` seconds after they are stored
+
+        When full, the least recently used entry is evicted. `get_or_load`
+        additionally coalesces concurrent misses for the same key into a
+        single load, and serves entries up to `grace` seconds past their TTL
+        while one background task refreshes them (stale-while-revalidate).
+        With `pack` and `unpack`, values are stored as `pack(value)` and every
+        hit returns a fresh `unpack` of it, trading a decode per hit for far
+        less memory per entry.
+
+        Args:
+            name: Label for the cache_requests_total metric
+            ttl: Seconds an entry stays fresh
+            max_entries: Entries kept before the least recently used is evicted
+            grace: Seconds past the TTL during which `get_or_load` may still serve an entry
+            pack: Encodes a value for storage (None stores values as they are)
+            unpack: Decodes what `pack` returned
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.grace = grace
+        self.pack = pack
+        self.unpack = unpack
+        # key -> (fresh until, value); entries are dropped once `grace` past that
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Loads in progress; later callers for the same key await the same task
+        self._loading: Dict[Hashable, asyncio.Task] = {}
+        # Background refreshes of stale entries, at most one per key
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING if there is none or it has expired"""
+        value, fresh = self._lookup(key)
+        return self._decode(value) if fresh else MISSING
+
+    def is_fresh(self, key: Hashable) -> bool:
+        """Whether `get` would hit, without decoding the value"""
+        return self._lookup(key)[1]
+
+    def _decode(self, value: Any) -> Any:
+        # Outside the lock: a big entry takes a while to decode
+        if value is MISSING or self.unpack is None:
+            return value
+        return self.unpack(value)
+
+    def _lookup(self, key: Hashable) -> Tuple[Any, bool]:
+        """Return (value, is_fresh); value is MISSING if absent or past the grace window"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING, False
+            fresh_until, value = entry
+            now = time.monotonic()
+            if now >= fresh_until + self.grace:
+                del self._entries[key]
+                return MISSING, False
+            self._entries.move_to_end(key)
+            return value, now < fresh_until
+
+    def set(self, key: Hashable, value: Any):
+        if self.pack is not None:
+            try:
+                value = self.pack(value)
+            except Exception as e:
+                # Not storing it only costs a reload; raising would fail the request that loaded it
+                logger.warning("Could not encode %s cache entry: %s", self.name, e)
+                return
+            CACHE_ENTRY_BYTES.labels(self.name).observe(len(value))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from the least recently used end, stopping at the first live one
+
+        Cheap enough to call on every request. Exact when every read re-stores
+        its entry (as sessions do), since the order is then the expiry order;
+        otherwise an expired entry read more recently than a live one stays
+        until it is looked up or evicted.
+        """
+        removed = 0
+        with self._lock:
+            now = time.monotonic()
+            while self._entries:
+                key, (fresh_until, _) = next(iter(self._entries.items()))
+                if now < fresh_until + self.grace:
+                    break
+                del self._entries[key]
+                removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def peek(
+        self,
+        key: Hashable,
+        loader: Optional[Callable[[], Awaitable[Any]]] = None,
+        cacheable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """Return the value for `key` if it is fresh or within `grace`, else MISSING
+
+        Never loads on a miss. A stale value is refreshed in the background
+        with `loader`, when one is given. Must be called from the event loop.
+        """
+        value, fresh = self._lookup(key)
+        if value is MISSING:
+            return MISSING
+        if fresh:
+            CACHE_REQUESTS.labels(self.name, "hit").inc()
+        else:
+            # Inside the grace window: answer now, refresh in the background
+            CACHE_REQUESTS.labels(self.name, "stale").inc()
+            if loader is not None:
+                self._refresh(key, loader, cacheable)
+        return self._decode(value)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """Return the cached value for `key`, loading it on a miss
+
+        Only one load per key runs at a time: callers that miss while a load is
+        in flight wait for its result instead of starting their own. Results
+        for which `cacheable(value)` is false are returned but not stored.
+        A stale entry (within `grace`) is returned as is and refreshed in the
+        background; if that refresh fails, the stale entry stays. A caller
+        that is cancelled only stops waiting; the load goes on for the others.
+        """
+        value = self.peek(key, loader, cacheable)
+        if value is not MISSING:
+            return value
+
+        load = self._loading.get(key)
+        if load is not None:
+            CACHE_REQUESTS.labels(self.name, "coalesced").inc()
+        else:
+            CACHE_REQUESTS.labels(self.name, "miss").inc()
+            load = asyncio.get_running_loop().create_task(self._load(key, loader, cacheable))
+            load.add_done_callback(_retrieve_exception)
+            self._loading[key] = load
+        # The load runs in its own task: a caller that is cancelled only stops waiting,
+        # and the load carries on for the others (and fills the cache) regardless
+        return await asyncio.shield(load)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], cacheable: Optional[Callable[[Any], bool]]) -> Any:
+        try:
+            value = await loader()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            del self._loading[key]
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]], cacheable: Optional[Callable[[Any], bool]]):
+        if key in self._refreshing or key in self._loading:
+            return
+        self._refreshing[key] = asyncio.get_running_loop().create_task(self._run_refresh(key, loader, cacheable))
+
+    async def _run_refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]], cacheable: Optional[Callable[[Any], bool]]):
+        try:
+            value = await loader()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+                CACHE_REFRESHES.labels(self.name, "ok").inc()
+            else:
+                # An error or fallback result: keep serving the stale value until grace runs out
+                CACHE_REFRESHES.labels(self.name, "kept_stale").inc()
+        except Exception as e:
+            logger.warning("Background refresh of %s cache entry failed: %s", self.name, e)
+            CACHE_REFRESHES.labels(self.name, "kept_stale").inc()
+        finally:
+            del self._refreshing[key]
+
+def _retrieve_exception(task: asyncio.Task):
+    # Every waiter may have been cancelled; don't let asyncio log the failure as never retrieved
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,289 @@
+import struct
+import sys
+from array import array
+from typing import Any, Dict, FrozenSet, List, Tuple, Type
+from pydantic import BaseModel
+from app.models.location import (
+    DirectionsResponse, Geometry, Leg, LocationResponse, Place, PlaceDetails, PlaceDetailsResponse, Route, Step
+)
+
+# Cached Maps results are stored as one bytes object each instead of a tree of Pydantic models, dicts and
+# floats, and rebuilt (without validation) only when an entry is hit. Layout (little-endian):
+#   header      format version, string count, coordinate count, bytes in the string blob
+#   lengths     uint32 length of each string, in characters
+#   strings     every distinct string of the entry once, UTF-8, concatenated
+#   coords      float64 lat, lng of every Geometry, packed
+#   body        the value, tagged (see _Writer.value)
+# Entries only ever live in this process's memory, so the format may change between releases.
+_VERSION = 1
+_HEADER = struct.Struct("<BIII")
+_DOUBLE = struct.Struct("<d")
+# A step in the shape the Directions API returns: distance and duration values, then string indexes of the
+# distance text, duration text, instructions, polyline points and travel mode, then start and end coordinates
+_STEP = struct.Struct("<iiIIIIIII")
+
+_NONE, _FALSE, _TRUE, _INT, _BIGINT, _FLOAT, _STR, _LIST, _DICT, _MODEL, _GEOMETRY, _STEP_RECORD = range(12)
+
+# Models an entry may contain, by class id
+_MODELS: Tuple[Type[BaseModel], ...] = (
+    Geometry, Place, LocationResponse, PlaceDetails, PlaceDetailsResponse, Step, Leg, Route, DirectionsResponse
+)
+_MODEL_IDS = {cls: i for i, cls in enumerate(_MODELS)}
+_FIELDS = {cls: tuple(cls.model_fields) for cls in _MODELS}
+_GEOMETRY_FIELDS = frozenset(("lat", "lng"))
+_STEP_FIELDS = frozenset(_FIELDS[Step])
+_INT32 = 2 ** 31
+
+_new = object.__new__
+_setattr = object.__setattr__
+
+def _plain(cls: Type[BaseModel]) -> bool:
+    # Nothing for model_construct to do beyond what _build does: every field is always given
+    return not (
+        cls.__pydantic_post_init__ or cls.__private_attributes__ or cls.__pydantic_root_model__
+        or cls.model_config.get("extra") == "allow"
+    )
+
+_PLAIN = {cls: _plain(cls) for cls in _MODELS}
+
+def _build(cls: Type[BaseModel], fields_set: set, values: Dict[str, Any]) -> BaseModel:
+    """model_construct(fields_set, **values) for a complete `values`, minus its per-field bookkeeping"""
+    if not _PLAIN[cls]:
+        return cls.model_construct(fields_set, **values)
+    model = _new(cls)
+    _setattr(model, "__dict__", values)
+    _setattr(model, "__pydantic_fields_set__", fields_set)
+    _setattr(model, "__pydantic_extra__", None)
+    _setattr(model, "__pydantic_private__", None)
+    return model
+
+class _Writer:
+    __slots__ = ("out", "strings", "string_ids", "coords")
+
+    def __init__(self):
+        self.out = bytearray()
+        self.strings: List[str] = []
+        # Each distinct string is stored once; repeats ("DRIVING", "text", "value") cost an index
+        self.string_ids: Dict[str, int] = {}
+        self.coords = array("d")
+
+    def string(self, text: str) -> int:
+        index = self.string_ids.get(text)
+        if index is None:
+            index = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def coord(self, geometry: Geometry) -> int:
+        self.coords.append(geometry.lat)
+        self.coords.append(geometry.lng)
+        return len(self.coords) // 2 - 1
+
+    def varint(self, number: int):
+        out = self.out
+        while number > 0x7F:
+            out.append((number & 0x7F) | 0x80)
+            number >>= 7
+        out.append(number)
+
+    def value(self, value: Any):
+        out = self.out
+        kind = type(value)
+        if value is None:
+            out.append(_NONE)
+        elif kind is bool:
+            out.append(_TRUE if value else _FALSE)
+        elif kind is int:
+            if -2 ** 63 <= value < 2 ** 63:
+                out.append(_INT)
+                # Zigzag, so small negative numbers stay short too
+                self.varint((value << 1) ^ (value >> 63))
+            else:
+                out.append(_BIGINT)
+                self.varint(self.string(str(value)))
+        elif kind is float:
+            out.append(_FLOAT)
+            out += _DOUBLE.pack(value)
+        elif kind is str:
+            out.append(_STR)
+            self.varint(self.string(value))
+        elif kind is list:
+            out.append(_LIST)
+            self.varint(len(value))
+            for item in value:
+                self.value(item)
+        elif kind is dict:
+            out.append(_DICT)
+            self.varint(len(value))
+            for key, item in value.items():
+                if type(key) is not str:
+                    raise TypeError(f"Can't pack a dict with {type(key).__name__} keys")
+                self.varint(self.string(key))
+                self.value(item)
+        elif kind is Geometry and value.model_fields_set == _GEOMETRY_FIELDS:
+            out.append(_GEOMETRY)
+            self.varint(self.coord(value))
+        elif kind is Step and self.step(value):
+            pass
+        elif kind in _MODEL_IDS:
+            fields = _FIELDS[kind]
+            out.append(_MODEL)
+            out.append(_MODEL_IDS[kind])
+            self.varint(sum(1 << i for i, name in enumerate(fields) if name in value.model_fields_set))
+            for name in fields:
+                self.value(getattr(value, name))
+        else:
+            raise TypeError(f"Can't pack a {kind.__name__}")
+
+    def step(self, step: Step) -> bool:
+        """Write `step` as one fixed-size record if it has the usual shape; False to fall back to the generic form"""
+        distance, duration, polyline = step.distance, step.duration, step.polyline
+        if not (
+            step.model_fields_set == _STEP_FIELDS
+            and _is_text_value(distance) and _is_text_value(duration)
+            and len(polyline) == 1 and type(polyline.get("points")) is str
+            and step.start_location.model_fields_set == _GEOMETRY_FIELDS
+            and step.end_location.model_fields_set == _GEOMETRY_FIELDS
+        ):
+            return False
+        self.out.append(_STEP_RECORD)
+        self.out += _STEP.pack(
+            distance["value"], duration["value"],
+            self.string(distance["text"]), self.string(duration["text"]), self.string(step.html_instructions),
+            self.string(polyline["points"]), self.string(step.travel_mode),
+            self.coord(step.start_location), self.coord(step.end_location)
+        )
+        return True
+
+    def finish(self) -> bytes:
+        text = "".join(self.strings).encode("utf-8", "surrogatepass")
+        lengths = array("I", (len(s) for s in self.strings))
+        coords = self.coords
+        if sys.byteorder != "little":
+            lengths.byteswap()
+            coords.byteswap()
+        return b"".join((
+            _HEADER.pack(_VERSION, len(self.strings), len(coords) // 2, len(text)),
+            lengths.tobytes(),
+            text,
+            coords.tobytes(),
+            bytes(self.out)
+        ))
+
+def _is_text_value(field: Dict[str, Any]) -> bool:
+    # {"text": "1.2 km", "value": 1234}, keys in that order so the rebuilt dict serializes the same
+    if len(field) != 2 or list(field) != ["text", "value"]:
+        return False
+    value = field["value"]
+    return type(field["text"]) is str and type(value) is int and -_INT32 <= value < _INT32
+
+class _Reader:
+    __slots__ = ("data", "pos", "strings", "coords", "fields_sets")
+
+    def __init__(self, data: bytes):
+        version, n_strings, n_coords, n_bytes = _HEADER.unpack_from(data, 0)
+        if version != _VERSION:
+            raise ValueError(f"Unknown packed entry version {version}")
+        pos = _HEADER.size
+        lengths = array("I")
+        lengths.frombytes(data[pos:pos + 4 * n_strings])
+        pos += 4 * n_strings
+        # One decode for the whole blob; the lengths are in characters, so it is sliced after decoding
+        text = data[pos:pos + n_bytes].decode("utf-8", "surrogatepass")
+        pos += n_bytes
+        coords = array("d")
+        coords.frombytes(data[pos:pos + 16 * n_coords])
+        if sys.byteorder != "little":
+            lengths.byteswap()
+            coords.byteswap()
+        strings, start = [], 0
+        for length in lengths:
+            strings.append(text[start:start + length])
+            start += length
+        self.data = data
+        self.pos = pos + 16 * n_coords
+        self.strings = strings
+        self.coords = coords
+        # (model, field bitmask) -> field names, shared by the many models of an entry with the same fields set
+        self.fields_sets: Dict[Tuple[Type[BaseModel], int], FrozenSet[str]] = {}
+
+    def varint(self) -> int:
+        data, pos = self.data, self.pos
+        number, shift = 0, 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            number |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                self.pos = pos
+                return number
+            shift += 7
+
+    def geometry(self, index: int) -> Geometry:
+        coords = self.coords
+        return _build(Geometry, set(_GEOMETRY_FIELDS), {"lat": coords[2 * index], "lng": coords[2 * index + 1]})
+
+    def value(self) -> Any:
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == _STR:
+            return self.strings[self.varint()]
+        if tag == _NONE:
+            return None
+        if tag == _INT:
+            number = self.varint()
+            return (number >> 1) ^ -(number & 1)
+        if tag == _FLOAT:
+            number = _DOUBLE.unpack_from(self.data, self.pos)[0]
+            self.pos += 8
+            return number
+        if tag == _DICT:
+            return {self.strings[self.varint()]: self.value() for _ in range(self.varint())}
+        if tag == _LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == _GEOMETRY:
+            return self.geometry(self.varint())
+        if tag == _STEP_RECORD:
+            return self.step()
+        if tag == _MODEL:
+            cls = _MODELS[self.data[self.pos]]
+            self.pos += 1
+            mask = self.varint()
+            fields = _FIELDS[cls]
+            fields_set = self.fields_sets.get((cls, mask))
+            if fields_set is None:
+                fields_set = self.fields_sets[(cls, mask)] = frozenset(
+                    name for i, name in enumerate(fields) if mask >> i & 1
+                )
+            return _build(cls, set(fields_set), {name: self.value() for name in fields})
+        if tag in (_TRUE, _FALSE):
+            return tag == _TRUE
+        if tag == _BIGINT:
+            return int(self.strings[self.varint()])
+        raise ValueError(f"Unknown tag {tag} in packed entry")
+
+    def step(self) -> Step:
+        distance, duration, distance_text, duration_text, instructions, points, mode, start, end = (
+            _STEP.unpack_from(self.data, self.pos)
+        )
+        self.pos += _STEP.size
+        strings = self.strings
+        return _build(Step, set(_STEP_FIELDS), {
+            "distance": {"text": strings[distance_text], "value": distance},
+            "duration": {"text": strings[duration_text], "value": duration},
+            "html_instructions": strings[instructions],
+            "polyline": {"points": strings[points]},
+            "start_location": self.geometry(start),
+            "end_location": self.geometry(end),
+            "travel_mode": strings[mode]
+        })
+
+def pack(model: BaseModel) -> bytes:
+    """`model` (a Maps response) as a compact bytes object; `unpack` rebuilds an equal model"""
+    writer = _Writer()
+    writer.value(model)
+    return writer.finish()
+
+def unpack(data: bytes) -> Any:
+    """The model `pack` was given, rebuilt without validation"""
+    return _Reader(data).value()
@@ -0,0 +1,420 @@
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import Counter
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from app.utils.resolution import normalize_place_text
+
+# Places from the gazetteer that have no Google place_id get an id with this prefix
+GAZETTEER_ID_PREFIX = "gazetteer:"
+
+# File layout (little-endian, every section 8-byte aligned):
+#   header      magic, version, counts, then the offset of each section and of the end
+#   records     one fixed-size _RECORD per place
+#   keys        one _KEY per searchable name, sorted by name then by population (descending)
+#   key_text    UTF-8 normalized names the keys point into
+#   trigrams    one _TRIGRAM per distinct trigram hash, sorted by hash
+#   postings    uint32 key indexes, grouped by trigram
+#   text        UTF-8 display strings the records point into
+_MAGIC = b"GAZ1"
+_VERSION = 2
+_HEADER = struct.Struct("<4sIIII7Q")
+# lat, lng, population, then (offset, length) of name, address, place_id and types
+_RECORD = struct.Struct("<ddIIIIIHHHH")
+# key_text offset, record index, length, distinct trigrams (0 when not trigram-indexed)
+_KEY = struct.Struct("<IIHB")
+# trigram hash, first posting, posting count
+_TRIGRAM = struct.Struct("<III")
+
+# Trigrams shared by more names than this say little about a match and are skipped
+MAX_POSTINGS = 5000
+
+# Inhabitants a place needs for its matches to count fully; smaller (or unknown, 0) places are scaled down
+DEFAULT_MIN_POPULATION = 100000
+
+class GazetteerEntry(NamedTuple):
+    name: str
+    lat: float
+    lng: float
+    population: int = 0
+    address: str = ""
+    place_id: str = ""
+    types: Tuple[str, ...] = ()
+
+def trigram_hashes(key: str) -> List[int]:
+    """Distinct trigram hashes of a normalized name, padded so word starts weigh more"""
+    padded = f"  {key} "
+    return sorted({zlib.crc32(padded[i:i + 3].encode("utf-8")) for i in range(len(padded) - 2)})
+
+def _align(buffer: bytearray):
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+# --- Building ---------------------------------------------------------------
+
+def read_table(path: str) -> Iterator[Tuple[GazetteerEntry, List[str]]]:
+    """Rows of a CSV/TSV with a header: name, lat, lng and optionally place_id, address, types, population, aliases
+
+    `types` and `aliases` are "|"-separated. Files ending in .csv are comma-separated, others tab-separated.
+    """
+    delimiter = "," if path.endswith(".csv") else "\t"
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            entry = GazetteerEntry(
+                name=row["name"],
+                lat=float(row["lat"]),
+                lng=float(row["lng"]),
+                population=int(row.get("population") or 0),
+                address=row.get("address") or "",
+                place_id=row.get("place_id") or "",
+                types=tuple(t for t in (row.get("types") or "").split("|") if t)
+            )
+            yield entry, [a for a in (row.get("aliases") or "").split("|") if a]
+
+def read_geonames(path: str, alternates_min_population: int = 100000) -> Iterator[Tuple[GazetteerEntry, List[str]]]:
+    """Rows of a GeoNames dump (allCountries.txt, cities500.txt, ...)
+
+    Alternate names are indexed only for places with at least
+    `alternates_min_population` inhabitants; for the millions of small places
+    they would mostly add size.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15:
+                continue
+            population = int(cols[14] or 0)
+            country = cols[8]
+            aliases = [cols[2]]
+            if population >= alternates_min_population and cols[3]:
+                aliases.extend(cols[3].split(","))
+            entry = GazetteerEntry(
+                name=cols[1],
+                lat=float(cols[4]),
+                lng=float(cols[5]),
+                population=min(population, 0xFFFFFFFF),
+                address=f"{cols[1]}, {country}" if country else cols[1],
+                place_id=f"{GAZETTEER_ID_PREFIX}{cols[0]}",
+                types=("locality",) if cols[6] == "P" else ("point_of_interest",)
+            )
+            yield entry, aliases
+
+def build(rows: Iterator[Tuple[GazetteerEntry, List[str]]], out_path: str, fuzzy_top: int = 500000) -> Dict[str, int]:
+    """Write a gazetteer file from (entry, aliases) rows
+
+    Every name and alias is searchable exactly and by prefix; the names of the
+    `fuzzy_top` most populous places are also trigram-indexed for typo-tolerant
+    matching.
+    """
+    text = bytearray()
+    interned: Dict[str, Tuple[int, int]] = {}
+
+    def put(value: str, intern: bool = False) -> Tuple[int, int]:
+        if intern and value in interned:
+            return interned[value]
+        data = value.encode("utf-8")[:0xFFFF]
+        span = (len(text), len(data))
+        text.extend(data)
+        if intern:
+            interned[value] = span
+        return span
+
+    records = bytearray()
+    populations: List[int] = []
+    # (normalized name, -population, record) per searchable name
+    keys: List[Tuple[bytes, int, int]] = []
+    for entry, aliases in rows:
+        index = len(populations)
+        name, address, place_id = put(entry.name), put(entry.address), put(entry.place_id)
+        types = put("|".join(entry.types), intern=True)
+        records.extend(_RECORD.pack(
+            entry.lat, entry.lng, entry.population,
+            name[0], address[0], place_id[0], types[0], name[1], address[1], place_id[1], types[1]
+        ))
+        populations.append(entry.population)
+        seen = set()
+        for alias in (entry.name, *aliases):
+            key = normalize_place_text(alias)
+            if key and key not in seen:
+                seen.add(key)
+                keys.append((key.encode("utf-8")[:0xFFFF], -entry.population, index))
+    keys.sort()
+
+    # Trigram postings for the most populous places only: (hash << 32 | key index), sorted
+    if fuzzy_top < len(populations):
+        cutoff = sorted(populations, reverse=True)[fuzzy_top - 1] if fuzzy_top > 0 else float("inf")
+    else:
+        cutoff = -1
+    key_text = bytearray()
+    key_offsets: Dict[bytes, int] = {}
+    key_table = bytearray()
+    pairs = []
+    for key_index, (key, negative_population, record) in enumerate(keys):
+        offset = key_offsets.get(key)
+        if offset is None:
+            offset = key_offsets[key] = len(key_text)
+            key_text.extend(key)
+        trigram_count = 0
+        if -negative_population >= cutoff:
+            hashes = trigram_hashes(key.decode("utf-8"))
+            trigram_count = min(len(hashes), 0xFF)
+            pairs.extend(h << 32 | key_index for h in hashes)
+        key_table.extend(_KEY.pack(offset, record, len(key), trigram_count))
+    del key_offsets
+    pairs.sort()
+    trigram_table = bytearray()
+    posting_list = array("I", (pair & 0xFFFFFFFF for pair in pairs))
+    start = 0
+    while start < len(pairs):
+        h = pairs[start] >> 32
+        end = start + 1
+        while end < len(pairs) and pairs[end] >> 32 == h:
+            end += 1
+        trigram_table.extend(_TRIGRAM.pack(h, start, end - start))
+        start = end
+    trigram_count = len(trigram_table) // _TRIGRAM.size
+    postings = bytearray(posting_list.tobytes())
+    del pairs, posting_list
+
+    sections = [records, key_table, key_text, trigram_table, postings, text]
+    offsets = []
+    position = _HEADER.size + (-_HEADER.size % 8)
+    for section in sections:
+        _align(section)
+        offsets.append(position)
+        position += len(section)
+    offsets.append(position)
+
+    temp_path = f"{out_path}.tmp"
+    with open(temp_path, "wb") as f:
+        header = bytearray(_HEADER.pack(_MAGIC, _VERSION, len(populations), len(keys), trigram_count, *offsets))
+        _align(header)
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    os.replace(temp_path, out_path)
+    return {"records": len(populations), "keys": len(keys), "trigrams": trigram_count, "bytes": position}
+
+# --- Lookups ----------------------------------------------------------------
+
+class Gazetteer:
+    def __init__(self, path: str, min_population: int = DEFAULT_MIN_POPULATION):
+        """
+        Read-only, memory-mapped view of a file written by `build`
+
+        Opening only maps the file; pages are read in as lookups touch them, so
+        loading is instant and resident memory grows with use, not file size.
+        Exact and prefix lookups binary-search the sorted names; fuzzy lookups
+        count shared trigrams. `lookup` is fully confident only in places with
+        at least `min_population` inhabitants.
+        """
+        self.path = path
+        self.min_population = min_population
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._mmap, "madvise") and hasattr(mmap, "MADV_RANDOM"):
+            # Lookups hop around the file; readahead would pull in pages nobody asked for
+            self._mmap.madvise(mmap.MADV_RANDOM)
+        self._view = view = memoryview(self._mmap)
+        magic, version, self.record_count, self.key_count, self.trigram_count, *offsets = _HEADER.unpack_from(view)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a version {_VERSION} gazetteer file")
+        records, keys, key_text, trigrams, postings, text, end = offsets
+        self._records = view[records:keys]
+        self._keys = view[keys:key_text]
+        self._key_text = view[key_text:trigrams]
+        self._trigrams = view[trigrams:postings]
+        self._postings = view[postings:text].cast("I")
+        self._text = view[text:end]
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def close(self):
+        # Every view onto the map must be released before it can be closed
+        for view in (self._records, self._keys, self._key_text, self._trigrams, self._postings, self._text, self._view):
+            view.release()
+        self._mmap.close()
+
+    def entry(self, index: int) -> GazetteerEntry:
+        (lat, lng, population, name, address, place_id, types,
+         name_len, address_len, place_id_len, types_len) = _RECORD.unpack_from(self._records, index * _RECORD.size)
+        types_text = self._string(types, types_len)
+        return GazetteerEntry(
+            name=self._string(name, name_len),
+            lat=lat,
+            lng=lng,
+            population=population,
+            address=self._string(address, address_len),
+            place_id=self._string(place_id, place_id_len) or f"{GAZETTEER_ID_PREFIX}{index}",
+            types=tuple(types_text.split("|")) if types_text else ()
+        )
+
+    def _string(self, offset: int, length: int) -> str:
+        return str(self._text[offset:offset + length], "utf-8")
+
+    def _key(self, index: int) -> Tuple[bytes, int]:
+        offset, record, length, _ = _KEY.unpack_from(self._keys, index * _KEY.size)
+        return bytes(self._key_text[offset:offset + length]), record
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def exact(self, text: str) -> List[GazetteerEntry]:
+        """Every place named `text` (or with it as an alias), most populous first"""
+        key = normalize_place_text(text).encode("utf-8")
+        matches = []
+        index = self._lower_bound(key)
+        while index < self.key_count:
+            candidate, record = self._key(index)
+            if candidate != key:
+                break
+            matches.append(self.entry(record))
+            index += 1
+        return matches
+
+    def prefix(self, text: str, limit: int = 10) -> List[GazetteerEntry]:
+        """Places whose name starts with `text`, in name order, for autocompletion"""
+        key = normalize_place_text(text).encode("utf-8")
+        if not key:
+            return []
+        matches = []
+        seen = set()
+        index = self._lower_bound(key)
+        while index < self.key_count and len(matches) < limit:
+            candidate, record = self._key(index)
+            if not candidate.startswith(key):
+                break
+            if record not in seen:
+                seen.add(record)
+                matches.append(self.entry(record))
+            index += 1
+        return matches
+
+    def _posting_list(self, trigram: int) -> memoryview:
+        low, high = 0, self.trigram_count
+        while low < high:
+            middle = (low + high) // 2
+            h, start, count = _TRIGRAM.unpack_from(self._trigrams, middle * _TRIGRAM.size)
+            if h < trigram:
+                low = middle + 1
+            elif h > trigram:
+                high = middle
+            elif count > MAX_POSTINGS:
+                break
+            else:
+                return self._postings[start:start + count]
+        return self._postings[0:0]
+
+    def fuzzy(self, text: str, limit: int = 5, min_similarity: float = 0.5) -> List[Tuple[float, GazetteerEntry]]:
+        """Trigram-indexed places with names similar to `text`, as (Jaccard similarity, entry), best first"""
+        key = normalize_place_text(text)
+        wanted = trigram_hashes(key)
+        if not wanted:
+            return []
+        shared: Counter = Counter()
+        for trigram in wanted:
+            shared.update(self._posting_list(trigram))
+        # A candidate needs enough shared trigrams to possibly reach min_similarity
+        needed = min_similarity * len(wanted)
+        scored = []
+        for key_index, common in shared.items():
+            if common < needed:
+                continue
+            _, record, _, total = _KEY.unpack_from(self._keys, key_index * _KEY.size)
+            similarity = common / (len(wanted) + total - common)
+            if similarity >= min_similarity:
+                scored.append((similarity, record))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        best = []
+        seen = set()
+        for similarity, record in scored:
+            if record not in seen:
+                seen.add(record)
+                best.append((similarity, self.entry(record)))
+                if len(best) == limit:
+                    break
+        return best
+
+    def lookup(self, text: str) -> Optional[Tuple[GazetteerEntry, float]]:
+        """Best match for a free-text place and how confident it is (0..1)
+
+        An exact name match is as confident as the place dominates others of
+        the same name by population ("paris" is Paris, France; "springfield" is
+        anyone's guess). "Name, Region" is matched by name, keeping places whose
+        address mentions the region. Otherwise the closest fuzzy match counts
+        with its similarity. Either way, confidence is scaled down for places
+        with fewer than `min_population` inhabitants: a lone match for a
+        generic name ("pizza", "hospital") is usually some tiny place whose
+        population isn't even known, not what the user meant.
+        """
+        matches = self.exact(text)
+        if not matches and "," in text:
+            name, region = text.split(",", 1)
+            region = normalize_place_text(region)
+            matches = [m for m in self.exact(name) if region in normalize_place_text(m.address)]
+        if matches:
+            total = sum(m.population for m in matches)
+            confidence = matches[0].population / total if total else 1.0 / len(matches)
+            return matches[0], confidence * self._renown(matches[0])
+        fuzzy = self.fuzzy(text, limit=1)
+        if fuzzy:
+            similarity, entry = fuzzy[0]
+            return entry, similarity * self._renown(entry)
+        return None
+
+    def _renown(self, entry: GazetteerEntry) -> float:
+        if self.min_population <= 0:
+            return 1.0
+        return min(1.0, entry.population / self.min_population)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build or query a gazetteer file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Convert a CSV/TSV or GeoNames dump")
+    build_parser.add_argument("source", help="CSV/TSV with a header (name, lat, lng, ...) or a GeoNames dump")
+    build_parser.add_argument("output")
+    build_parser.add_argument("--geonames", action="store_true", help="Source is in GeoNames format")
+    build_parser.add_argument("--fuzzy-top", type=int, default=500000, help="Most populous places indexed for typo-tolerant matching")
+    build_parser.add_argument("--alternates-min-population", type=int, default=100000,
+                              help="GeoNames only: index alternate names of places at least this populous")
+    lookup_parser = commands.add_parser("lookup", help="Look up names in a built file")
+    lookup_parser.add_argument("path")
+    lookup_parser.add_argument("names", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        if args.geonames:
+            rows = read_geonames(args.source, args.alternates_min_population)
+        else:
+            rows = read_table(args.source)
+        stats = build(rows, args.output, fuzzy_top=args.fuzzy_top)
+        print(f"Wrote {args.output}: {stats['records']} places, {stats['keys']} names, "
+              f"{stats['trigrams']} trigrams, {stats['bytes'] / 1e6:.1f} MB in {time.perf_counter() - started:.1f}s")
+        return 0
+
+    gazetteer = Gazetteer(args.path)
+    for name in args.names:
+        match = gazetteer.lookup(name)
+        if match is None:
+            print(f"{name!r}: no match")
+        else:
+            entry, confidence = match
+            print(f"{name!r}: {entry.name} ({entry.lat:.5f}, {entry.lng:.5f}) {entry.address!r} confidence {confidence:.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import secrets
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.utils.admission import AdmissionRejected
+from app.utils.cache import TTLCache, MISSING
+from app.utils.metrics import LLM_JOBS, LLM_JOBS_QUEUED, LLM_JOB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_JOB_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+# How often a worker that doesn't own a job re-reads its file while long-polling
+_POLL_INTERVAL = 0.25
+
+class Job:
+    """One submitted job; `result` or `error` is set once it is done"""
+
+    __slots__ = ("id", "key", "run", "status", "result", "error", "created_at", "finished_at", "_done")
+
+    def __init__(self, job_id: str, key: Optional[Hashable], run: Callable[[], Awaitable[Any]]):
+        self.id = job_id
+        self.key = key
+        self.run: Optional[Callable[[], Awaitable[Any]]] = run
+        # queued, running, done or failed
+        self.status = "queued"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the job to finish; returns whether it has"""
+        if timeout > 0 and not self.done:
+            try:
+                await asyncio.wait_for(self._done.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.done
+
+class JobQueue:
+    def __init__(
+        self,
+        encode: Callable[[Job], bytes],
+        workers: int = 4,
+        max_queued: int = 100,
+        ttl: float = 600.0,
+        max_stored: int = 1000,
+        timeout: float = 300.0,
+        directory: Optional[str] = None
+    ):
+        """
+        Run submitted coroutines on a fixed number of worker tasks and keep their results for a while
+
+        `submit` returns right away with a Job that clients poll. At most
+        `max_queued` jobs wait for a worker; past that `submit` raises
+        AdmissionRejected, like a full admission queue. Submitting under the
+        key of a job that is still queued or running returns that job instead
+        of starting another. Finished jobs are kept for `ttl` seconds, at most
+        `max_stored` of them; a job still running after `timeout` seconds is
+        cancelled and fails.
+
+        Each server worker process has its own queue. With `directory`, every
+        job's state is also written there as `encode(job)`, so whichever
+        process a poll lands on can answer it.
+
+        Args:
+            encode: Serializes a job for its state file (the poll response body)
+            workers: Jobs running at once
+            max_queued: Jobs allowed to wait for a worker
+            ttl: Seconds a finished job stays available
+            max_stored: Finished jobs kept in memory before the least recently read is dropped
+            timeout: Seconds a job may run
+            directory: Where job states are shared between processes (None keeps them in memory only)
+        """
+        self.encode = encode
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.timeout = timeout
+        self.directory = directory
+        self._finished = TTLCache("llm_jobs", ttl=ttl, max_entries=max_stored)
+        # Queued and running jobs, by id and by dedupe key
+        self._active: Dict[str, Job] = {}
+        self._by_key: Dict[Hashable, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Last state write of each job still in flight; the next one waits for it, so the newest state lands last
+        self._writes: Dict[str, asyncio.Task] = {}
+        self._closing = False
+        # Smoothed run time of a job, used to estimate Retry-After
+        self._avg_run = 5.0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        if self.directory:
+            # Job results are users' answers: keep the directory and its files to this user
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            self._tasks.append(asyncio.create_task(self._sweep()))
+
+    def close(self):
+        """Stop the workers; unfinished jobs fail, so other processes stop reporting them as running"""
+        self._closing = True
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for job in list(self._active.values()):
+            job.status, job.error = "failed", "The server shut down before the job finished"
+            job.finished_at = time.time()
+            job.run = None
+            job._done.set()
+            if self.directory:
+                try:
+                    self._write(job.id, self.encode(job), True)
+                except Exception as e:
+                    logger.warning("Could not store LLM job %s: %s", job.id, e)
+        self._active.clear()
+        self._by_key.clear()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def retry_after(self) -> int:
+        """Rough seconds until a newly queued job would start"""
+        estimate = self._avg_run * (self.queued + 1) / max(1, self.workers)
+        return max(1, min(60, math.ceil(estimate)))
+
+    def submit(self, run: Callable[[], Awaitable[Any]], key: Optional[Hashable] = None) -> Job:
+        """Queue `run()`, or return the unfinished job submitted under the same key"""
+        if key is not None and key in self._by_key:
+            LLM_JOBS.labels("deduplicated").inc()
+            return self._by_key[key]
+        if self.queued >= self.max_queued:
+            LLM_JOBS.labels("rejected").inc()
+            raise AdmissionRejected("job_queue_full", self.retry_after())
+        job = Job(secrets.token_urlsafe(16), key, run)
+        self._active[job.id] = job
+        if key is not None:
+            self._by_key[key] = job
+        self._queue.put_nowait(job)
+        LLM_JOBS_QUEUED.set(self.queued)
+        self._store_later(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job this process runs or ran, or None"""
+        job = self._active.get(job_id)
+        if job is not None:
+            return job
+        job = self._finished.get(job_id)
+        return None if job is MISSING else job
+
+    async def read_stored(self, job_id: str, wait: float = 0.0) -> Optional[Tuple[bytes, bool]]:
+        """(state, done) of a job from the shared directory, waiting up to `wait` seconds for it to finish"""
+        if not self.directory or not _JOB_ID.match(job_id):
+            return None
+        deadline = time.monotonic() + wait
+        while True:
+            stored = await run_in_threadpool(self._read, job_id)
+            if stored is None or stored[1] or time.monotonic() >= deadline:
+                return stored
+            await asyncio.sleep(min(_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            LLM_JOBS_QUEUED.set(self.queued)
+            LLM_JOB_SECONDS.labels("queued").observe(time.time() - job.created_at)
+            job.status = "running"
+            self._store_later(job)
+            started = time.monotonic()
+            try:
+                job.result = await asyncio.wait_for(job.run(), self.timeout)
+                job.status = "done"
+            except asyncio.TimeoutError:
+                job.status, job.error = "failed", f"Job did not finish within {self.timeout:g}s"
+            except asyncio.CancelledError:
+                if self._closing or _worker_cancelled():
+                    raise
+                # Something inside the job was cancelled, not this worker: fail the job, keep the worker
+                logger.warning("LLM job %s was cancelled", job.id)
+                job.status, job.error = "failed", "The job was cancelled"
+            except Exception as e:
+                logger.warning("LLM job %s failed: %s", job.id, e)
+                job.status, job.error = "failed", str(e) or type(e).__name__
+            ran = time.monotonic() - started
+            self._avg_run = 0.8 * self._avg_run + 0.2 * ran
+            LLM_JOB_SECONDS.labels("running").observe(ran)
+            LLM_JOBS.labels(job.status).inc()
+            self._finish(job)
+
+    def _finish(self, job: Job):
+        job.finished_at = time.time()
+        # Drop the closure, and with it the request's session and inputs
+        job.run = None
+        self._active.pop(job.id, None)
+        if job.key is not None and self._by_key.get(job.key) is job:
+            del self._by_key[job.key]
+        self._finished.set(job.id, job)
+        job._done.set()
+        self._store_later(job)
+
+    def _store_later(self, job: Job):
+        if not self.directory:
+            return
+        done = job.done
+        # Encoded now, on the loop, so the file matches the job's state at this moment
+        try:
+            data = self.encode(job)
+        except Exception as e:
+            logger.warning("Could not encode LLM job %s: %s", job.id, e)
+            return
+        task = asyncio.create_task(self._write_after(self._writes.get(job.id), job.id, data, done))
+        self._writes[job.id] = task
+        task.add_done_callback(_log_store_failure)
+        task.add_done_callback(lambda finished: self._forget_write(job.id, finished))
+
+    async def _write_after(self, previous: Optional[asyncio.Task], job_id: str, data: bytes, done: bool):
+        if previous is not None:
+            # Its failure, if any, is logged by its own callback
+            await asyncio.wait([previous])
+        await run_in_threadpool(self._write, job_id, data, done)
+
+    def _forget_write(self, job_id: str, task: asyncio.Task):
+        if self._writes.get(job_id) is task:
+            del self._writes[job_id]
+
+    def _path(self, job_id: str, done: bool) -> str:
+        return os.path.join(self.directory, f"{job_id}.json" if done else f"{job_id}.pending.json")
+
+    def _write(self, job_id: str, data: bytes, done: bool):
+        path = self._path(job_id, done)
+        # Write a file of its own (mkstemp: unique name, mode 0600) then rename it, so a reader in another
+        # process never sees half a file and no other write can truncate this one
+        fd, temp_path = tempfile.mkstemp(prefix=f".{job_id}.", suffix=".tmp", dir=self.directory)
+        try:
+            with open(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            _remove(temp_path)
+            raise
+        if done:
+            _remove(self._path(job_id, False))
+
+    def _read(self, job_id: str) -> Optional[Tuple[bytes, bool]]:
+        # The finished state is written before the pending one is removed, so look for it first
+        for done in (True, False):
+            try:
+                with open(self._path(job_id, done), "rb") as f:
+                    return f.read(), done
+            except FileNotFoundError:
+                continue
+        return None
+
+    async def _sweep(self):
+        """Delete expired job files every so often; every process sweeps, which is harmless"""
+        while True:
+            await asyncio.sleep(min(60.0, self.ttl))
+            try:
+                removed = await run_in_threadpool(self._remove_expired)
+                if removed:
+                    logger.debug("Removed %d expired LLM job files", removed)
+            except Exception as e:
+                logger.warning("Sweeping LLM job files failed: %s", e)
+
+    def _remove_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(self.directory):
+            # Pending files of a process that died without finishing its jobs expire too, after the run timeout
+            max_age = self.ttl + (self.timeout if ".pending." in entry.name else 0)
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    _remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+def _worker_cancelled() -> bool:
+    # Task.cancelling() is Python 3.11+; before that only `_closing` tells the two apart
+    cancelling = getattr(asyncio.current_task(), "cancelling", None)
+    return cancelling is not None and cancelling() > 0
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _log_store_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Could not store LLM job state: %s", task.exception())
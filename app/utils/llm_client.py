@@ -1,36 +1,151 @@
-import os
+import hashlib
+import importlib.util
 import json
+import logging
 import re
-from typing import Dict, Any, List, Optional
-from dotenv import load_dotenv
+import threading
+from typing import Callable, Dict, Any, List, Optional
+from app.config import Settings, get_settings
+from app.utils.metrics import FALLBACKS, track_upstream
+from app.utils.backend_pool import BackendPool
+from app.utils.offload import Offloader
 
-# Try to import requests, but provide a mock if it's not available
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except ImportError:
-    REQUESTS_AVAILABLE = False
-    print("Warning: requests package not available. LLM functionality will be limited.")
+# requests is imported lazily when the client opens its session; only check it exists here
+REQUESTS_AVAILABLE = importlib.util.find_spec("requests") is not None
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Set on results built by keyword extraction instead of by the model, so callers can tell them apart
+FALLBACK_FLAG = "_fallback"
+
+def is_fallback(result: Dict[str, Any]) -> bool:
+    return bool(result.get(FALLBACK_FLAG))
+
+_JSON_OBJECT = re.compile(r'\{[\s\S]*\}')
+
+def extract_json(response_text: str) -> Optional[Dict[str, Any]]:
+    """The JSON object in a model's answer, or None if there is none that parses"""
+    # Module-level and over plain strings, so the Offloader can run it in a worker process
+    json_match = _JSON_OBJECT.search(response_text)
+    if not json_match:
+        return None
+    try:
+        return json.loads(json_match.group(0))
+    except json.JSONDecodeError:
+        return None
+
+class GenerationCancelled(Exception):
+    """Raised by `LLMClient.stream_prompt` when its CancelToken was triggered"""
+
+class CancelToken:
+    """Lets another thread stop a streaming generation
+
+    `cancel()` flags the token and closes the upstream response, so a reader
+    blocked waiting for the next chunk returns immediately.
+    """
 
-class LLMClient:
     def __init__(self):
-        self.host = os.getenv("OLLAMA_HOST", "http://localhost")
-        self.port = os.getenv("OLLAMA_PORT", "11434")
-        self.model = os.getenv("OLLAMA_MODEL", "deepseek/deepseek-chat-v3.1:free")
-        self.api_url = f"{self.host}:{self.port}/api/generate"
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def attach(self, response):
+        with self._lock:
+            self._response = response
+        if self.cancelled:
+            response.close()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+class LLMClient:
+    def __init__(self, settings: Optional[Settings] = None, offloader: Optional[Offloader] = None):
+        settings = settings or get_settings()
+        # Runs JSON extraction over long answers off the event loop's GIL
+        self.offloader = offloader or Offloader("inline")
+        self.host = settings.ollama_host
+        self.port = settings.ollama_port
+        self.model = settings.ollama_model
+        # Generations are spread across every configured Ollama node
+        self.pool = BackendPool(
+            settings.ollama_backends,
+            strategy=settings.ollama_routing,
+            sticky=settings.ollama_sticky,
+            failure_threshold=settings.ollama_failure_threshold,
+            ejection_seconds=settings.ollama_ejection_seconds
+        )
+        self.sticky = settings.ollama_sticky
+        # (connect, read) for requests; without it a hung node would hold its lease and admission slot forever
+        self.timeout = (settings.ollama_connect_timeout, settings.ollama_read_timeout)
         self.available = REQUESTS_AVAILABLE
-        print(self.api_url)
-    def process_prompt(self, prompt: str) -> Dict[str, Any]:
-        """Process a natural language prompt through the LLM to extract location information"""
-        # Check if requests is available
+        self.session = None
         if not self.available:
-            print("LLM functionality not available: requests package is missing")
-            return self._fallback_response(prompt)
-            
-        # Enhance the prompt to extract location information
+            logger.warning("requests package not available. LLM functionality will be limited.")
+        logger.info("Using Ollama API at %s", ", ".join(b.url for b in self.pool.backends))
+
+    def _get_session(self):
+        """Return the pooled HTTP session, importing requests on first use"""
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        return self.session
+
+    def _generate(self, payload: Dict[str, Any], routing_key: Optional[str] = None, **kwargs):
+        """POST to /api/generate on the backend the pool picks, recording failures against it"""
+        with self.pool.acquire(key=routing_key if self.sticky else None) as lease:
+            with track_upstream("ollama"):
+                kwargs.setdefault("timeout", self.timeout)
+                response = self._get_session().post(f"{lease.url}/api/generate", json=payload, **kwargs)
+            if response.status_code >= 500:
+                lease.mark_failed()
+            return response
+
+    def warmup(self, timeout: float = 120.0):
+        """Open the connection pool and load the model on every backend with a one-token generation
+
+        Ollama loads a model into memory on its first request, which can take
+        many seconds. Doing it at startup keeps that cost off the first user.
+        """
+        if not self.available:
+            return
+        failures = []
+        for backend in self.pool.backends:
+            try:
+                with track_upstream("ollama"):
+                    response = self._get_session().post(
+                        f"{backend.url}/api/generate",
+                        json={
+                            "model": self.model,
+                            "prompt": "Hello",
+                            "stream": False,
+                            "options": {"num_predict": 1}
+                        },
+                        timeout=timeout
+                    )
+                response.raise_for_status()
+            except Exception as e:
+                failures.append(f"{backend.url}: {e}")
+        if failures:
+            raise RuntimeError("; ".join(failures))
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def _enhance_prompt(self, prompt: str, context: Optional[str] = None) -> str:
+        """Wrap the user's prompt with the instructions for extracting location information"""
         system_prompt = """
         You are a helpful assistant that extracts location information from user queries. 
         If the user is asking about a place, extract the location name and any relevant details.
@@ -49,50 +164,122 @@ class LLMClient:
         Only include fields that are relevant to the query.
         """
         
-        enhanced_prompt = f"System: {system_prompt}\n\nUser: {prompt}\n\nAssistant:"
+        if context:
+            # Lets follow-ups like "how do I get there by bike" name the place they mean
+            system_prompt += f"\n        Conversation so far: {context}. Resolve words like \"there\" or \"it\" using it.\n"
+        
+        return f"System: {system_prompt}\n\nUser: {prompt}\n\nAssistant:"
+
+    def _routing_key(self, prompt: str) -> str:
+        return hashlib.md5(prompt.strip().lower().encode("utf-8")).hexdigest()
+
+    def _parse_response(self, prompt: str, response_text: str) -> Dict[str, Any]:
+        """Pull the JSON object out of the model's answer, falling back to keyword extraction"""
+        parsed_response = self.offloader.call("llm_json", extract_json, response_text, size=len(response_text))
+        if parsed_response is None:
+            # No JSON found, or it doesn't parse
+            return self._fallback_response(prompt, response_text)
+        return parsed_response
+
+    def process_prompt(self, prompt: str, context: Optional[str] = None) -> Dict[str, Any]:
+        """Process a natural language prompt through the LLM to extract location information"""
+        # Check if requests is available
+        if not self.available:
+            logger.warning("LLM functionality not available: requests package is missing")
+            return self._fallback_response(prompt)
         
         try:
             # Call the Ollama API
-            response = requests.post(
-                self.api_url,
-                json={
+            response = self._generate(
+                {
                     "model": self.model,
-                    "prompt": enhanced_prompt,
+                    "prompt": self._enhance_prompt(prompt, context),
                     "stream": False
-                }
+                },
+                routing_key=self._routing_key(prompt)
             )
             
             if response.status_code != 200:
-                print(f"Error from Ollama API: {response.text}")
+                logger.warning("Error from Ollama API (status %s): %s", response.status_code, response.text[:500])
                 return self._fallback_response(prompt)
             
             # Extract the response text
             result = response.json()
-            response_text = result.get("response", "")
-            
-            # Try to parse JSON from the response
-            try:
-                # Find JSON in the response using regex
-                json_match = re.search(r'\{[\s\S]*\}', response_text)
-                if json_match:
-                    json_str = json_match.group(0)
-                    parsed_response = json.loads(json_str)
-                    return parsed_response
-                else:
-                    # If no JSON found, use fallback
-                    return self._fallback_response(prompt, response_text)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, use fallback
-                return self._fallback_response(prompt, response_text)
+            return self._parse_response(prompt, result.get("response", ""))
                 
         except Exception as e:
-            print(f"Error calling Ollama API: {str(e)}")
+            logger.warning("Error calling Ollama API: %s", e)
+            return self._fallback_response(prompt)
+
+    def stream_prompt(
+        self,
+        prompt: str,
+        on_token: Callable[[str], None],
+        cancel: Optional[CancelToken] = None,
+        context: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Like `process_prompt`, but stream the generation and pass each token to `on_token`
+
+        If `cancel` is triggered the upstream response is closed, which makes
+        Ollama stop generating, and GenerationCancelled is raised.
+        """
+        if not self.available:
+            logger.warning("LLM functionality not available: requests package is missing")
             return self._fallback_response(prompt)
+
+        chunks: List[str] = []
+        try:
+            with self.pool.acquire(key=self._routing_key(prompt) if self.sticky else None) as lease:
+                with track_upstream("ollama"):
+                    response = self._get_session().post(
+                        f"{lease.url}/api/generate",
+                        json={
+                            "model": self.model,
+                            "prompt": self._enhance_prompt(prompt, context),
+                            "stream": True
+                        },
+                        stream=True,
+                        timeout=self.timeout
+                    )
+                    try:
+                        if cancel is not None:
+                            cancel.attach(response)
+                        if response.status_code != 200:
+                            if response.status_code >= 500:
+                                lease.mark_failed()
+                            logger.warning("Error from Ollama API (status %s): %s", response.status_code, response.text[:500])
+                            return self._fallback_response(prompt)
+                        for line in response.iter_lines():
+                            if cancel is not None and cancel.cancelled:
+                                break
+                            if not line:
+                                continue
+                            data = json.loads(line)
+                            token = data.get("response", "")
+                            if token:
+                                chunks.append(token)
+                                on_token(token)
+                            if data.get("done"):
+                                break
+                    except Exception:
+                        # A read torn down by cancel() is not a backend failure
+                        if cancel is None or not cancel.cancelled:
+                            raise
+                    finally:
+                        response.close()
+        except Exception as e:
+            logger.warning("Error calling Ollama API: %s", e)
+            return self._fallback_response(prompt)
+
+        if cancel is not None and cancel.cancelled:
+            raise GenerationCancelled()
+        return self._parse_response(prompt, "".join(chunks))
     
     def _fallback_response(self, prompt: str, llm_response: Optional[str] = None) -> Dict[str, Any]:
         """Generate a fallback response when LLM processing fails"""
+        FALLBACKS.labels("llm_fallback").inc()
         # Simple keyword-based extraction as fallback
-        response = {}
+        response = {FALLBACK_FLAG: True}
         
         # Use LLM response if available, otherwise use a generic response
         if llm_response:
@@ -136,5 +323,5 @@ class LLMClient:
                 # This will help avoid validation errors when the prompt is too vague
                 response["response"] = f"I can help you with maps, but I'll need more specific information. Are you looking for a particular location, or do you need directions between two places?"
                 # Don't set location_query for vague prompts to avoid validation errors
-        print(response)
+        logger.debug("Fallback response: %s", response)
         return response
\ No newline at end of file
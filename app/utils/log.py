@@ -0,0 +1,186 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# Request ID of the request being handled in the current context ("-" outside requests)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "suppressed"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+_setup_lock = threading.Lock()
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the current request ID
+
+    Runs in the caller's context, before the record is handed to the queue,
+    so the ID is captured from the right request.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """Drop repeats of the same message beyond `burst` per `interval` seconds
+
+    Messages are keyed by logger and unformatted message template, so
+    "Error calling %s" counts as one message whatever its arguments. The
+    first record let through after a quiet period carries a `suppressed`
+    count of how many were dropped.
+    """
+
+    def __init__(self, burst: int = 10, interval: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows: Dict[Tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                # [window start, records allowed, records dropped]
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10_000:
+                    self._evict(now)
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+    def _evict(self, now: float):
+        for key in [k for k, w in self._windows.items() if now - w[0] >= self.interval]:
+            del self._windows[key]
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = "-"
+        line = super().format(record)
+        if getattr(record, "suppressed", 0):
+            line += f" (suppressed {record.suppressed} similar messages)"
+        return line
+
+class _PreparingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps `extra` fields and renders tracebacks before enqueueing"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args into the message in the caller's thread so mutable arguments
+        # can't change before the listener formats them
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """Parse "app.utils.llm_client=DEBUG,app.utils.maps_client=WARNING" """
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Configure the "app" logger hierarchy with a queue-backed handler
+
+    Log calls only put a record on an in-memory queue; a background thread
+    does the formatting and writing, so request handling never blocks on
+    stdout. Safe to call more than once.
+
+    Environment:
+        LOG_LEVEL            default level for app loggers (INFO)
+        LOG_LEVELS           per-module overrides, e.g. "app.utils.llm_client=DEBUG"
+        LOG_FORMAT           "json" (default) or "text"
+        LOG_RATE_LIMIT       repeats of one message allowed per interval (10, 0 disables)
+        LOG_RATE_INTERVAL    rate limit interval in seconds (60)
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT", "json") == "json" else TextFormatter())
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        queue_handler = _PreparingQueueHandler(log_queue)
+        queue_handler.addFilter(RequestIdFilter())
+        queue_handler.addFilter(RateLimitFilter(
+            burst=int(os.getenv("LOG_RATE_LIMIT", 10)),
+            interval=float(os.getenv("LOG_RATE_INTERVAL", 60)),
+        ))
+
+        app_logger = logging.getLogger("app")
+        app_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        app_logger.addHandler(queue_handler)
+        app_logger.propagate = False
+
+        for name, level in _parse_levels(os.getenv("LOG_LEVELS", "")).items():
+            logging.getLogger(name).setLevel(level)
+
+        _queue_handler = queue_handler
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _queue_handler is not None:
+            logging.getLogger("app").removeHandler(_queue_handler)
+            _queue_handler = None
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -1,34 +1,359 @@
-import os
+import importlib.util
 import json
-from dotenv import load_dotenv
-from app.models.location import LocationResponse, DirectionsResponse, Place, Geometry, Route, Leg, Step
-from typing import List, Dict, Any, Optional
+import logging
+import time
+from app.config import Settings, get_settings
+from app.models.location import (
+    LocationResponse, DirectionsResponse, Place, Geometry, Route, Leg, Step, PlaceDetails, PlaceDetailsResponse
+)
+from app.utils.gazetteer import Gazetteer, GazetteerEntry, GAZETTEER_ID_PREFIX
+from app.utils.metrics import FALLBACKS, GAZETTEER_LOOKUPS, STARTUP_SECONDS, track_upstream
+from app.utils.offload import Offloader
+from app.utils.resolution import ResolutionRegistry
+from typing import List, Dict, Any, Optional, Tuple
 
-# Try to import googlemaps, but provide a mock if it's not available
-try:
-    import googlemaps
-    GOOGLEMAPS_AVAILABLE = True
-except ImportError:
-    GOOGLEMAPS_AVAILABLE = False
-    print("Warning: googlemaps package not available. Map functionality will be limited.")
+# googlemaps (and requests under it) is imported when the client is built; only check it exists here
+GOOGLEMAPS_AVAILABLE = importlib.util.find_spec("googlemaps") is not None
 
-# Load environment variables
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+# PlaceDetails fields a caller may ask for, and the Place Details API field each one is billed as
+PLACE_DETAIL_FIELDS = {
+    "place_id": "place_id",
+    "name": "name",
+    "formatted_address": "formatted_address",
+    "geometry": "geometry/location",
+    "types": "type",
+    "rating": "rating",
+    "user_ratings_total": "user_ratings_total",
+    "photos": "photo",
+    "opening_hours": "opening_hours",
+    "website": "website",
+    "international_phone_number": "international_phone_number",
+}
+
+# Intermediate stops the Directions API takes per request
+MAX_DIRECTIONS_WAYPOINTS = 25
+
+# What search results leave out, so it's what a details lookup fetches by default
+DEFAULT_DETAIL_FIELDS = ("opening_hours", "website", "international_phone_number")
+
+def _gazetteer_place(entry: GazetteerEntry) -> Place:
+    return Place(
+        place_id=entry.place_id,
+        name=entry.name,
+        formatted_address=entry.address or entry.name,
+        geometry=Geometry(lat=entry.lat, lng=entry.lng),
+        types=list(entry.types)
+    )
+
+def count_steps(directions_result: List[Dict[str, Any]]) -> int:
+    return sum(len(leg.get("steps", [])) for route in directions_result for leg in route.get("legs", []))
+
+def parse_routes(directions_result: List[Dict[str, Any]]) -> List[Route]:
+    """Routes of a raw googlemaps `directions()` result"""
+    routes = []
+    for route_data in directions_result:
+        legs = []
+        for leg_data in route_data.get("legs", []):
+            steps = []
+            for step_data in leg_data.get("steps", []):
+                step = Step(
+                    distance=step_data.get("distance", {}),
+                    duration=step_data.get("duration", {}),
+                    html_instructions=step_data.get("html_instructions", ""),
+                    polyline=step_data.get("polyline", {}),
+                    start_location=Geometry(
+                        lat=step_data.get("start_location", {}).get("lat", 0.0),
+                        lng=step_data.get("start_location", {}).get("lng", 0.0)
+                    ),
+                    end_location=Geometry(
+                        lat=step_data.get("end_location", {}).get("lat", 0.0),
+                        lng=step_data.get("end_location", {}).get("lng", 0.0)
+                    ),
+                    travel_mode=step_data.get("travel_mode", "")
+                )
+                steps.append(step)
+            
+            leg = Leg(
+                distance=leg_data.get("distance", {}),
+                duration=leg_data.get("duration", {}),
+                start_address=leg_data.get("start_address", ""),
+                end_address=leg_data.get("end_address", ""),
+                start_location=Geometry(
+                    lat=leg_data.get("start_location", {}).get("lat", 0.0),
+                    lng=leg_data.get("start_location", {}).get("lng", 0.0)
+                ),
+                end_location=Geometry(
+                    lat=leg_data.get("end_location", {}).get("lat", 0.0),
+                    lng=leg_data.get("end_location", {}).get("lng", 0.0)
+                ),
+                steps=steps
+            )
+            legs.append(leg)
+        
+        route = Route(
+            summary=route_data.get("summary", ""),
+            legs=legs,
+            overview_polyline=route_data.get("overview_polyline", {}),
+            warnings=route_data.get("warnings", []),
+            bounds=route_data.get("bounds", {}),
+            copyrights=route_data.get("copyrights", "")
+        )
+        routes.append(route)
+    return routes
+
+def _join_routes(routes: List[Route]) -> Route:
+    """One route out of consecutive routes, each starting where the previous one ends"""
+    from googlemaps.convert import decode_polyline, encode_polyline
+    points = []
+    for route in routes:
+        decoded = decode_polyline(route.overview_polyline.get("points", ""))
+        # Each piece starts on the point the previous one ended on
+        points.extend(decoded[1:] if points else decoded)
+    corners = [route.bounds for route in routes if route.bounds]
+    bounds = {}
+    if corners:
+        bounds = {
+            "northeast": {
+                "lat": max(c["northeast"]["lat"] for c in corners),
+                "lng": max(c["northeast"]["lng"] for c in corners)
+            },
+            "southwest": {
+                "lat": min(c["southwest"]["lat"] for c in corners),
+                "lng": min(c["southwest"]["lng"] for c in corners)
+            }
+        }
+    return Route(
+        summary=" / ".join(dict.fromkeys(route.summary for route in routes if route.summary)),
+        legs=[leg for route in routes for leg in route.legs],
+        overview_polyline={"points": encode_polyline(points)},
+        warnings=list(dict.fromkeys(w for route in routes for w in route.warnings)),
+        bounds=bounds,
+        copyrights=routes[0].copyrights
+    )
+
+def _js_value(value: Any) -> str:
+    """`value` as a JavaScript literal that is safe inside an inline <script>"""
+    return json.dumps(value).replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
+def render_directions_map_html(
+    api_key: str,
+    start_lat: float,
+    start_lng: float,
+    origin_js: str,
+    destination_js: str,
+    steps: List[Tuple[str, str]],
+    start_address: str,
+    end_address: str,
+    distance_text: str,
+    duration_text: str,
+    travel_mode: str
+) -> str:
+    """Directions map page from plain values (see `MapsClient.directions_map_args`), so it can run in a worker process"""
+    # Joined once rather than appended step by step, which copies the page so far every time
+    steps_html = "".join(
+        f"""
+            <div class="direction-step">
+                <span class="step-number">{i+1}.</span>
+                <span class="step-instruction">{instructions}</span>
+                <span class="step-distance">{distance}</span>
+            </div>
+            """
+        for i, (instructions, distance) in enumerate(steps)
+    )
+    
+    html = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Directions Map</title>
+        <style>
+            #map {{height: 400px; width: 100%;}}
+            body {{margin: 0; padding: 0; font-family: Arial, sans-serif;}}
+            .directions-container {{padding: 15px;}}
+            .direction-step {{margin-bottom: 10px; padding: 5px; border-bottom: 1px solid #eee;}}
+            .step-number {{font-weight: bold; margin-right: 10px;}}
+            .step-distance {{color: #666; margin-left: 10px;}}
+            .route-summary {{font-weight: bold; margin-bottom: 15px;}}
+        </style>
+    </head>
+    <body>
+        <div id="map"></div>
+        <div class="directions-container">
+            <div class="route-summary">
+                <p>From: {start_address}</p>
+                <p>To: {end_address}</p>
+                <p>Distance: {distance_text}, Duration: {duration_text}</p>
+            </div>
+            <h3>Directions:</h3>
+            <div class="steps-container">
+                {steps_html}
+            </div>
+        </div>
+        <script>
+            function initMap() {{
+                const directionsService = new google.maps.DirectionsService();
+                const directionsRenderer = new google.maps.DirectionsRenderer();
+                
+                const map = new google.maps.Map(document.getElementById('map'), {{
+                    zoom: 7,
+                    center: {{lat: {start_lat}, lng: {start_lng}}}
+                }});
+                
+                directionsRenderer.setMap(map);
+                
+                const request = {{
+                    origin: {origin_js},
+                    destination: {destination_js},
+                    travelMode: '{travel_mode}'
+                }};
+                
+                directionsService.route(request, (result, status) => {{
+                    if (status === 'OK') {{
+                        directionsRenderer.setDirections(result);
+                    }}
+                }});
+            }}
+        </script>
+        <script async defer src="https://maps.googleapis.com/maps/api/js?key={api_key}&callback=initMap"></script>
+    </body>
+    </html>
+    """
+    
+    return html
 
 class MapsClient:
-    def __init__(self):
-        self.api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+    def __init__(self, settings: Optional[Settings] = None, offloader: Optional[Offloader] = None):
+        settings = settings or get_settings()
+        self.api_key = settings.google_maps_api_key
         if not self.api_key:
             raise ValueError("Google Maps API key not found in environment variables")
         self.available = GOOGLEMAPS_AVAILABLE
+        # Builds long routes in a bounded worker pool, see `parse_routes`
+        self.offloader = offloader or Offloader("inline")
+        # Override to point at a local stub server (see benchmarking.md)
+        self.base_url = settings.google_maps_base_url
+        # Places already resolved by a search or directions call, reused to skip geocoding
+        self.resolutions = ResolutionRegistry(
+            ttl=settings.resolution_cache_ttl,
+            max_entries=settings.resolution_cache_size
+        )
+        # Well-known places answered locally, see `_gazetteer_response`
+        self.gazetteer: Optional[Gazetteer] = None
+        self.gazetteer_mode = settings.gazetteer_mode
+        self.gazetteer_min_confidence = settings.gazetteer_min_confidence
+        if settings.gazetteer_path and self.gazetteer_mode != "off":
+            started = time.perf_counter()
+            try:
+                self.gazetteer = Gazetteer(settings.gazetteer_path, settings.gazetteer_min_population)
+                STARTUP_SECONDS.labels("gazetteer").set(time.perf_counter() - started)
+                logger.info("Gazetteer %s: %d places", settings.gazetteer_path, len(self.gazetteer))
+            except (OSError, ValueError) as e:
+                logger.warning("Gazetteer not loaded, searches will all go to the Places API: %s", e)
         
         if self.available:
-            self.client = googlemaps.Client(key=self.api_key)
+            import googlemaps
+            self.client = googlemaps.Client(key=self.api_key, base_url=self.base_url)
         else:
+            logger.warning("googlemaps package not available. Map functionality will be limited.")
             self.client = None
+
+    def warmup(self, timeout: float = 10.0):
+        """Open a keep-alive connection to the Maps API host so the first search skips the TLS handshake"""
+        if not self.available:
+            return
+        # Any response will do; the point is the pooled connection left behind
+        self.client.session.get(self.base_url, timeout=timeout)
+
+    def close(self):
+        if self.client is not None:
+            self.client.session.close()
+        if self.gazetteer is not None:
+            self.gazetteer.close()
+
+    def _gazetteer_response(self, query: str) -> Optional[LocationResponse]:
+        """The gazetteer's answer for a query it matches confidently, else None"""
+        if self.gazetteer is None:
+            return None
+        match = self.gazetteer.lookup(query)
+        if match is None:
+            GAZETTEER_LOOKUPS.labels("miss").inc()
+            return None
+        entry, confidence = match
+        if confidence < self.gazetteer_min_confidence:
+            GAZETTEER_LOOKUPS.labels("low_confidence").inc()
+            return None
+        GAZETTEER_LOOKUPS.labels("hit").inc()
+        # Gazetteer-only ids mean nothing to Google, so directions get coordinates instead
+        google_place_id = None if entry.place_id.startswith(GAZETTEER_ID_PREFIX) else entry.place_id
+        self.resolutions.remember(query, google_place_id, entry.lat, entry.lng)
+        self.resolutions.remember(entry.name, google_place_id, entry.lat, entry.lng)
+        return LocationResponse(places=[_gazetteer_place(entry)], status="OK")
+
+    def suggest_places(self, prefix: str, limit: int = 10) -> LocationResponse:
+        """Gazetteer places whose name starts with `prefix`; no upstream call"""
+        if self.gazetteer is None:
+            return LocationResponse(status="ZERO_RESULTS")
+        places = [_gazetteer_place(entry) for entry in self.gazetteer.prefix(prefix, limit)]
+        return LocationResponse(places=places, status="OK" if places else "ZERO_RESULTS")
     
+    def _location_response(self, places_result: Dict[str, Any]) -> LocationResponse:
+        """Convert one page of a Places text search into a LocationResponse"""
+        # Process the results
+        places = []
+        for result in places_result.get("results", []):
+            # Extract location data
+            location = result.get("geometry", {}).get("location", {})
+            
+            # Create a Place object
+            place = Place(
+                place_id=result.get("place_id", ""),
+                name=result.get("name", ""),
+                formatted_address=result.get("formatted_address", ""),
+                geometry=Geometry(
+                    lat=location.get("lat", 0.0),
+                    lng=location.get("lng", 0.0)
+                ),
+                types=result.get("types", []),
+                rating=result.get("rating"),
+                user_ratings_total=result.get("user_ratings_total"),
+                photos=result.get("photos")
+            )
+            places.append(place)
+        
+        return LocationResponse(
+            places=places,
+            status=places_result.get("status", "UNKNOWN"),
+            next_cursor=places_result.get("next_page_token")
+        )
+
+    def search_place_page(self, page_token: str) -> LocationResponse:
+        """Fetch a further page of a search from the `next_cursor` of the previous page
+
+        Google only accepts a page token a couple of seconds after issuing it and
+        answers INVALID_REQUEST before that; callers are expected to retry.
+        """
+        if not self.available:
+            return LocationResponse(status="INVALID_REQUEST")
+        from googlemaps.exceptions import ApiError
+        try:
+            with track_upstream("places"):
+                places_result = self.client.places(page_token=page_token)
+        except ApiError as e:
+            return LocationResponse(status=e.status)
+        except Exception as e:
+            logger.warning("Error fetching next page of places: %s", e)
+            return LocationResponse(status="ERROR")
+        return self._location_response(places_result)
+
     def search_place(self, query: str) -> LocationResponse:
         """Search for places based on a text query"""
+        if self.gazetteer_mode == "first":
+            known = self._gazetteer_response(query)
+            if known is not None:
+                return known
+
         if not self.available:
             # Return mock data when googlemaps is not available
             return LocationResponse(
@@ -49,37 +374,25 @@ class MapsClient:
             
         try:
             # Use the Places API to search for the query
-            places_result = self.client.places(query)
-            
-            # Process the results
-            places = []
-            for result in places_result.get("results", []):
-                # Extract location data
-                location = result.get("geometry", {}).get("location", {})
-                
-                # Create a Place object
-                place = Place(
-                    place_id=result.get("place_id", ""),
-                    name=result.get("name", ""),
-                    formatted_address=result.get("formatted_address", ""),
-                    geometry=Geometry(
-                        lat=location.get("lat", 0.0),
-                        lng=location.get("lng", 0.0)
-                    ),
-                    types=result.get("types", []),
-                    rating=result.get("rating"),
-                    user_ratings_total=result.get("user_ratings_total"),
-                    photos=result.get("photos")
-                )
-                places.append(place)
+            with track_upstream("places"):
+                places_result = self.client.places(query)
             
-            return LocationResponse(
-                places=places,
-                status=places_result.get("status", "UNKNOWN")
-            )
+            response = self._location_response(places_result)
+            if response.places:
+                # Later directions to this query (or the top hit's name) can use its place_id
+                top = response.places[0]
+                self.resolutions.remember(query, top.place_id, top.geometry.lat, top.geometry.lng)
+                self.resolutions.remember(top.name, top.place_id, top.geometry.lat, top.geometry.lng)
+            return response
         except Exception as e:
             # Log the error and return a response with web link fallback
-            print(f"Error searching for place: {str(e)}")
+            logger.warning("Error searching for place: %s", e)
+            if self.gazetteer_mode == "fallback":
+                known = self._gazetteer_response(query)
+                if known is not None:
+                    FALLBACKS.labels("gazetteer").inc()
+                    return known
+            FALLBACKS.labels("web_fallback").inc()
             # Generate Google Maps web search URL
             web_url = f"https://www.google.com/maps/search/{query.replace(' ', '+')}"
             
@@ -101,8 +414,76 @@ class MapsClient:
                 web_url=web_url
             )
     
-    def get_directions(self, origin: str, destination: str, mode: str = "driving") -> DirectionsResponse:
-        """Get directions from origin to destination"""
+    def get_place_details(self, place_id: str, fields: List[str]) -> PlaceDetailsResponse:
+        """Fetch details for one place, limited to `fields` (keys of PLACE_DETAIL_FIELDS)"""
+        if not self.available:
+            # Return mock data when googlemaps is not available
+            mock = PlaceDetails(
+                place_id=place_id,
+                name="Mock place",
+                formatted_address="123 Mock Street, Mock City",
+                geometry=Geometry(lat=37.7749, lng=-122.4194),
+                types=["point_of_interest"],
+                rating=4.5,
+                user_ratings_total=100,
+                opening_hours={"open_now": True},
+                website="https://example.com",
+                international_phone_number="+1 555-010-0000"
+            )
+            return PlaceDetailsResponse(
+                place=PlaceDetails(place_id=place_id, **mock.model_dump(include=set(fields) - {"place_id"})),
+                status="OK"
+            )
+
+        from googlemaps.exceptions import ApiError
+        try:
+            with track_upstream("place_details"):
+                details_result = self.client.place(
+                    place_id,
+                    fields=[PLACE_DETAIL_FIELDS[field] for field in fields]
+                )
+        except ApiError as e:
+            # NOT_FOUND, INVALID_REQUEST and friends: the place id is the problem, not the API
+            return PlaceDetailsResponse(status=e.status)
+        except Exception as e:
+            logger.warning("Error getting place details: %s", e)
+            FALLBACKS.labels("details_error").inc()
+            return PlaceDetailsResponse(status="ERROR")
+
+        result = details_result.get("result", {})
+        location = result.get("geometry", {}).get("location")
+        details = PlaceDetails(
+            place_id=result.get("place_id", place_id),
+            name=result.get("name"),
+            formatted_address=result.get("formatted_address"),
+            geometry=Geometry(lat=location["lat"], lng=location["lng"]) if location else None,
+            types=result.get("types"),
+            rating=result.get("rating"),
+            user_ratings_total=result.get("user_ratings_total"),
+            photos=result.get("photos"),
+            opening_hours=result.get("opening_hours"),
+            website=result.get("website"),
+            international_phone_number=result.get("international_phone_number")
+        )
+        return PlaceDetailsResponse(place=details, status=details_result.get("status", "OK"))
+
+    def _directions_endpoint(self, text: str) -> Tuple[str, Optional[str], bool]:
+        """Directions API value for an endpoint, its place_id if known, and whether it was already resolved"""
+        if text.startswith("place_id:"):
+            return text, text[len("place_id:"):], True
+        resolved = self.resolutions.lookup(text)
+        if resolved is not None:
+            return resolved.as_directions_param(), resolved.place_id, True
+        return text, None, False
+
+    def get_directions(
+        self,
+        origin: str,
+        destination: str,
+        mode: str = "driving",
+        waypoints: Optional[List[str]] = None
+    ) -> DirectionsResponse:
+        """Get directions from origin to destination, through `waypoints` in the given order"""
         if not self.available:
             # Return mock data when googlemaps is not available
             mock_step = Step(
@@ -140,76 +521,111 @@ class MapsClient:
             )
             
         try:
+            # Pass already-resolved places as place_id/coordinates so Google doesn't geocode them again
+            origin_param, origin_place_id, origin_known = self._directions_endpoint(origin)
+            destination_param, destination_place_id, destination_known = self._directions_endpoint(destination)
+            waypoint_endpoints = [self._directions_endpoint(w) for w in waypoints or []]
+            extra = {"waypoints": [param for param, _, _ in waypoint_endpoints]} if waypoints else {}
+            
             # Use the Directions API
-            directions_result = self.client.directions(
-                origin=origin,
-                destination=destination,
-                mode=mode
+            with track_upstream("directions"):
+                directions_result = self.client.directions(
+                    origin=origin_param,
+                    destination=destination_param,
+                    mode=mode,
+                    **extra
+                )
+            
+            # Building the model tree is the CPU-heavy part of a long route
+            routes = self.offloader.call(
+                "directions", parse_routes, directions_result,
+                size=count_steps(directions_result),
+                # Unpickling a model tree costs more than building it, so never a process
+                allow_process=False
             )
             
-            # Process the results
-            routes = []
-            for route_data in directions_result:
-                legs = []
-                for leg_data in route_data.get("legs", []):
-                    steps = []
-                    for step_data in leg_data.get("steps", []):
-                        step = Step(
-                            distance=step_data.get("distance", {}),
-                            duration=step_data.get("duration", {}),
-                            html_instructions=step_data.get("html_instructions", ""),
-                            polyline=step_data.get("polyline", {}),
-                            start_location=Geometry(
-                                lat=step_data.get("start_location", {}).get("lat", 0.0),
-                                lng=step_data.get("start_location", {}).get("lng", 0.0)
-                            ),
-                            end_location=Geometry(
-                                lat=step_data.get("end_location", {}).get("lat", 0.0),
-                                lng=step_data.get("end_location", {}).get("lng", 0.0)
-                            ),
-                            travel_mode=step_data.get("travel_mode", "")
-                        )
-                        steps.append(step)
-                    
-                    leg = Leg(
-                        distance=leg_data.get("distance", {}),
-                        duration=leg_data.get("duration", {}),
-                        start_address=leg_data.get("start_address", ""),
-                        end_address=leg_data.get("end_address", ""),
-                        start_location=Geometry(
-                            lat=leg_data.get("start_location", {}).get("lat", 0.0),
-                            lng=leg_data.get("start_location", {}).get("lng", 0.0)
-                        ),
-                        end_location=Geometry(
-                            lat=leg_data.get("end_location", {}).get("lat", 0.0),
-                            lng=leg_data.get("end_location", {}).get("lng", 0.0)
-                        ),
-                        steps=steps
-                    )
-                    legs.append(leg)
-                
-                route = Route(
-                    summary=route_data.get("summary", ""),
-                    legs=legs,
-                    overview_polyline=route_data.get("overview_polyline", {}),
-                    warnings=route_data.get("warnings", []),
-                    bounds=route_data.get("bounds", {}),
-                    copyrights=route_data.get("copyrights", "")
-                )
-                routes.append(route)
+            if routes and routes[0].legs:
+                # Record where free-text endpoints resolved to. The googlemaps helper drops
+                # geocoded_waypoints, so only the coordinates are known here
+                start = routes[0].legs[0].start_location
+                end = routes[0].legs[-1].end_location
+                if not origin_known:
+                    self.resolutions.remember(origin, None, start.lat, start.lng)
+                if not destination_known:
+                    self.resolutions.remember(destination, None, end.lat, end.lng)
+                # Leg i ends at waypoint i
+                for waypoint, (_, _, known), leg in zip(waypoints or [], waypoint_endpoints, routes[0].legs):
+                    if not known:
+                        self.resolutions.remember(waypoint, None, leg.end_location.lat, leg.end_location.lng)
             
             return DirectionsResponse(
                 routes=routes,
-                status="OK" if routes else "ZERO_RESULTS"
+                status="OK" if routes else "ZERO_RESULTS",
+                origin_place_id=origin_place_id,
+                destination_place_id=destination_place_id
             )
         except Exception as e:
             # Log the error and return an empty response
-            print(f"Error getting directions: {str(e)}")
+            logger.warning("Error getting directions: %s", e)
+            FALLBACKS.labels("directions_error").inc()
             return DirectionsResponse(routes=[], status="ERROR")
     
+    def get_route(self, stops: List[str], mode: str = "driving") -> DirectionsResponse:
+        """Directions visiting `stops` in order, as one route with a leg per hop
+
+        Up to MAX_DIRECTIONS_WAYPOINTS + 2 stops take a single Directions call;
+        longer routes are fetched in consecutive pieces and joined.
+        """
+        if len(stops) < 2:
+            raise ValueError("A route needs at least two stops")
+        if not self.available:
+            return self.get_directions(stops[0], stops[-1], mode)
+        per_call = MAX_DIRECTIONS_WAYPOINTS + 1
+        pieces = []
+        for start in range(0, len(stops) - 1, per_call):
+            piece = stops[start:start + per_call + 1]
+            response = self.get_directions(piece[0], piece[-1], mode, waypoints=piece[1:-1])
+            if response.status != "OK":
+                return response
+            pieces.append(response)
+        if len(pieces) == 1:
+            return pieces[0]
+        return DirectionsResponse(
+            routes=[_join_routes([piece.routes[0] for piece in pieces])],
+            status="OK",
+            origin_place_id=pieces[0].origin_place_id,
+            destination_place_id=pieces[-1].destination_place_id
+        )
+
+    def get_travel_times(self, origins: List[str], destinations: List[str], mode: str = "driving") -> List[List[Optional[float]]]:
+        """Travel time in seconds from each origin to each destination, from one Distance Matrix call
+
+        Pairs without a route are None. Callers keep to the API's per-request
+        limits (see `route_optimizer.plan_matrix_requests`).
+        """
+        if not self.available:
+            # Without the API nothing is known; every order costs the same
+            return [[None] * len(destinations) for _ in origins]
+
+        with track_upstream("distance_matrix"):
+            matrix_result = self.client.distance_matrix(
+                origins=[self._directions_endpoint(o)[0] for o in origins],
+                destinations=[self._directions_endpoint(d)[0] for d in destinations],
+                mode=mode
+            )
+        if matrix_result.get("status") != "OK":
+            raise RuntimeError(f"Distance Matrix request failed: {matrix_result.get('status')}")
+        times = []
+        for row in matrix_result.get("rows", []):
+            times.append([
+                float(element["duration"]["value"]) if element.get("status") == "OK" else None
+                for element in row.get("elements", [])
+            ])
+        return times
+
     def generate_map_html(self, place: Place) -> str:
         """Generate HTML for embedding a Google Map with a marker for the place"""
-        api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+        api_key = self.api_key
         lat = place.geometry.lat
         lng = place.geometry.lng
         name = place.name.replace("'", "\\'")  # Escape single quotes
@@ -285,12 +701,10 @@ class MapsClient:
         
         return html
     
-    def generate_directions_map_html(self, directions: DirectionsResponse) -> str:
-        """Generate HTML for embedding a Google Map with directions"""
-        api_key = os.getenv("GOOGLE_MAPS_API_KEY")
-        
+    def directions_map_args(self, directions: DirectionsResponse) -> Optional[Tuple[Any, ...]]:
+        """Arguments for `render_directions_map_html`, or None if there is no route to show"""
         if not directions.routes or not directions.routes[0].legs:
-            return "<p>No directions available</p>"
+            return None
         
         route = directions.routes[0]
         leg = route.legs[0]
@@ -301,76 +715,33 @@ class MapsClient:
         end_lat = leg.end_location.lat
         end_lng = leg.end_location.lng
         
-        # Extract polyline for the route
-        polyline = route.overview_polyline.get("points", "")
-        
-        # Create steps HTML
-        steps_html = ""
-        for i, step in enumerate(leg.steps):
-            steps_html += f"""
-            <div class="direction-step">
-                <span class="step-number">{i+1}.</span>
-                <span class="step-instruction">{step.html_instructions}</span>
-                <span class="step-distance">{step.distance.get('text', '')}</span>
-            </div>
-            """
-        
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Directions Map</title>
-            <style>
-                #map {{height: 400px; width: 100%;}}
-                body {{margin: 0; padding: 0; font-family: Arial, sans-serif;}}
-                .directions-container {{padding: 15px;}}
-                .direction-step {{margin-bottom: 10px; padding: 5px; border-bottom: 1px solid #eee;}}
-                .step-number {{font-weight: bold; margin-right: 10px;}}
-                .step-distance {{color: #666; margin-left: 10px;}}
-                .route-summary {{font-weight: bold; margin-bottom: 15px;}}
-            </style>
-        </head>
-        <body>
-            <div id="map"></div>
-            <div class="directions-container">
-                <div class="route-summary">
-                    <p>From: {leg.start_address}</p>
-                    <p>To: {leg.end_address}</p>
-                    <p>Distance: {leg.distance.get('text', '')}, Duration: {leg.duration.get('text', '')}</p>
-                </div>
-                <h3>Directions:</h3>
-                <div class="steps-container">
-                    {steps_html}
-                </div>
-            </div>
-            <script>
-                function initMap() {{
-                    const directionsService = new google.maps.DirectionsService();
-                    const directionsRenderer = new google.maps.DirectionsRenderer();
-                    
-                    const map = new google.maps.Map(document.getElementById('map'), {{
-                        zoom: 7,
-                        center: {{lat: {start_lat}, lng: {start_lng}}}
-                    }});
-                    
-                    directionsRenderer.setMap(map);
-                    
-                    const request = {{
-                        origin: {{lat: {start_lat}, lng: {start_lng}}},
-                        destination: {{lat: {end_lat}, lng: {end_lng}}},
-                        travelMode: '{leg.steps[0].travel_mode if leg.steps else "DRIVING"}'
-                    }};
-                    
-                    directionsService.route(request, (result, status) => {{
-                        if (status === 'OK') {{
-                            directionsRenderer.setDirections(result);
-                        }}
-                    }});
-                }}
-            </script>
-            <script async defer src="https://maps.googleapis.com/maps/api/js?key={api_key}&callback=initMap"></script>
-        </body>
-        </html>
-        """
+        # Route the client-side map between the same resolved places, not re-geocoded text
+        if directions.origin_place_id:
+            origin_js = _js_value({"placeId": directions.origin_place_id})
+        else:
+            origin_js = f"{{lat: {start_lat}, lng: {start_lng}}}"
+        if directions.destination_place_id:
+            destination_js = _js_value({"placeId": directions.destination_place_id})
+        else:
+            destination_js = f"{{lat: {end_lat}, lng: {end_lng}}}"
         
-        return html
\ No newline at end of file
+        return (
+            self.api_key,
+            start_lat,
+            start_lng,
+            origin_js,
+            destination_js,
+            [(step.html_instructions, step.distance.get("text", "")) for step in leg.steps],
+            leg.start_address,
+            leg.end_address,
+            leg.distance.get("text", ""),
+            leg.duration.get("text", ""),
+            leg.steps[0].travel_mode if leg.steps else "DRIVING"
+        )
+
+    def generate_directions_map_html(self, directions: DirectionsResponse) -> str:
+        """Generate HTML for embedding a Google Map with directions"""
+        args = self.directions_map_args(directions)
+        if args is None:
+            return "<p>No directions available</p>"
+        return render_directions_map_html(*args)
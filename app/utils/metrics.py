@@ -0,0 +1,331 @@
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from fast in-process work up to slow LLM generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Timer:
+    """Context manager that observes the elapsed time into a histogram"""
+
+    __slots__ = ("_histogram", "_start")
+
+    def __init__(self, histogram: "_HistogramChild"):
+        self._histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start)
+        return False
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+class _HistogramChild:
+    __slots__ = ("_upper_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self._upper_bounds = upper_bounds
+        # One extra slot for the +Inf bucket
+        self._counts = [0] * (len(upper_bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Return the child metric for the given label values, creating it on first use"""
+        child = self._children.get(values)
+        if child is None:
+            key = tuple(str(v) for v in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.get(key) or self._children.setdefault(key, self._new_child())
+        return child
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        bounds = [_format_value(b) for b in self.upper_bounds] + ["+Inf"]
+        for key, child in sorted(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# HTTP layer
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being handled", ("route",))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "End-to-end request latency", ("route", "status"))
+RATE_LIMIT_REJECTIONS = REGISTRY.counter(
+    "rate_limit_rejections_total", "Requests rejected by the rate limiter")
+
+# WebSocket chat
+WS_CONNECTIONS = REGISTRY.gauge(
+    "ws_connections", "Open /ws/chat connections")
+WS_MESSAGES = REGISTRY.counter(
+    "ws_messages_total", "Client messages received on /ws/chat", ("type",))
+LLM_CANCELLATIONS = REGISTRY.counter(
+    "llm_cancellations_total", "Chat requests cancelled by the client before they finished")
+
+# Startup
+STARTUP_SECONDS = REGISTRY.gauge(
+    "startup_duration_seconds", "Time spent in each startup phase", ("phase",))
+FIRST_REQUEST_SECONDS = REGISTRY.gauge(
+    "first_request_duration_seconds", "Latency of the first API request served by this process")
+READY = REGISTRY.gauge(
+    "ready", "1 once startup warmup has finished")
+
+# /api/llm pipeline
+LLM_REQUEST_STAGE_SECONDS = REGISTRY.histogram(
+    "llm_request_stage_seconds", "Time spent in each stage of process_llm_request", ("stage",))
+
+# LLM admission control
+LLM_ADMISSION_ACTIVE = REGISTRY.gauge(
+    "llm_admission_active", "LLM generations currently holding a concurrency slot")
+LLM_ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "llm_admission_queue_depth", "Requests waiting for an LLM concurrency slot", ("lane",))
+LLM_ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "llm_admission_wait_seconds", "Time spent waiting for an LLM concurrency slot", ("lane",))
+LLM_ADMISSION_REJECTIONS = REGISTRY.counter(
+    "llm_admission_rejections_total", "LLM requests shed with a 503", ("reason",))
+
+# Asynchronous LLM jobs
+LLM_JOBS = REGISTRY.counter(
+    "llm_jobs_total", "LLM jobs by outcome: done, failed, deduplicated or rejected", ("outcome",))
+LLM_JOBS_QUEUED = REGISTRY.gauge(
+    "llm_jobs_queued", "LLM jobs waiting for a worker")
+LLM_JOB_SECONDS = REGISTRY.histogram(
+    "llm_job_seconds", "Time LLM jobs spend queued and running", ("stage",))
+
+# Ollama backend pool
+BACKEND_OUTSTANDING = REGISTRY.gauge(
+    "ollama_backend_outstanding", "Generations in flight per Ollama backend", ("backend",))
+BACKEND_HEALTHY = REGISTRY.gauge(
+    "ollama_backend_healthy", "1 if the backend is in rotation, 0 while ejected", ("backend",))
+BACKEND_EJECTIONS = REGISTRY.counter(
+    "ollama_backend_ejections_total", "Times a backend was ejected after repeated failures", ("backend",))
+
+# In-process caches
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "Cache lookups by outcome (hit, stale, miss, coalesced)", ("cache", "result"))
+CACHE_REFRESHES = REGISTRY.counter(
+    "cache_refreshes_total", "Background refreshes of stale entries (ok, kept_stale)", ("cache", "result"))
+CACHE_ENTRY_BYTES = REGISTRY.histogram(
+    "cache_entry_bytes", "Size of entries stored in compact-encoded caches", ("cache",),
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+CACHE_WARMER_PREFETCHES = REGISTRY.counter(
+    "cache_warmer_prefetches_total", "Popular entries considered by the cache warmer (ok, failed, fresh)", ("kind", "result"))
+CACHE_WARMER_TRACKED_KEYS = REGISTRY.gauge(
+    "cache_warmer_tracked_keys", "Most requested searches and routes tracked for warming")
+SEARCH_PREFETCHES = REGISTRY.counter(
+    "search_page_prefetches_total", "Background fetches of a search's next page (started, rate_limited)", ("result",))
+
+# Offline gazetteer
+GAZETTEER_LOOKUPS = REGISTRY.counter(
+    "gazetteer_lookups_total", "Searches checked against the offline gazetteer (hit, low_confidence, miss)", ("result",))
+
+# CPU-bound work and the event loop
+EVENT_LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke up from a timed sleep")
+OFFLOAD_TASKS = REGISTRY.counter(
+    "offload_tasks_total", "CPU-bound steps by where they ran (inline, thread, process)", ("task", "where"))
+OFFLOAD_SECONDS = REGISTRY.histogram(
+    "offload_task_seconds", "Time spent in CPU-bound steps, including any hop to a worker", ("task",))
+
+# Multi-stop route optimization
+ROUTE_SOLVE_SECONDS = REGISTRY.histogram(
+    "route_solve_seconds", "Time spent ordering the stops of a multi-stop route")
+
+# Conversation sessions
+SESSIONS_ACTIVE = REGISTRY.gauge(
+    "sessions_active", "Conversation sessions held in memory")
+SESSION_CONTEXT_SAVES = REGISTRY.counter(
+    "session_context_saves_total",
+    "Work avoided thanks to conversation context: reference (filled in a follow-up), "
+    "place_search (skipped a search), geocode (passed a place_id to directions)", ("kind",))
+
+# Upstream calls
+UPSTREAM_REQUEST_SECONDS = REGISTRY.histogram(
+    "upstream_request_seconds", "Latency of calls to external services", ("upstream",))
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "upstream_requests_in_flight", "Calls to external services currently outstanding", ("upstream",))
+FALLBACKS = REGISTRY.counter(
+    "fallback_total", "Responses served from a degraded fallback path", ("kind",))
+
+class track_upstream:
+    """Time a call to an external service and count it as in flight while it runs
+
+    Usage:
+        with track_upstream("places"):
+            result = client.places(query)
+    """
+
+    __slots__ = ("_in_flight", "_timer")
+
+    def __init__(self, upstream: str):
+        self._in_flight = UPSTREAM_IN_FLIGHT.labels(upstream)
+        self._timer = UPSTREAM_REQUEST_SECONDS.labels(upstream).time()
+
+    def __enter__(self):
+        self._in_flight.inc()
+        self._timer.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._timer.__exit__(exc_type, exc, tb)
+        self._in_flight.dec()
+        return False
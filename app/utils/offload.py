@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+from app.utils.metrics import EVENT_LOOP_LAG_SECONDS, OFFLOAD_SECONDS, OFFLOAD_TASKS
+
+logger = logging.getLogger(__name__)
+
+OFFLOAD_MODES = ("inline", "thread", "process")
+
+def _noop() -> None:
+    return None
+
+class Offloader:
+    def __init__(self, mode: str = "thread", workers: int = 2, thresholds: Optional[Dict[str, int]] = None):
+        """
+        Runs the CPU-bound steps of a request in a worker pool once their payload is big enough
+
+        Small payloads run inline, where the hop to a worker would cost more
+        than the work itself. Each task has its own size threshold (steps of a
+        route, characters of an LLM answer, ...); tasks without one always run
+        inline. In "process" mode work runs in worker processes, so it doesn't
+        hold the GIL the event loop needs; functions and arguments must then be
+        picklable, i.e. module-level functions over plain data. Tasks whose
+        results are expensive to unpickle (pydantic model trees) pass
+        `allow_process=False` and use a thread pool of the same size instead.
+        A small thread pool still helps over inline or Starlette's 40-thread
+        pool: it caps how many threads compete with the event loop for the GIL.
+        Exceptions raised by the work reach the caller. If a worker process
+        dies, the tasks in flight fail with BrokenProcessPool and the next
+        one starts a new pool.
+
+        Args:
+            mode: "inline" (no offloading), "thread" or "process"
+            workers: Pool size
+            thresholds: Task name -> payload size from which it is offloaded
+        """
+        if mode not in OFFLOAD_MODES:
+            raise ValueError(f"Unknown offload mode {mode!r}, expected one of {', '.join(OFFLOAD_MODES)}")
+        self.mode = mode
+        self.workers = workers
+        self.thresholds = thresholds or {}
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self, task: str, size: int, allow_process: bool) -> Optional[Executor]:
+        threshold = self.thresholds.get(task)
+        if self.mode == "inline" or threshold is None or size < threshold:
+            return None
+        if self.mode == "process" and allow_process:
+            return self._process_pool()
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix="offload")
+        return self._threads
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            # spawn, not fork: the parent runs threads (anyio workers, the warmer) whose locks fork would copy
+            self._processes = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._processes
+
+    def _where(self, executor: Optional[Executor]) -> str:
+        if executor is None:
+            return "inline"
+        return "process" if executor is self._processes else "thread"
+
+    def call(self, task: str, fn: Callable[..., Any], *args: Any, size: int, allow_process: bool = True) -> Any:
+        """Run `fn(*args)` from a worker thread, blocking until it is done"""
+        executor = self._executor(task, size, allow_process)
+        OFFLOAD_TASKS.labels(task, self._where(executor)).inc()
+        with OFFLOAD_SECONDS.labels(task).time():
+            if executor is None:
+                return fn(*args)
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                self._discard(executor)
+                raise
+
+    async def run(self, task: str, fn: Callable[..., Any], *args: Any, size: int, allow_process: bool = True) -> Any:
+        """Run `fn(*args)` from the event loop; small payloads run right here"""
+        executor = self._executor(task, size, allow_process)
+        OFFLOAD_TASKS.labels(task, self._where(executor)).inc()
+        with OFFLOAD_SECONDS.labels(task).time():
+            if executor is None:
+                return fn(*args)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._discard(executor)
+                raise
+
+    def _discard(self, executor: Executor):
+        # A worker process died (crash, OOM kill); the pool refuses all work from then on, so start over
+        if executor is self._processes:
+            logger.warning("An offload worker process died; starting a new pool")
+            self._processes = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """Start the worker processes now, so the first big payload doesn't pay for spawning them"""
+        if self.mode != "process":
+            return
+        started = time.perf_counter()
+        executor = self._process_pool()
+        for future in [executor.submit(_noop) for _ in range(self.workers)]:
+            future.result()
+        logger.info("Started %d offload worker processes in %.2fs", self.workers, time.perf_counter() - started)
+
+    def close(self):
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+async def monitor_event_loop_lag(interval: float = 0.1):
+    """Record how late the event loop wakes up from a sleep, i.e. how long something held it up"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - expected))
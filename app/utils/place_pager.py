@@ -0,0 +1,170 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import time
+from typing import AsyncIterator, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.models.location import LocationResponse
+from app.utils.cache import TTLCache, MISSING
+from app.utils.maps_client import MapsClient
+from app.utils.metrics import CACHE_REQUESTS, SEARCH_PREFETCHES
+from app.utils.rate_limiter import RateLimiter
+from app.utils.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+class InvalidCursor(ValueError):
+    """A cursor this server didn't issue, or one too old to use"""
+
+def _query_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+class PlacePager:
+    def __init__(
+        self,
+        maps_client: MapsClient,
+        results: Optional[ResultCache] = None,
+        prefetch: bool = True,
+        token_delay: float = 2.0,
+        retries: int = 3,
+        ttl: float = 120.0,
+        max_entries: int = 1024,
+        secret: Optional[bytes] = None,
+        cursor_ttl: float = 300.0,
+        prefetch_per_minute: int = 30
+    ):
+        """
+        Page through Places text search results by cursor
+
+        The cursor handed to clients wraps Google's next_page_token with the
+        query and issue time, signed with `secret`; anything else is rejected
+        with InvalidCursor before a (billed) Places call is made. With the same
+        secret, a cursor works on a worker that didn't serve the previous page.
+        When a query's later pages have been asked for recently, the next page
+        of that query is fetched in the background once its token has become
+        valid, at most `prefetch_per_minute` times a minute, and a request for
+        that cursor awaits the prefetched result.
+
+        Args:
+            maps_client: Client used for the upstream calls
+            results: Cache the first page of a search is served from, if any
+            prefetch: Fetch the next page before it is asked for
+            token_delay: Seconds Google needs before a new page token is accepted
+            retries: Extra attempts, `token_delay / 2` apart, while a token isn't valid yet
+            ttl: Seconds a prefetched page is kept (tokens expire after a few minutes)
+            max_entries: Prefetched pages kept at most
+            secret: Key cursors are signed with (None: a random one, valid in this process only)
+            cursor_ttl: Seconds a cursor is accepted (Google's tokens expire after a few minutes)
+            prefetch_per_minute: Background page fetches per minute at most
+        """
+        self.maps_client = maps_client
+        self.results = results
+        self.prefetch = prefetch
+        self.token_delay = token_delay
+        self.retries = retries
+        self.secret = secret or secrets.token_bytes(32)
+        self.cursor_ttl = cursor_ttl
+        # Google token -> task resolving to the page behind it
+        self._prefetched = TTLCache("search_pages", ttl=ttl, max_entries=max_entries)
+        # Queries whose later pages were asked for lately; only those are prefetched
+        self._paged = TTLCache("paged_queries", ttl=3600.0, max_entries=max_entries)
+        self._prefetch_limiter = RateLimiter(prefetch_per_minute, 60)
+
+    async def page(self, query: str, cursor: Optional[str] = None) -> LocationResponse:
+        """Return the first page for `query`, or the page behind `cursor`
+
+        Raises InvalidCursor for a cursor this server didn't issue or that has expired.
+        """
+        if cursor is None:
+            key = _query_key(query or "")
+            if self.results is not None:
+                response = await self.results.search_place(query)
+            else:
+                response = await run_in_threadpool(self.maps_client.search_place, query)
+        else:
+            token, key, issued = self._verify(cursor)
+            self._paged.set(key, True)
+            response = await self._page_for_token(token, issued)
+        token = response.next_cursor
+        if not token:
+            return response
+        if self.prefetch and self._paged.get(key) is not MISSING:
+            self._schedule(token)
+        # A copy: the first page may be the cached response itself
+        return response.model_copy(update={"next_cursor": self._issue(token, key)})
+
+    async def pages(self, query: str, max_pages: int = 3) -> AsyncIterator[LocationResponse]:
+        """Yield the pages of a search one by one, each as soon as it is available"""
+        response = await self.page(query)
+        yield response
+        for _ in range(max_pages - 1):
+            if not response.next_cursor:
+                return
+            response = await self.page(query, response.next_cursor)
+            yield response
+
+    def _issue(self, token: str, key: str) -> str:
+        payload = json.dumps([token, key, round(time.time(), 3)], separators=(",", ":")).encode("utf-8")
+        signature = hmac.new(self.secret, payload, hashlib.sha256).digest()[:16]
+        return f"{_b64encode(payload)}.{_b64encode(signature)}"
+
+    def _verify(self, cursor: str) -> Tuple[str, str, float]:
+        """(Google token, query key, issue time) of a cursor this server issued"""
+        try:
+            encoded_payload, encoded_signature = cursor.split(".")
+            payload, signature = _b64decode(encoded_payload), _b64decode(encoded_signature)
+        except ValueError:
+            raise InvalidCursor("Malformed cursor") from None
+        expected = hmac.new(self.secret, payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            raise InvalidCursor("Unknown cursor")
+        token, key, issued = json.loads(payload)
+        if time.time() - issued > self.cursor_ttl:
+            raise InvalidCursor("Cursor expired; run the search again")
+        return token, key, issued
+
+    async def _page_for_token(self, token: str, issued: float) -> LocationResponse:
+        task = self._prefetched.get(token)
+        if task is not MISSING:
+            CACHE_REQUESTS.labels("search_pages", "hit").inc()
+            response = await asyncio.shield(task)
+            if response.status == "OK":
+                return response
+            # The prefetch failed; try once more ourselves
+        else:
+            CACHE_REQUESTS.labels("search_pages", "miss").inc()
+        return await self._fetch(token, issued, wait_first=False)
+
+    def _schedule(self, token: str):
+        if self._prefetched.get(token) is not MISSING:
+            return
+        if not self._prefetch_limiter.is_allowed("prefetch"):
+            SEARCH_PREFETCHES.labels("rate_limited").inc()
+            return
+        SEARCH_PREFETCHES.labels("started").inc()
+        self._prefetched.set(token, asyncio.create_task(self._fetch(token, time.time(), wait_first=True)))
+
+    async def _fetch(self, token: str, issued: float, wait_first: bool) -> LocationResponse:
+        if wait_first:
+            await asyncio.sleep(self.token_delay)
+        response = await run_in_threadpool(self.maps_client.search_place_page, token)
+        for _ in range(self.retries):
+            # Only a token Google issued moments ago may just not be valid yet; an older one is simply
+            # invalid, and retrying it would only add billed calls
+            if response.status != "INVALID_REQUEST" or time.time() - issued > self.token_delay * (self.retries + 1):
+                break
+            await asyncio.sleep(self.token_delay / 2)
+            response = await run_in_threadpool(self.maps_client.search_place_page, token)
+        if response.status not in ("OK", "ZERO_RESULTS"):
+            logger.info("Next page fetch ended with status %s", response.status)
+        return response
@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+from app.config import Settings
+
+# Leaf frames of threads that are parked waiting for work (idle thread pool
+# workers, the log writer). Sampling them only adds noise to the profile.
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("handlers.py", "dequeue"),
+}
+
+class SamplingProfiler:
+    """Statistical profiler that samples every thread's stack at a fixed interval
+
+    Sampling only runs while at least one profiled request is in flight:
+    `begin()` and `end()` bracket a request, and the background sampler
+    thread starts on the first `begin()` and parks once the count drops to
+    zero. Samples are aggregated as folded stacks ("a;b;c count"), the
+    input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005, max_stacks: int = 50_000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.profiled_requests = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self):
+        with self._lock:
+            self._active += 1
+            self.profiled_requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+            else:
+                self._wake.notify()
+
+    def end(self):
+        with self._lock:
+            self._active -= 1
+
+    def reset(self):
+        with self._lock:
+            self.stacks = Counter()
+            self.samples = 0
+            self.profiled_requests = 0
+
+    def folded(self) -> str:
+        """Return aggregated samples in folded-stack format, one stack per line"""
+        with self._lock:
+            items = sorted(self.stacks.items(), key=lambda item: -item[1])
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                while self._active <= 0:
+                    self._wake.wait()
+            self._sample(own_id)
+            time.sleep(self.interval)
+
+    def _sample(self, own_id: int):
+        names: Dict[int, str] = {t.ident: t.name for t in threading.enumerate()}
+        collected = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            frames.append(names.get(thread_id, f"thread-{thread_id}"))
+            collected.append(";".join(reversed(frames)))
+
+        with self._lock:
+            self.samples += 1
+            for stack in collected:
+                if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] += 1
+                else:
+                    self.stacks["[truncated]"] += 1
+
+def create_profiler(settings: Settings) -> Optional[SamplingProfiler]:
+    """Create a profiler if profiling is configured, otherwise return None
+
+    Profiling is on when PROFILE_SAMPLE_RATE is above zero (random sampling)
+    or ADMIN_TOKEN is set (requests tagged with `X-Profile: <token>`).
+    """
+    if settings.profile_sample_rate <= 0 and not settings.admin_token:
+        return None
+    return SamplingProfiler(interval=settings.profile_interval_ms / 1000.0)
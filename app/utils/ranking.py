@@ -0,0 +1,75 @@
+import importlib.util
+import math
+from typing import List, Optional, Sequence
+from app.models.location import Place
+
+# numpy is optional; without it distances are computed in a plain Python loop
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Distance at which proximity counts half as much as a place right next to the user,
+# when no search radius is given
+DEFAULT_DISTANCE_SCALE_KM = 5.0
+
+# Review count at which a rating is fully trusted
+TRUSTED_REVIEW_COUNT = 1000
+
+def haversine_km(lat: float, lng: float, lats: Sequence[float], lngs: Sequence[float]) -> List[float]:
+    """Great-circle distance in km from (lat, lng) to every (lats[i], lngs[i])"""
+    if NUMPY_AVAILABLE:
+        import numpy as np
+        lat1 = math.radians(lat)
+        lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+        dlat = lat2 - lat1
+        dlng = np.radians(np.asarray(lngs, dtype=np.float64)) - math.radians(lng)
+        a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))).tolist()
+
+    lat1 = math.radians(lat)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for other_lat, other_lng in zip(lats, lngs):
+        lat2 = math.radians(other_lat)
+        dlat = lat2 - lat1
+        dlng = math.radians(other_lng) - math.radians(lng)
+        a = math.sin(dlat / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin(dlng / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+def _quality(place: Place) -> float:
+    """0..1 from the rating, pulled towards neutral when there are few reviews"""
+    if place.rating is None:
+        return 0.5
+    confidence = min(1.0, math.log1p(place.user_ratings_total or 0) / math.log1p(TRUSTED_REVIEW_COUNT))
+    return 0.5 + (place.rating / 5.0 - 0.5) * confidence
+
+def rank_places(
+    places: List[Place],
+    lat: float,
+    lng: float,
+    radius_km: Optional[float] = None,
+    distance_weight: float = 0.7
+) -> List[Place]:
+    """Order places for a user at (lat, lng): nearest and best rated first
+
+    Each place gets `distance_km` set. Places farther than `radius_km` are
+    dropped. The score blends proximity, which halves at `radius_km` (or
+    DEFAULT_DISTANCE_SCALE_KM), with rating quality, weighted by
+    `distance_weight`.
+    """
+    if not places:
+        return places
+    distances = haversine_km(lat, lng, [p.geometry.lat for p in places], [p.geometry.lng for p in places])
+    scale = radius_km or DEFAULT_DISTANCE_SCALE_KM
+
+    scored = []
+    for index, (place, distance) in enumerate(zip(places, distances)):
+        if radius_km is not None and distance > radius_km:
+            continue
+        proximity = 1.0 / (1.0 + distance / scale)
+        score = distance_weight * proximity + (1.0 - distance_weight) * _quality(place)
+        # The upstream order breaks ties, so equal scores keep Google's relevance order
+        scored.append((-score, index, place.model_copy(update={"distance_km": round(distance, 3)})))
+    scored.sort(key=lambda item: (item[0], item[1]))
+    return [place for _, _, place in scored]
@@ -0,0 +1,47 @@
+import re
+from typing import NamedTuple, Optional
+from app.utils.cache import TTLCache, MISSING
+from app.utils.metrics import CACHE_REQUESTS
+
+_NON_WORD = re.compile(r"[^\w]+")
+_LEADING_ARTICLE = re.compile(r"^(the|a|an) ")
+
+def normalize_place_text(text: str) -> str:
+    """Canonical form of a free-text place reference: "The Eiffel Tower, " -> "eiffel tower" """
+    text = _NON_WORD.sub(" ", text.lower()).strip()
+    return _LEADING_ARTICLE.sub("", text)
+
+class Resolved(NamedTuple):
+    place_id: Optional[str]
+    lat: float
+    lng: float
+
+    def as_directions_param(self) -> str:
+        """Origin/destination value the Directions API accepts without geocoding"""
+        if self.place_id:
+            return f"place_id:{self.place_id}"
+        return f"{self.lat},{self.lng}"
+
+class ResolutionRegistry:
+    def __init__(self, ttl: float = 86400.0, max_entries: int = 10000):
+        """
+        Remember what free-text place references resolved to
+
+        Searches and directions record the place_id and coordinates their text
+        resolved to, so later calls mentioning the same place can pass those
+        instead of making Google geocode the text again.
+        """
+        self._entries = TTLCache("resolutions", ttl=ttl, max_entries=max_entries)
+
+    def remember(self, text: str, place_id: Optional[str], lat: float, lng: float):
+        key = normalize_place_text(text)
+        if key:
+            self._entries.set(key, Resolved(place_id, lat, lng))
+
+    def lookup(self, text: str) -> Optional[Resolved]:
+        resolved = self._entries.get(normalize_place_text(text))
+        if resolved is MISSING:
+            CACHE_REQUESTS.labels("resolutions", "miss").inc()
+            return None
+        CACHE_REQUESTS.labels("resolutions", "hit").inc()
+        return resolved
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.models.location import LocationResponse, DirectionsResponse
+from app.utils.cache import TTLCache, MISSING
+from app.utils.compact import pack, unpack
+from app.utils.llm_client import LLMClient, is_fallback
+from app.utils.maps_client import MapsClient
+from app.utils.metrics import CACHE_REQUESTS
+from app.utils.route_optimizer import UNREACHABLE_COST, plan_matrix_requests
+from app.utils.sketch import AccessHistory
+
+logger = logging.getLogger(__name__)
+
+def _text_key(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def _endpoint_key(text: str) -> str:
+    # place ids are case-sensitive, so only free text is folded
+    if text.startswith("place_id:"):
+        return text
+    return _text_key(text)
+
+def _ok(response: Any) -> bool:
+    # WEB_FALLBACK, ERROR and the like are answers for this moment only
+    return response.status == "OK"
+
+class ResultCache:
+    def __init__(
+        self,
+        maps_client: MapsClient,
+        llm_client: LLMClient,
+        search_ttl: float = 300.0,
+        directions_ttl: float = 900.0,
+        llm_ttl: float = 3600.0,
+        grace: float = 300.0,
+        max_entries: int = 4096,
+        history: Optional[AccessHistory] = None,
+        travel_time_ttl: float = 3600.0,
+        travel_time_entries: int = 100_000,
+        compact: bool = True
+    ):
+        """
+        Stale-while-revalidate caches for place searches, directions and LLM results
+
+        A fresh entry is served as is. For `grace` seconds after its TTL an entry
+        is still served immediately while one background task refreshes it; if
+        that refresh fails, or only produces a fallback/error result, the stale
+        entry keeps being served. Fallback and error results are never stored.
+        With `compact`, searches and directions are stored packed (see
+        app.utils.compact) rather than as model trees, and decoded on each hit.
+
+        Args:
+            maps_client: Client used for searches and directions
+            llm_client: Client used for prompts
+            search_ttl: Seconds a search result stays fresh
+            directions_ttl: Seconds a directions result stays fresh
+            llm_ttl: Seconds an LLM result stays fresh
+            grace: Seconds past the TTL an entry may still be served while it is refreshed
+            max_entries: Entries kept per cache
+            history: Where searches and directions are counted for the cache warmer, if anywhere
+            travel_time_ttl: Seconds a stop-to-stop travel time stays fresh
+            travel_time_entries: Stop-to-stop travel times kept (a 50-stop route needs 2450)
+            compact: Store searches and directions in their compact encoding
+        """
+        self.maps_client = maps_client
+        self.llm_client = llm_client
+        self.history = history
+        codec = {"pack": pack, "unpack": unpack} if compact else {}
+        self.searches = TTLCache("search", ttl=search_ttl, max_entries=max_entries, grace=grace, **codec)
+        self.directions = TTLCache("directions", ttl=directions_ttl, max_entries=max_entries, grace=grace, **codec)
+        self.prompts = TTLCache("llm", ttl=llm_ttl, max_entries=max_entries, grace=grace)
+        # (origin, destination, mode) -> seconds, shared by every multi-stop route touching the pair
+        self.travel_times = TTLCache("travel_time", ttl=travel_time_ttl, max_entries=travel_time_entries)
+
+    async def search_place(self, query: str) -> LocationResponse:
+        key = _text_key(query)
+        if self.history is not None:
+            self.history.record("search", key)
+        return await self.searches.get_or_load(
+            key,
+            lambda: run_in_threadpool(self.maps_client.search_place, query),
+            cacheable=_ok
+        )
+
+    async def get_directions(self, origin: str, destination: str, mode: str = "driving") -> DirectionsResponse:
+        # Endpoints the session or resolution registry turned into place ids share entries across phrasings
+        key = (_endpoint_key(origin), _endpoint_key(destination), mode.lower())
+        if self.history is not None:
+            self.history.record("directions", *key)
+        return await self.directions.get_or_load(
+            key,
+            lambda: run_in_threadpool(self.maps_client.get_directions, origin, destination, mode),
+            cacheable=_ok
+        )
+
+    async def get_route(self, stops: List[str], mode: str = "driving") -> DirectionsResponse:
+        """Directions through `stops` in the given order"""
+        key = ("route", mode.lower(), *(_endpoint_key(stop) for stop in stops))
+        return await self.directions.get_or_load(
+            key,
+            lambda: run_in_threadpool(self.maps_client.get_route, stops, mode),
+            cacheable=_ok
+        )
+
+    async def travel_time_matrix(self, stops: List[str], mode: str = "driving") -> Tuple[List[List[float]], int]:
+        """Travel times in seconds between every pair of `stops`, and the Distance Matrix calls it took
+
+        Cached pairs are reused, and the rest are fetched in as few calls as
+        the API's per-request limits allow, all at once. Pairs with no route,
+        or whose call failed, cost UNREACHABLE_COST.
+        """
+        mode = mode.lower()
+        keys = [_endpoint_key(stop) for stop in stops]
+        matrix = [[0.0] * len(stops) for _ in stops]
+        missing, cached = [], 0
+        for i, origin in enumerate(keys):
+            for j, destination in enumerate(keys):
+                if origin == destination:
+                    continue
+                seconds = self.travel_times.get((origin, destination, mode))
+                if seconds is MISSING:
+                    missing.append((i, j))
+                else:
+                    matrix[i][j] = seconds
+                    cached += 1
+        CACHE_REQUESTS.labels("travel_time", "hit").inc(cached)
+        CACHE_REQUESTS.labels("travel_time", "miss").inc(len(missing))
+
+        requests = plan_matrix_requests(missing)
+        responses = await asyncio.gather(
+            *(
+                run_in_threadpool(
+                    self.maps_client.get_travel_times, [stops[i] for i in origins], [stops[j] for j in destinations], mode
+                )
+                for origins, destinations in requests
+            ),
+            return_exceptions=True
+        )
+        needed = set(missing)
+        for (origins, destinations), response in zip(requests, responses):
+            if isinstance(response, Exception):
+                logger.warning("Distance Matrix request failed: %s", response)
+                for i, j in needed.intersection((i, j) for i in origins for j in destinations):
+                    matrix[i][j] = UNREACHABLE_COST
+                continue
+            for i, row in zip(origins, response):
+                for j, seconds in zip(destinations, row):
+                    if keys[i] == keys[j]:
+                        continue
+                    # No route is an answer too; cache it like any other
+                    seconds = UNREACHABLE_COST if seconds is None else seconds
+                    matrix[i][j] = seconds
+                    self.travel_times.set((keys[i], keys[j], mode), seconds)
+        return matrix, len(requests)
+
+    @staticmethod
+    def _prompt_key(prompt: str, context: Optional[str]) -> Hashable:
+        # The conversation context changes the answer ("there" means something else), so it is part of the key
+        return (_text_key(prompt), context)
+
+    async def process_prompt(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        generate: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None
+    ) -> Dict[str, Any]:
+        """LLM result for the prompt; `generate` replaces the plain `process_prompt` call, e.g. to hold an admission slot"""
+        if generate is None:
+            generate = lambda: run_in_threadpool(self.llm_client.process_prompt, prompt, context)
+        return await self.prompts.get_or_load(
+            self._prompt_key(prompt, context),
+            generate,
+            cacheable=lambda result: not is_fallback(result)
+        )
+
+    def cached_prompt(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        generate: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Cached LLM result without generating on a miss, for callers that stream their own generation"""
+        if generate is None:
+            generate = lambda: run_in_threadpool(self.llm_client.process_prompt, prompt, context)
+        result = self.prompts.peek(
+            self._prompt_key(prompt, context),
+            generate,
+            cacheable=lambda result: not is_fallback(result)
+        )
+        if result is MISSING:
+            CACHE_REQUESTS.labels("llm", "miss").inc()
+            return None
+        return result
+
+    def remember_prompt(self, prompt: str, context: Optional[str], result: Dict[str, Any]):
+        if not is_fallback(result):
+            self.prompts.set(self._prompt_key(prompt, context), result)
+
+    async def prefetch(self, kind: str, args: List[str]) -> str:
+        """Load one AccessHistory entry into its cache unless it is already fresh
+
+        Returns "fresh" (nothing fetched), "ok" or "failed". Nothing is recorded
+        in the history, so warming doesn't feed on itself.
+        """
+        if kind == "search":
+            cache, key = self.searches, args[0]
+            load = lambda: run_in_threadpool(self.maps_client.search_place, args[0])
+        elif kind == "directions":
+            cache, key = self.directions, tuple(args)
+            load = lambda: run_in_threadpool(self.maps_client.get_directions, *args)
+        else:
+            raise ValueError(f"Unknown history kind {kind!r}")
+        if cache.is_fresh(key):
+            return "fresh"
+        try:
+            value = await load()
+        except Exception:
+            return "failed"
+        if not _ok(value):
+            return "failed"
+        cache.set(key, value)
+        return "ok"
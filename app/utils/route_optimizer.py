@@ -0,0 +1,169 @@
+import importlib.util
+import math
+from typing import Iterable, List, Sequence, Tuple
+
+# numpy is optional; without it the 2-opt moves are evaluated in a plain Python loop
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+# Below this many stops the plain loop beats numpy's per-call overhead
+NUMPY_MIN_STOPS = 20
+
+# Stops a multi-stop route request may list; 50 stops take 25 Distance Matrix calls when nothing is cached
+MAX_ROUTE_STOPS = 50
+
+# Distance Matrix API limits per request
+MAX_MATRIX_ELEMENTS = 100
+MAX_MATRIX_SIDE = 25
+
+# Cost given to pairs the Distance Matrix API found no route for, so they are avoided but still orderable
+UNREACHABLE_COST = 1e9
+
+def plan_matrix_requests(
+    missing: Iterable[Tuple[int, int]],
+    max_elements: int = MAX_MATRIX_ELEMENTS,
+    max_side: int = MAX_MATRIX_SIDE
+) -> List[Tuple[List[int], List[int]]]:
+    """Group missing (origin, destination) pairs into as few Distance Matrix requests as possible
+
+    Each request is (origins, destinations) with at most `max_side` of each and
+    at most `max_elements` origins x destinations. Origins are split into groups
+    of the size that needs the fewest requests; each group only asks for the
+    destinations some of its origins are missing.
+    """
+    rows = {}
+    for origin, destination in missing:
+        rows.setdefault(origin, set()).add(destination)
+    if not rows:
+        return []
+    origins = sorted(rows)
+    all_destinations = set().union(*rows.values())
+
+    def group_size_cost(size: int) -> int:
+        columns = min(max_side, max_elements // size)
+        return math.ceil(len(origins) / size) * math.ceil(len(all_destinations) / columns)
+
+    group_size = min(range(1, min(max_side, max_elements, len(origins)) + 1), key=group_size_cost)
+    columns = min(max_side, max_elements // group_size)
+
+    requests = []
+    for start in range(0, len(origins), group_size):
+        group = origins[start:start + group_size]
+        destinations = sorted(set().union(*(rows[o] for o in group)))
+        for chunk in range(0, len(destinations), columns):
+            requests.append((group, destinations[chunk:chunk + columns]))
+    return requests
+
+def route_cost(matrix: Sequence[Sequence[float]], order: Sequence[int]) -> float:
+    """Total cost of visiting the stops in `order`"""
+    return sum(matrix[a][b] for a, b in zip(order, order[1:]))
+
+def _nearest_neighbour(matrix: Sequence[Sequence[float]], start: int, stops: List[int]) -> List[int]:
+    order = [start]
+    remaining = set(stops)
+    current = start
+    while remaining:
+        row = matrix[current]
+        # Ties go to the lower index, so the result doesn't depend on set ordering
+        current = min(remaining, key=lambda stop: (row[stop], stop))
+        remaining.remove(current)
+        order.append(current)
+    return order
+
+def _padded_costs(matrix: Sequence[Sequence[float]]):
+    import numpy as np
+    n = len(matrix)
+    # One extra node with zero cost stands in for "after the end" of an open path
+    costs = np.zeros((n + 1, n + 1))
+    costs[:n, :n] = matrix
+    return costs
+
+def _two_opt_numpy(costs, tour: List[int], last: int) -> List[int]:
+    import numpy as np
+    t = np.array(tour + [len(costs) - 1])
+    i = np.arange(1, last)[:, None]
+    j = np.arange(1, last + 1)[None, :]
+    while True:
+        forward = np.concatenate(([0.0], np.cumsum(costs[t[:-1], t[1:]])))
+        backward = np.concatenate(([0.0], np.cumsum(costs[t[1:], t[:-1]])))
+        # Reversing t[i..j]: new edges at both ends, and the segment is now driven the other way
+        delta = (
+            costs[t[i - 1], t[j]] + costs[t[i], t[j + 1]]
+            - costs[t[i - 1], t[i]] - costs[t[j], t[j + 1]]
+            + (backward[j] - backward[i]) - (forward[j] - forward[i])
+        )
+        delta = np.where(j > i, delta, 0.0)
+        best = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[best] >= -1e-9:
+            return t[:-1].tolist()
+        a, b = best[0] + 1, best[1] + 1
+        t[a:b + 1] = t[a:b + 1][::-1].copy()
+
+def _two_opt_python(matrix: Sequence[Sequence[float]], tour: List[int], last: int) -> List[int]:
+    t = list(tour)
+    while True:
+        forward, backward = [0.0], [0.0]
+        for a, b in zip(t, t[1:]):
+            forward.append(forward[-1] + matrix[a][b])
+            backward.append(backward[-1] + matrix[b][a])
+        best, best_move = -1e-9, None
+        for i in range(1, last):
+            before = t[i - 1]
+            for j in range(i + 1, last + 1):
+                # Nothing follows the end of an open path
+                after = t[j + 1] if j + 1 < len(t) else None
+                delta = (
+                    matrix[before][t[j]] - matrix[before][t[i]]
+                    + (backward[j] - backward[i]) - (forward[j] - forward[i])
+                )
+                if after is not None:
+                    delta += matrix[t[i]][after] - matrix[t[j]][after]
+                if delta < best:
+                    best, best_move = delta, (i, j)
+        if best_move is None:
+            return t
+        i, j = best_move
+        t[i:j + 1] = reversed(t[i:j + 1])
+
+def order_stops(
+    matrix: Sequence[Sequence[float]],
+    round_trip: bool = False,
+    fixed_end: bool = False,
+    starts: int = 5
+) -> List[int]:
+    """Visiting order for stops 0..n-1 with travel costs `matrix[from][to]`, starting at stop 0
+
+    Orders are built nearest-neighbour first, then improved with 2-opt
+    (reversing the stretch between two stops whenever that is cheaper) until
+    no reversal helps. The matrix may be asymmetric; reversals account for
+    driving the stretch the other way. 2-opt stops at a local optimum, so this
+    is repeated with the `starts` nearest stops as the first hop and the
+    cheapest result wins. With `fixed_end` the last stop stays last; with
+    `round_trip` the cost of returning to stop 0 counts, though 0 is not
+    repeated at the end of the returned order.
+    """
+    n = len(matrix)
+    if n <= 2:
+        return list(range(n))
+    end = n - 1 if fixed_end else None
+    movable = [s for s in range(1, n) if s != end]
+    if NUMPY_AVAILABLE and n >= NUMPY_MIN_STOPS:
+        costs = _padded_costs(matrix)
+        two_opt = lambda tour, last: _two_opt_numpy(costs, tour, last)
+    else:
+        two_opt = lambda tour, last: _two_opt_python(matrix, tour, last)
+
+    best, best_cost = None, math.inf
+    for first in sorted(movable, key=lambda stop: (matrix[0][stop], stop))[:max(1, starts)]:
+        tour = [0] + _nearest_neighbour(matrix, first, [s for s in movable if s != first])
+        if end is not None:
+            tour.append(end)
+        if round_trip:
+            tour.append(0)
+        # Positions 1..last may move; anything after them (the fixed end, the return to 0) stays put
+        last = len(tour) - 1 - (end is not None or round_trip)
+        if last >= 2:
+            tour = two_opt(tour, last)
+        cost = route_cost(matrix, tour)
+        if cost < best_cost:
+            best, best_cost = tour, cost
+    return best[:-1] if round_trip else best
@@ -0,0 +1,176 @@
+import re
+import secrets
+from typing import Any, Dict, List, Optional, Tuple
+from starlette.requests import HTTPConnection
+from starlette.responses import Response
+from starlette.websockets import WebSocket
+from app.models.location import Place
+from app.utils.cache import TTLCache, MISSING
+from app.utils.gazetteer import GAZETTEER_ID_PREFIX
+from app.utils.metrics import SESSION_CONTEXT_SAVES, SESSIONS_ACTIVE
+from app.utils.resolution import normalize_place_text
+
+SESSION_COOKIE = "session_id"
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+# Words a follow-up uses to point back at the place being discussed
+_REFERENCES = {"there", "here", "it", "that", "this", "that place", "this place", "the place", "same place"}
+
+# Longest place name or endpoint kept per session, so a session's size stays bounded
+_MAX_TEXT = 200
+
+def is_reference(text: str) -> bool:
+    return normalize_place_text(text) in _REFERENCES or text.strip().lower() in _REFERENCES
+
+class ConversationState:
+    """What one conversation has resolved so far; small and bounded by design"""
+
+    __slots__ = ("places", "aliases", "focus", "origin", "destination", "mode")
+
+    # Places remembered per session, most recent first
+    MAX_PLACES = 5
+    # Search queries remembered as other names for the place they found
+    MAX_ALIASES = 10
+
+    def __init__(self):
+        self.places: List[Place] = []
+        # normalized query -> place_id of its top result
+        self.aliases: Dict[str, str] = {}
+        # Name of the place the conversation is currently about ("there", "it")
+        self.focus: Optional[str] = None
+        self.origin: Optional[str] = None
+        self.destination: Optional[str] = None
+        self.mode: Optional[str] = None
+
+    def remember_places(self, places: List[Place], query: Optional[str] = None):
+        if not places:
+            return
+        if query:
+            self.aliases.pop(normalize_place_text(query), None)
+            self.aliases[normalize_place_text(query)[:_MAX_TEXT]] = places[0].place_id
+            while len(self.aliases) > self.MAX_ALIASES:
+                del self.aliases[next(iter(self.aliases))]
+        kept = [p.model_copy(update={"photos": None, "name": p.name[:_MAX_TEXT]}) for p in places[:self.MAX_PLACES]]
+        known = {p.place_id for p in kept}
+        self.places = (kept + [p for p in self.places if p.place_id not in known])[:self.MAX_PLACES]
+        self.focus = kept[0].name
+
+    def remember_route(self, origin: str, destination: str, mode: str):
+        self.origin = origin[:_MAX_TEXT]
+        self.destination = destination[:_MAX_TEXT]
+        self.mode = mode
+        self.focus = self.destination
+
+    def find_place(self, text: str) -> Optional[Place]:
+        """A remembered place the text refers to, by name or as "it"/"there" """
+        if not self.places:
+            return None
+        if is_reference(text):
+            return self._focus_place()
+        key = normalize_place_text(text)
+        place_id = self.aliases.get(key)
+        for place in self.places:
+            if place.place_id == place_id or normalize_place_text(place.name) == key:
+                return place
+        return None
+
+    def _focus_place(self) -> Optional[Place]:
+        for place in self.places:
+            if place.name == self.focus:
+                return place
+        return None
+
+    def directions_endpoint(self, text: str) -> Optional[str]:
+        """`place_id:` form of an endpoint that is a remembered place, so it isn't geocoded again"""
+        place = self.find_place(text)
+        if place is None or not place.place_id or place.place_id in ("web-fallback", "mock-place-id"):
+            return None
+        if place.place_id.startswith(GAZETTEER_ID_PREFIX):
+            # Not a Google id; the coordinates work just as well
+            return f"{place.geometry.lat},{place.geometry.lng}"
+        return f"place_id:{place.place_id}"
+
+    def fill_references(self, llm_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in what a follow-up leaves implicit ("how do I get there by bike") from context"""
+        result = dict(llm_result)
+        if result.get("directions_query"):
+            destination = result.get("destination") or ""
+            if (not destination or is_reference(destination)) and self.focus:
+                result["destination"] = self.focus
+                SESSION_CONTEXT_SAVES.labels("reference").inc()
+            origin = result.get("origin") or ""
+            if (not origin or is_reference(origin)) and self.origin:
+                result["origin"] = self.origin
+                SESSION_CONTEXT_SAVES.labels("reference").inc()
+            if not result.get("travel_mode") and self.mode:
+                result["travel_mode"] = self.mode
+        location_query = result.get("location_query")
+        if location_query and is_reference(location_query) and self.focus:
+            result["location_query"] = self.focus
+            SESSION_CONTEXT_SAVES.labels("reference").inc()
+        return result
+
+    def prompt_context(self) -> Optional[str]:
+        """Short summary of the conversation for the LLM prompt"""
+        parts = []
+        if self.places:
+            parts.append("Places discussed: " + "; ".join(p.name for p in self.places))
+        if self.focus:
+            parts.append(f"Current place: {self.focus}")
+        if self.origin and self.destination:
+            parts.append(f"Last directions: from {self.origin} to {self.destination} by {self.mode or 'driving'}")
+        return ". ".join(parts) or None
+
+class SessionStore:
+    def __init__(self, ttl: float = 1800.0, max_sessions: int = 10000):
+        """
+        Conversation state per session cookie
+
+        Idle sessions expire after `ttl` seconds; past `max_sessions` the least
+        recently used one is evicted.
+        """
+        self._sessions = TTLCache("sessions", ttl=ttl, max_entries=max_sessions)
+
+    def get_or_create(self, session_id: Optional[str]) -> Tuple[str, ConversationState]:
+        """Return the session for the cookie value, starting a new one if it is unknown or expired
+
+        A new session always gets a new random id, never the one the client
+        sent: otherwise a planted cookie would name a session its planter
+        could later read (session fixation).
+        """
+        # Keep sessions_active honest: expired sessions leave the count, not just evicted ones
+        if self._sessions.purge_expired():
+            SESSIONS_ACTIVE.set(len(self._sessions))
+        if session_id and _SESSION_ID.match(session_id):
+            state = self._sessions.get(session_id)
+            if state is not MISSING:
+                # Re-store to push the expiry out: sessions expire after `ttl` of inactivity
+                self._sessions.set(session_id, state)
+                return session_id, state
+        session_id = secrets.token_urlsafe(16)
+        state = ConversationState()
+        self._sessions.set(session_id, state)
+        SESSIONS_ACTIVE.set(len(self._sessions))
+        return session_id, state
+
+    def for_connection(self, conn: HTTPConnection, response: Optional[Response] = None) -> ConversationState:
+        """Session for a request, setting the cookie on `response` when a new one starts"""
+        cookie = conn.cookies.get(SESSION_COOKIE)
+        session_id, state = self.get_or_create(cookie)
+        if response is not None and session_id != cookie:
+            response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+        return state
+
+    def for_websocket(self, websocket: WebSocket) -> Tuple[ConversationState, List[Tuple[bytes, bytes]]]:
+        """Session for a WebSocket, and the handshake headers that set its cookie when a new one starts"""
+        cookie = websocket.cookies.get(SESSION_COOKIE)
+        session_id, state = self.get_or_create(cookie)
+        if session_id == cookie:
+            return state, []
+        return state, [(b"set-cookie", _cookie_header(session_id))]
+
+def _cookie_header(session_id: str) -> bytes:
+    response = Response()
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    return response.headers["set-cookie"].encode("latin-1")
@@ -0,0 +1,98 @@
+import hashlib
+import struct
+from array import array
+from typing import Dict, List, Tuple
+
+# Joins a key's kind and arguments; normalized queries never contain it
+_SEPARATOR = "\x1f"
+
+class CountMinSketch:
+    def __init__(self, width: int = 8192, depth: int = 4):
+        """
+        Approximate per-key counts in fixed memory (`width * depth` 32-bit counters)
+
+        Estimates never undercount; they overcount by at most a small share of
+        the total, which is plenty to tell popular keys from the long tail.
+        """
+        self.width = width
+        self.depth = depth
+        self._rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+        self._unpack = struct.Struct(f"<{depth}I").unpack
+
+    def _indexes(self, key: str) -> List[int]:
+        # A stable hash (unlike hash()), so counts mean the same thing across processes and restarts
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        width = self.width
+        return [h % width for h in self._unpack(digest)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Count `key` and return its new estimate"""
+        estimate = 0xFFFFFFFF
+        for row, index in zip(self._rows, self._indexes(key)):
+            value = row[index] + count
+            if value > 0xFFFFFFFF:
+                value = 0xFFFFFFFF
+            row[index] = value
+            if value < estimate:
+                estimate = value
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def decay(self):
+        """Halve every counter, so old traffic weighs less than recent traffic"""
+        for row in self._rows:
+            for index in range(self.width):
+                row[index] >>= 1
+
+class AccessHistory:
+    def __init__(self, capacity: int = 500, width: int = 8192, depth: int = 4):
+        """
+        Most requested keys, tracked with a count-min sketch plus a top-`capacity` table
+
+        Each key is a kind ("search", "directions") and its normalized
+        arguments. Only the top table stores keys; everything else lives in
+        the sketch, so memory stays fixed however many distinct queries come in.
+        """
+        self.capacity = capacity
+        self.sketch = CountMinSketch(width, depth)
+        # encoded key -> estimated count; grows to twice `capacity`, then is cut back to the top `capacity`
+        self._top: Dict[str, int] = {}
+        # Smallest count kept at the last cut; keys estimated at or below it can't get in
+        self._floor = 0
+
+    def __len__(self) -> int:
+        return min(len(self._top), self.capacity)
+
+    def record(self, kind: str, *args: str, count: int = 1):
+        key = _SEPARATOR.join((kind, *args))
+        estimate = self.sketch.add(key, count)
+        if key in self._top or estimate > self._floor:
+            self._top[key] = estimate
+            if len(self._top) >= 2 * self.capacity:
+                self._prune()
+
+    def _prune(self):
+        # Cutting in batches keeps recording O(1) amortized, even when the long tail churns
+        kept = sorted(self._top.items(), key=lambda item: item[1], reverse=True)[:self.capacity]
+        self._top = dict(kept)
+        self._floor = kept[-1][1] if kept else 0
+
+    def top(self, n: int) -> List[Tuple[str, List[str], int]]:
+        """The `n` most requested keys as (kind, args, count), most requested first"""
+        ranked = sorted(self._top.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(parts[0], parts[1:], count) for parts, count in ((k.split(_SEPARATOR), c) for k, c in ranked)]
+
+    def decay(self):
+        self.sketch.decay()
+        self._top = {key: count >> 1 for key, count in self._top.items() if count > 1}
+        self._floor >>= 1
+
+    def snapshot(self) -> List[Tuple[str, List[str], int]]:
+        return self.top(self.capacity)
+
+    def restore(self, entries: List[Tuple[str, List[str], int]]):
+        """Seed the history with a snapshot, e.g. the one the previous process saved"""
+        for kind, args, count in entries:
+            self.record(kind, *args, count=count)
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.utils.metrics import CACHE_WARMER_PREFETCHES, CACHE_WARMER_TRACKED_KEYS
+from app.utils.result_cache import ResultCache
+from app.utils.sketch import AccessHistory
+
+logger = logging.getLogger(__name__)
+
+class CacheWarmer:
+    def __init__(
+        self,
+        results: ResultCache,
+        history: AccessHistory,
+        top_n: int = 100,
+        budget: int = 50,
+        rate: float = 2.0,
+        interval: float = 3600.0,
+        decay_interval: float = 86400.0,
+        snapshot_path: Optional[str] = None,
+        workers: int = 1
+    ):
+        """
+        Keep the most requested searches and routes in the result cache
+
+        On startup, and then every `interval` seconds, the `top_n` most
+        requested entries of `history` that aren't fresh in the cache are
+        fetched again. At most `budget` upstream calls are made per run, no
+        faster than `rate` per second, across all `workers` server processes:
+        each process warms its own cache with its share of both. The `top_n`
+        entries are saved to `snapshot_path` (readable by the owner only)
+        after every run and at shutdown, and loaded from it on startup, so a
+        freshly deployed process warms what the previous one was serving.
+
+        Args:
+            results: Cache to warm
+            history: Request counts, fed by `results`
+            top_n: Most requested entries considered per run
+            budget: Upstream calls per run at most, for all workers together
+            rate: Upstream calls per second at most, for all workers together
+            interval: Seconds between runs
+            decay_interval: Seconds between halvings of all counts, so old favourites fade
+            snapshot_path: JSON file the top entries are persisted to (None disables persistence)
+            workers: Server processes each running a warmer
+        """
+        workers = max(1, workers)
+        self.results = results
+        self.history = history
+        self.top_n = top_n
+        self.budget = max(1, math.ceil(budget / workers))
+        self.rate = rate / workers
+        self.interval = interval
+        self.decay_interval = decay_interval
+        self.snapshot_path = snapshot_path
+        self._last_decay = time.monotonic()
+
+    async def warm(self) -> Dict[str, int]:
+        """Run one warming pass; returns how many entries were fresh, fetched ok or failed"""
+        outcomes: Counter = Counter()
+        spent = 0
+        for kind, args, _ in self.history.top(self.top_n):
+            if spent >= self.budget:
+                break
+            outcome = await self.results.prefetch(kind, args)
+            outcomes[outcome] += 1
+            CACHE_WARMER_PREFETCHES.labels(kind, outcome).inc()
+            if outcome != "fresh":
+                spent += 1
+                await asyncio.sleep(1.0 / self.rate)
+        CACHE_WARMER_TRACKED_KEYS.set(len(self.history))
+        logger.info(
+            "Cache warming: %d fetched, %d failed, %d already fresh",
+            outcomes["ok"], outcomes["failed"], outcomes["fresh"]
+        )
+        return dict(outcomes)
+
+    async def run(self):
+        """Load the snapshot, then warm on startup and every `interval` seconds until cancelled"""
+        # The history is only touched from the event loop; just the file write runs in a thread
+        self.load_snapshot()
+        while True:
+            try:
+                await self.warm()
+                if time.monotonic() - self._last_decay >= self.decay_interval:
+                    self.history.decay()
+                    self._last_decay = time.monotonic()
+                await run_in_threadpool(self._write_snapshot, self.history.top(self.top_n))
+            except Exception as e:
+                logger.warning("Cache warming failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)["entries"]
+            self.history.restore(entries)
+            logger.info("Loaded %d cache warming entries from %s", len(entries), self.snapshot_path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignoring unreadable cache warming snapshot %s: %s", self.snapshot_path, e)
+
+    def save_snapshot(self):
+        self._write_snapshot(self.history.top(self.top_n))
+
+    def _write_snapshot(self, entries: List[Tuple[str, List[str], int]]):
+        # With nothing recorded yet, keep the previous process's snapshot rather than emptying it
+        if not self.snapshot_path or not entries:
+            return
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write then rename, so workers saving at the same time never leave a torn file. The entries
+        # are users' queries and route endpoints (home addresses, say): owner-only permissions
+        temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+            json.dump({"saved_at": time.time(), "entries": entries}, f)
+        os.replace(temp_path, self.snapshot_path)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Memory per cached Maps result: Pydantic model trees against the compact encoding.
+
+Fills a TTLCache with --entries search results and --entries routes the way
+ResultCache does, once holding the models as they are and once packed with
+app.utils.compact, and reports the heap each entry holds (via tracemalloc),
+plus how long packing and a hit's decode take.
+
+Every entry is built from its own freshly parsed JSON payload, as the
+googlemaps client does, so entries share no strings with each other.
+
+Run with: python -m benchmarks.cache_memory --entries 500 --steps 50
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+# The clients read their configuration at construction time
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIza-benchmark-key")
+
+from app.utils.cache import TTLCache
+from app.utils.compact import pack, unpack
+from benchmarks import fixtures
+from benchmarks.micro import _maps_client
+
+
+def _build(kind: str, results: int, steps: int) -> Callable[[], Any]:
+    if kind == "search":
+        payload = json.dumps(fixtures.places_payload(results))
+        client = _maps_client()
+        def build():
+            client.client.places_result = json.loads(payload)
+            return client.search_place("pizza in new york")
+    else:
+        payload = json.dumps(fixtures.direction_payload(steps))
+        client = _maps_client()
+        def build():
+            client.client.directions_result = json.loads(payload)
+            return client.get_directions("Jakarta", "Bandung")
+    return build
+
+
+def measure(kind: str, entries: int, results: int, steps: int, compact: bool) -> Dict[str, Any]:
+    build = _build(kind, results, steps)
+    codec = {"pack": pack, "unpack": unpack} if compact else {}
+    cache = TTLCache(kind, ttl=3600, max_entries=entries, **codec)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store_s = 0.0
+    for i in range(entries):
+        with contextlib.redirect_stdout(io.StringIO()):
+            value = build()
+        started = time.perf_counter()
+        cache.set(i, value)
+        store_s += time.perf_counter() - started
+        del value
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for i in range(entries):
+        cache.get(i)
+    hit_s = time.perf_counter() - started
+    return {
+        "bytes_per_entry": round(held / entries),
+        "store_us": round(store_s / entries * 1e6, 1),
+        "hit_us": round(hit_s / entries * 1e6, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the memory each cached search and route takes")
+    parser.add_argument("--entries", type=int, default=500, help="Entries of each kind to cache")
+    parser.add_argument("--results", type=int, default=20, help="Places per search result")
+    parser.add_argument("--steps", type=int, default=50, help="Steps per route")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for kind in ("search", "directions"):
+        models = measure(kind, args.entries, args.results, args.steps, compact=False)
+        packed = measure(kind, args.entries, args.results, args.steps, compact=True)
+        report[kind] = {
+            "models": models,
+            "compact": packed,
+            "ratio": round(models["bytes_per_entry"] / packed["bytes_per_entry"], 1),
+        }
+        print(f"{kind:<11} models {models['bytes_per_entry']:>9,} B/entry   compact {packed['bytes_per_entry']:>8,} B/entry"
+              f"   ({report[kind]['ratio']}x; decode per hit {packed['hit_us']} us)")
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
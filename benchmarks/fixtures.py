@@ -0,0 +1,55 @@
+"""
+Realistic, deterministic fixtures for the microbenchmarks.
+
+The payloads reuse the stub upstream generators so the benchmarks and the
+load tests exercise the same response shapes.
+"""
+
+import random
+from typing import Any, Dict, List
+
+from benchmarks.stub_upstreams import fake_directions, fake_distance_matrix, fake_llm_text, fake_places
+
+
+def distinct_ips(count: int, seed: int = 42) -> List[str]:
+    """Return `count` unique IPv4 addresses in random order"""
+    rng = random.Random(seed)
+    ips = [f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}" for i in range(count)]
+    rng.shuffle(ips)
+    return ips
+
+
+def direction_payload(steps: int) -> List[Dict[str, Any]]:
+    """Raw googlemaps `directions()` result with one route of `steps` steps"""
+    return fake_directions("Jakarta", "Bandung", "driving", steps)["routes"]
+
+
+def places_payload(results: int) -> Dict[str, Any]:
+    """Raw googlemaps `places()` result"""
+    return fake_places("pizza in new york", results)
+
+
+def travel_time_matrix(stops: int) -> List[List[float]]:
+    """Asymmetric travel times in seconds between `stops` made-up places in one city"""
+    names = [f"Delivery stop {i}" for i in range(stops)]
+    rows = fake_distance_matrix(names, names, "driving")["rows"]
+    return [
+        [0.0 if i == j else float(element["duration"]["value"]) for j, element in enumerate(row["elements"])]
+        for i, row in enumerate(rows)
+    ]
+
+
+def long_llm_output(words: int, directions: bool = False) -> str:
+    """Model output with `words` words of chatter before the JSON block"""
+    prompt = "User: how do I get from Central Park to Times Square" if directions else "User: Where is the Eiffel Tower"
+    return fake_llm_text(prompt, words)
+
+
+FALLBACK_PROMPTS = [
+    "Where is the Eiffel Tower",
+    "Show me directions from Central Park to Times Square by walking",
+    "how do i go to bandung from jakarta",
+    "Find ramen near Shinjuku station",
+    "What is the best route to the airport from downtown by train",
+    "tell me about the Louvre museum in Paris",
+]
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Load time, resident memory and lookup latency of the offline gazetteer.
+
+Builds a gazetteer file from a GeoNames dump, a CSV/TSV, or (by default) a
+synthetic dump of --rows places, then measures in a fresh subprocess:
+
+    - how long opening the memory-mapped file takes and how much RSS it adds
+    - exact, "name, region", prefix and fuzzy lookup latency
+    - RSS after the lookups, i.e. what the touched pages cost; mapped file
+      pages (RssFile) are page cache the kernel can drop, unlike heap (RssAnon)
+
+With --baseline, the same measurements are taken for the obvious alternative:
+reading the dump into a dict of name -> places.
+
+Run with: python -m benchmarks.gazetteer --rows 3000000 --baseline
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from app.utils.gazetteer import Gazetteer, build, read_geonames, read_table
+from app.utils.resolution import normalize_place_text
+
+_SYLLABLES = [c + v for c in "bcdfghjklmnprstvwz" for v in "aeiou"] + ["san", "ber", "vel", "dor", "qua", "zen", "por", "gar"]
+_SUFFIXES = ["", "", "", " city", " heights", " park", " station", " bay", " springs", " museum"]
+_REGIONS = ["France", "Texas, USA", "Indonesia", "Brazil", "Japan", "Kenya", "Germany", "India"]
+
+
+def rss_mb(kind: str = "VmRSS") -> float:
+    """Resident set size of this process in MB: VmRSS (total), RssAnon (heap) or RssFile (mapped files)"""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(f"{kind}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if kind != "VmRSS":
+        return 0.0
+    import resource
+    # Peak rather than current where /proc is unavailable (kilobytes on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_dump(path: str, rows: int, seed: int = 7):
+    """Write a TSV of made-up places with a long-tailed population distribution"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("name\tlat\tlng\taddress\ttypes\tpopulation\n")
+        for _ in range(rows):
+            name = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+            name += rng.choice(_SUFFIXES)
+            region = rng.choice(_REGIONS)
+            population = int(rng.paretovariate(1.2) * 50) if rng.random() < 0.3 else 0
+            f.write(f"{name}\t{rng.uniform(-60, 70):.5f}\t{rng.uniform(-180, 180):.5f}\t"
+                    f"{name}, {region}\tlocality\t{population}\n")
+
+
+def _sample_queries(source: str, geonames: bool, count: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    names = []
+    rows = read_geonames(source) if geonames else read_table(source)
+    for i, (entry, _) in enumerate(rows):
+        # Reservoir sampling keeps the sample uniform over the whole file
+        if len(names) < count:
+            names.append(entry.name)
+        else:
+            j = rng.randint(0, i)
+            if j < count:
+                names[j] = entry.name
+    return names
+
+
+def _timed(fn, queries: List[str]) -> Dict[str, float]:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "p50_us": round(statistics.median(latencies) * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99) - 1] * 1e6, 1),
+    }
+
+
+def _typo(name: str, rng: random.Random) -> str:
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:]
+
+
+def measure_gazetteer(path: str, queries: List[str]) -> Dict[str, Any]:
+    rng = random.Random(3)
+    before, before_file = rss_mb(), rss_mb("RssFile")
+    started = time.perf_counter()
+    gazetteer = Gazetteer(path)
+    load_s = time.perf_counter() - started
+    after_load = rss_mb()
+    report = {
+        "load_ms": round(load_s * 1000, 3),
+        "rss_added_by_load_mb": round(after_load - before, 1),
+        "exact": _timed(gazetteer.exact, queries),
+        "lookup": _timed(gazetteer.lookup, queries),
+        "prefix": _timed(lambda q: gazetteer.prefix(q[:3], 10), queries),
+        "fuzzy": _timed(lambda q: gazetteer.fuzzy(q, 5), [_typo(q, rng) for q in queries[:200]]),
+    }
+    report["rss_after_lookups_mb"] = round(rss_mb() - before, 1)
+    report["of_which_mapped_file_mb"] = round(rss_mb("RssFile") - before_file, 1)
+    return report
+
+
+def measure_baseline(source: str, geonames: bool, queries: List[str]) -> Dict[str, Any]:
+    before = rss_mb()
+    started = time.perf_counter()
+    index: Dict[str, List[tuple]] = {}
+    for entry, aliases in (read_geonames(source) if geonames else read_table(source)):
+        for alias in (entry.name, *aliases):
+            index.setdefault(normalize_place_text(alias), []).append(entry)
+    load_s = time.perf_counter() - started
+    return {
+        "load_ms": round(load_s * 1000, 1),
+        "rss_added_by_load_mb": round(rss_mb() - before, 1),
+        "exact": _timed(lambda q: index.get(normalize_place_text(q), []), queries),
+    }
+
+
+def _child(args: argparse.Namespace) -> int:
+    # Each measurement runs in its own process, so RSS isn't polluted by building or the other measurement
+    queries = json.loads(sys.stdin.read())
+    if args.child == "gazetteer":
+        result = measure_gazetteer(args.output, queries)
+    else:
+        result = measure_baseline(args.source, args.geonames, queries)
+    print(json.dumps(result))
+    return 0
+
+
+def _run_child(kind: str, args: argparse.Namespace, queries: List[str]) -> Dict[str, Any]:
+    command = [sys.executable, "-m", "benchmarks.gazetteer", "--child", kind, "--source", args.source, "--output", args.output]
+    if args.geonames:
+        command.append("--geonames")
+    completed = subprocess.run(command, input=json.dumps(queries), capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure gazetteer load time, memory and lookup latency")
+    parser.add_argument("--source", default=None, help="GeoNames dump or CSV/TSV (default: generate a synthetic one)")
+    parser.add_argument("--geonames", action="store_true", help="--source is in GeoNames format")
+    parser.add_argument("--rows", type=int, default=3_000_000, help="Places in the synthetic dump")
+    parser.add_argument("--output", default=None, help="Where to write the built file (default: a temp file)")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--baseline", action="store_true", help="Also measure an in-memory dict built from the dump")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this file")
+    parser.add_argument("--child", choices=("gazetteer", "baseline"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return _child(args)
+
+    workdir = tempfile.mkdtemp(prefix="gazetteer-bench-")
+    if args.source is None:
+        args.source = os.path.join(workdir, "places.tsv")
+        started = time.perf_counter()
+        synthetic_dump(args.source, args.rows)
+        print(f"Generated {args.rows} synthetic places in {time.perf_counter() - started:.1f}s")
+    args.output = args.output or os.path.join(workdir, "places.gaz")
+
+    started = time.perf_counter()
+    stats = build(read_geonames(args.source) if args.geonames else read_table(args.source), args.output)
+    build_s = time.perf_counter() - started
+    print(f"Built {args.output}: {stats['records']} places, {stats['keys']} names, "
+          f"{stats['bytes'] / 1e6:.1f} MB in {build_s:.1f}s")
+
+    queries = _sample_queries(args.source, args.geonames, args.queries)
+    report = {"places": stats["records"], "file_mb": round(stats["bytes"] / 1e6, 1), "build_s": round(build_s, 1)}
+    report["gazetteer"] = _run_child("gazetteer", args, queries)
+    if args.baseline:
+        report["baseline_dict"] = _run_child("baseline", args, queries)
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
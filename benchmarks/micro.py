@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the CPU work done in-process on every request.
+
+Run the suite and save results:
+
+    python -m benchmarks.micro --output bench-results/$(git rev-parse --short HEAD).json
+
+Compare two saved runs (exits non-zero if anything regressed past the threshold):
+
+    python -m benchmarks.micro --compare old.json new.json --threshold 0.10
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# The clients read their configuration at construction time
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIza-benchmark-key")
+
+from app.models.location import Geometry, Place
+from app.utils.compact import pack, unpack
+from app.utils.llm_client import LLMClient
+from app.utils.maps_client import MapsClient
+from app.utils.metrics import LLM_REQUEST_STAGE_SECONDS, track_upstream
+from app.utils.rate_limiter import RateLimiter
+from app.utils.ranking import rank_places
+from app.utils.route_optimizer import order_stops
+from app.utils.sketch import AccessHistory
+from benchmarks import fixtures
+
+
+class Benchmark:
+    """A named benchmark: `setup()` builds state, `run(state)` is the timed operation"""
+
+    def __init__(self, name: str, setup: Callable[[], Any], run: Callable[[Any], Any], iterations: int):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.iterations = iterations
+
+
+class _FakeGoogleMaps:
+    """Returns canned upstream payloads so only our processing is timed"""
+
+    def __init__(self, directions_result=None, places_result=None):
+        self.directions_result = directions_result
+        self.places_result = places_result
+
+    def directions(self, **kwargs):
+        return self.directions_result
+
+    def places(self, query, **kwargs):
+        return self.places_result
+
+
+class _FakeResponse:
+    status_code = 200
+
+    def __init__(self, text: str):
+        self._body = {"response": text, "done": True}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class _FakeSession:
+    """Stands in for the LLM client's HTTP session during the benchmark"""
+
+    def __init__(self, text: str):
+        self.response = _FakeResponse(text)
+
+    def post(self, *args, **kwargs):
+        return self.response
+
+
+def _maps_client(**fake_kwargs) -> MapsClient:
+    client = MapsClient()
+    client.available = True
+    client.client = _FakeGoogleMaps(**fake_kwargs)
+    return client
+
+
+def _quiet(fn: Callable[[], Any]) -> Any:
+    # The clients print on some paths; keep the terminal readable but still pay for the write
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn()
+
+
+# --- Benchmark definitions -------------------------------------------------
+
+def _rate_limiter_setup():
+    ips = fixtures.distinct_ips(100_000)
+    limiter = RateLimiter(max_requests=60, time_window=60)
+    for ip in ips:
+        limiter.is_allowed(ip)
+    return {"limiter": limiter, "ips": ips, "i": 0}
+
+
+def _rate_limiter_run(state):
+    i = state["i"]
+    state["i"] = i + 1
+    state["limiter"].is_allowed(state["ips"][i % len(state["ips"])])
+
+
+def _hot_client_setup():
+    # A single client sitting at its limit: every call scans a full window and is rejected
+    limiter = RateLimiter(max_requests=60, time_window=60)
+    for _ in range(60):
+        limiter.is_allowed("203.0.113.7")
+    return limiter
+
+
+def _fallback_setup():
+    return {"client": _quiet(LLMClient), "i": 0}
+
+
+def _fallback_run(state):
+    i = state["i"]
+    state["i"] = i + 1
+    prompt = fixtures.FALLBACK_PROMPTS[i % len(fixtures.FALLBACK_PROMPTS)]
+    _quiet(lambda: state["client"]._fallback_response(prompt))
+
+
+def _process_prompt_setup(words: int):
+    def setup():
+        client = _quiet(LLMClient)
+        client.session = _FakeSession(fixtures.long_llm_output(words))
+        return client
+    return setup
+
+
+def _process_prompt_run(client):
+    result = client.process_prompt("Where is the Eiffel Tower")
+    assert result.get("location_query"), "JSON extraction failed"
+
+
+def _directions_setup(steps: int):
+    def setup():
+        return _maps_client(directions_result=fixtures.direction_payload(steps))
+    return setup
+
+
+def _places_setup():
+    return _maps_client(places_result=fixtures.places_payload(20))
+
+
+def _map_html_setup():
+    client = _maps_client()
+    place = Place(
+        place_id="bench-place",
+        name="Eiffel Tower",
+        formatted_address="Champ de Mars, 5 Av. Anatole France, 75007 Paris, France",
+        geometry=Geometry(lat=48.8584, lng=2.2945),
+        types=["tourist_attraction"],
+    )
+    return {"client": client, "place": place}
+
+
+def _ranking_setup(results: int):
+    def setup():
+        return _maps_client(places_result=fixtures.places_payload(results)).search_place("pizza in new york").places
+    return setup
+
+
+def _access_history_setup():
+    # A full table plus a long tail, so most records go through the sketch only
+    history = AccessHistory(capacity=500)
+    queries = [f"pizza near street {i}" for i in range(20_000)]
+    for i, query in enumerate(queries):
+        history.record("search", query, count=1 + (i % 50 == 0) * 100)
+    return {"history": history, "queries": queries, "next": 0}
+
+
+def _access_history_run(state):
+    state["next"] = (state["next"] + 1) % len(state["queries"])
+    state["history"].record("search", state["queries"][state["next"]])
+
+
+def _directions_html_setup(steps: int):
+    def setup():
+        client = _maps_client(directions_result=fixtures.direction_payload(steps))
+        return {"client": client, "directions": client.get_directions("Jakarta", "Bandung")}
+    return setup
+
+
+def _search_result():
+    return _quiet(lambda: _maps_client(places_result=fixtures.places_payload(20)).search_place("pizza in new york"))
+
+
+def _directions_result(steps: int):
+    def setup():
+        return _quiet(lambda: _maps_client(directions_result=fixtures.direction_payload(steps)).get_directions("Jakarta", "Bandung"))
+    return setup
+
+
+BENCHMARKS: List[Benchmark] = [
+    Benchmark("rate_limiter.is_allowed[100k_ips]", _rate_limiter_setup, _rate_limiter_run, 20_000),
+    Benchmark("rate_limiter.is_allowed[hot_client]", _hot_client_setup,
+              lambda limiter: limiter.is_allowed("203.0.113.7"), 2_000),
+    Benchmark("llm._fallback_response", _fallback_setup, _fallback_run, 5_000),
+    Benchmark("llm.process_prompt[json_200_words]", _process_prompt_setup(200), _process_prompt_run, 2_000),
+    Benchmark("llm.process_prompt[json_5k_words]", _process_prompt_setup(5_000), _process_prompt_run, 500),
+    Benchmark("maps.search_place[20_results]", _places_setup,
+              lambda client: client.search_place("pizza in new york"), 1_000),
+    Benchmark("maps.get_directions[50_steps]", _directions_setup(50),
+              lambda client: client.get_directions("Jakarta", "Bandung"), 500),
+    Benchmark("maps.get_directions[1000_steps]", _directions_setup(1_000),
+              lambda client: client.get_directions("Jakarta", "Bandung"), 30),
+    Benchmark("metrics.stage_timer", lambda: LLM_REQUEST_STAGE_SECONDS.labels("bench"),
+              lambda child: child.time().__enter__().__exit__(None, None, None), 50_000),
+    Benchmark("metrics.track_upstream", lambda: None,
+              lambda _: track_upstream("bench").__enter__().__exit__(None, None, None), 50_000),
+    Benchmark("maps.generate_map_html", _map_html_setup,
+              lambda s: s["client"].generate_map_html(s["place"]), 20_000),
+    Benchmark("ranking.rank_places[20_results]", _ranking_setup(20),
+              lambda places: rank_places(places, 40.7580, -73.9855, radius_km=50), 2_000),
+    Benchmark("ranking.rank_places[1000_results]", _ranking_setup(1_000),
+              lambda places: rank_places(places, 40.7580, -73.9855, radius_km=50), 50),
+    Benchmark("route_optimizer.order_stops[10_stops]", lambda: fixtures.travel_time_matrix(10), order_stops, 500),
+    Benchmark("route_optimizer.order_stops[25_stops]", lambda: fixtures.travel_time_matrix(25), order_stops, 100),
+    Benchmark("route_optimizer.order_stops[50_stops]", lambda: fixtures.travel_time_matrix(50), order_stops, 20),
+    Benchmark("sketch.access_history.record[long_tail]", _access_history_setup, _access_history_run, 20_000),
+    Benchmark("maps.generate_directions_map_html[50_steps]", _directions_html_setup(50),
+              lambda s: s["client"].generate_directions_map_html(s["directions"]), 2_000),
+    Benchmark("maps.generate_directions_map_html[1000_steps]", _directions_html_setup(1_000),
+              lambda s: s["client"].generate_directions_map_html(s["directions"]), 200),
+    Benchmark("compact.pack[search_20_results]", _search_result, pack, 2_000),
+    Benchmark("compact.unpack[search_20_results]", lambda: pack(_search_result()), unpack, 2_000),
+    Benchmark("compact.pack[directions_50_steps]", _directions_result(50), pack, 2_000),
+    Benchmark("compact.unpack[directions_50_steps]", lambda: pack(_directions_result(50)()), unpack, 2_000),
+    Benchmark("compact.unpack[directions_1000_steps]", lambda: pack(_directions_result(1_000)()), unpack, 100),
+]
+
+
+# --- Runner ----------------------------------------------------------------
+
+def measure(bench: Benchmark, rounds: int, scale: float) -> Dict[str, Any]:
+    """Time `rounds` rounds of the benchmark and return per-operation statistics"""
+    state = bench.setup()
+    iterations = max(1, int(bench.iterations * scale))
+
+    # Warm up caches and any lazy initialisation
+    for _ in range(max(1, iterations // 10)):
+        bench.run(state)
+
+    per_op = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            bench.run(state)
+        per_op.append((time.perf_counter() - start) / iterations)
+
+    return {
+        "iterations": iterations,
+        "rounds": rounds,
+        "min_us": round(min(per_op) * 1e6, 3),
+        "median_us": round(statistics.median(per_op) * 1e6, 3),
+        "mean_us": round(statistics.mean(per_op) * 1e6, 3),
+        "stdev_us": round(statistics.stdev(per_op) * 1e6, 3) if rounds > 1 else 0.0,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(selected: Optional[str], rounds: int, scale: float) -> Dict[str, Any]:
+    results = {}
+    for bench in BENCHMARKS:
+        if selected and selected not in bench.name:
+            continue
+        stats = measure(bench, rounds, scale)
+        results[bench.name] = stats
+        print(f"{bench.name:<50}{stats['median_us']:>14.3f} us/op  (min {stats['min_us']:.3f}, stdev {stats['stdev_us']:.3f})")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "rounds": rounds,
+            "scale": scale,
+        },
+        "results": results,
+    }
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print per-benchmark changes in median time; return 1 if any regressed past `threshold`"""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)["results"]
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)["results"]
+
+    regressed = []
+    print(f"{'benchmark':<50}{'old us':>12}{'new us':>12}{'change':>10}")
+    for name in sorted(set(old) | set(new)):
+        if name not in old or name not in new:
+            print(f"{name:<50}{'(only in ' + ('new' if name in new else 'old') + ')':>34}")
+            continue
+        before = old[name]["median_us"]
+        after = new[name]["median_us"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<50}{before:>12.3f}{after:>12.3f}{change:>+10.1%}{flag}")
+
+    if regressed:
+        print(f"\n{len(regressed)} benchmark(s) regressed by more than {threshold:.0%}")
+        return 1
+    return 0
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run the in-process microbenchmarks")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this file")
+    parser.add_argument("--filter", default=None, help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply iteration counts (e.g. 0.1 for a quick run)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved result files")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+
+    report = run_suite(args.filter, args.rounds, args.scale)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Replay a JSONL workload against the running app at a target request rate.
+
+Each workload line is one request:
+
+    {"endpoint": "search", "query": "pizza in new york"}
+    {"endpoint": "directions", "origin": "Central Park", "destination": "Times Square", "mode": "walking"}
+    {"endpoint": "llm", "prompt": "Where is the Eiffel Tower"}
+
+The workload is replayed in order (and looped) on an open-loop schedule, so
+a slow server does not slow down the arrival rate. Latency is measured from
+each request's scheduled send time, which keeps queueing delay in the
+numbers instead of hiding it.
+
+The report includes per-cache hit rates and the event loop lag over the run,
+taken from the app's /metrics before and after, so a cold and a warmed
+server, or two offload modes, can be compared.
+
+Run with: python -m benchmarks.replay benchmarks/workloads/sample.jsonl --qps 20 --duration 30
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+ENDPOINTS = ("search", "directions", "llm")
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    """One keep-alive session per worker thread"""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def load_workload(path: str) -> List[Dict[str, Any]]:
+    """Read and validate a JSONL workload file"""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line)
+            if entry.get("endpoint") not in ENDPOINTS:
+                raise ValueError(f"{path}:{line_number}: endpoint must be one of {', '.join(ENDPOINTS)}")
+            entries.append(entry)
+    if not entries:
+        raise ValueError(f"{path}: workload is empty")
+    return entries
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def send(base_url: str, entry: Dict[str, Any], timeout: float) -> requests.Response:
+    """Issue the HTTP request described by one workload entry"""
+    endpoint = entry["endpoint"]
+    session = _session()
+    if endpoint == "search":
+        return session.post(f"{base_url}/api/search", json={"query": entry["query"]}, timeout=timeout)
+    if endpoint == "directions":
+        params = {
+            "origin": entry["origin"],
+            "destination": entry["destination"],
+            "mode": entry.get("mode", "driving"),
+        }
+        return session.get(f"{base_url}/api/directions", params=params, timeout=timeout)
+    return session.post(f"{base_url}/api/llm", json={"prompt": entry["prompt"]}, timeout=timeout)
+
+
+_CACHE_SAMPLE = re.compile(r'^cache_requests_total\{cache="([^"]+)",result="([^"]+)"\} (\S+)$')
+
+
+def scrape_cache_counts(base_url: str, timeout: float) -> Optional[Dict[str, Dict[str, float]]]:
+    """cache_requests_total from the app's /metrics as {cache: {result: count}}, or None if unavailable"""
+    try:
+        response = requests.get(f"{base_url}/metrics", timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    counts: Dict[str, Dict[str, float]] = defaultdict(dict)
+    for line in response.text.splitlines():
+        match = _CACHE_SAMPLE.match(line)
+        if match:
+            counts[match.group(1)][match.group(2)] = float(match.group(3))
+    return counts
+
+
+def cache_hit_rates(before: Dict[str, Dict[str, float]], after: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+    """Lookups per outcome during the run, and the share answered without an upstream call"""
+    rates = {}
+    for cache, results in sorted(after.items()):
+        delta = {result: count - before.get(cache, {}).get(result, 0.0) for result, count in results.items()}
+        total = sum(delta.values())
+        if total <= 0:
+            continue
+        served = delta.get("hit", 0.0) + delta.get("stale", 0.0)
+        rates[cache] = {
+            "lookups": int(total),
+            **{result: int(n) for result, n in sorted(delta.items())},
+            "hit_rate": round(served / total, 3),
+        }
+    return rates
+
+
+_LAG_SAMPLE = re.compile(r'^event_loop_lag_seconds_(bucket\{le="([^"]+)"\}|sum|count) (\S+)$')
+
+
+def scrape_loop_lag(base_url: str, timeout: float) -> Optional[Dict[str, float]]:
+    """event_loop_lag_seconds from the app's /metrics as {"sum", "count", upper bound: cumulative count}"""
+    try:
+        response = requests.get(f"{base_url}/metrics", timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+    samples = {}
+    for line in response.text.splitlines():
+        match = _LAG_SAMPLE.match(line)
+        if match:
+            samples[match.group(2) or match.group(1)] = float(match.group(3))
+    return samples or None
+
+
+def loop_lag_stats(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, Any]:
+    """Mean lag during the run, and the histogram bucket bounds its p50/p99 fall under"""
+    delta = {key: value - before.get(key, 0.0) for key, value in after.items()}
+    count = delta.pop("count", 0.0)
+    total = delta.pop("sum", 0.0)
+    if count <= 0:
+        return {}
+    bounds = sorted(delta, key=lambda bound: float(bound))
+
+    def quantile_bound(q: float) -> str:
+        for bound in bounds:
+            if delta[bound] >= q * count:
+                return bound
+        return "+Inf"
+
+    return {
+        "samples": int(count),
+        "mean_ms": round(total / count * 1000, 2),
+        "p50_le_ms": round(float(quantile_bound(0.50)) * 1000, 1),
+        "p99_le_ms": round(float(quantile_bound(0.99)) * 1000, 1),
+    }
+
+
+class Recorder:
+    """Thread-safe collection of per-request outcomes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, latency: float, error: Optional[str]):
+        with self.lock:
+            self.latencies[endpoint].append(latency)
+            if error:
+                self.errors[endpoint][error] += 1
+
+
+def run(
+    base_url: str,
+    workload: List[Dict[str, Any]],
+    qps: float,
+    duration: Optional[float] = None,
+    count: Optional[int] = None,
+    concurrency: int = 64,
+    timeout: float = 30.0,
+) -> Dict[str, Any]:
+    """Replay the workload and return a summary report"""
+    if count is None:
+        count = int(qps * duration) if duration else len(workload)
+
+    recorder = Recorder()
+    interval = 1.0 / qps
+
+    def task(entry: Dict[str, Any], scheduled: float):
+        error = None
+        try:
+            response = send(base_url, entry, timeout)
+            if response.status_code != 200:
+                error = f"http_{response.status_code}"
+        except requests.RequestException as e:
+            error = type(e).__name__
+        recorder.record(entry["endpoint"], time.perf_counter() - scheduled, error)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(count):
+            scheduled = started + i * interval
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(task, workload[i % len(workload)], scheduled)
+    elapsed = time.perf_counter() - started
+
+    return summarize(recorder, elapsed, qps)
+
+
+def _stats(latencies: List[float], errors: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": sum(errors.values()),
+        "error_kinds": dict(errors),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+    }
+
+
+def summarize(recorder: Recorder, elapsed: float, qps: float) -> Dict[str, Any]:
+    """Build the report from everything the recorder collected"""
+    all_latencies: List[float] = []
+    all_errors: Dict[str, int] = defaultdict(int)
+    per_endpoint = {}
+    for endpoint, latencies in recorder.latencies.items():
+        errors = recorder.errors.get(endpoint, {})
+        per_endpoint[endpoint] = _stats(latencies, errors, elapsed)
+        all_latencies.extend(latencies)
+        for kind, n in errors.items():
+            all_errors[kind] += n
+
+    return {
+        "target_qps": qps,
+        "elapsed_s": round(elapsed, 3),
+        "overall": _stats(all_latencies, all_errors, elapsed),
+        "endpoints": per_endpoint,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"Target QPS: {report['target_qps']}, elapsed: {report['elapsed_s']}s")
+    header = f"{'endpoint':<12}{'reqs':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, s in rows:
+        print(f"{name:<12}{s['requests']:>8}{s['errors']:>8}{s['throughput_rps']:>9}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    for name, s in rows:
+        if s["error_kinds"] and name != "overall":
+            print(f"{name} errors: {s['error_kinds']}")
+    if report.get("cache"):
+        print()
+        print(f"{'cache':<16}{'lookups':>9}{'hit rate':>10}")
+        for cache, c in report["cache"].items():
+            print(f"{cache:<16}{c['lookups']:>9}{c['hit_rate']:>10.1%}")
+    if report.get("event_loop_lag"):
+        lag = report["event_loop_lag"]
+        print()
+        print(f"Event loop lag: mean {lag['mean_ms']} ms, p50 <= {lag['p50_le_ms']} ms, "
+              f"p99 <= {lag['p99_le_ms']} ms ({lag['samples']} samples)")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay a JSONL workload against the app")
+    parser.add_argument("workload", help="Path to a JSONL workload file")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--qps", type=float, default=10.0, help="Target arrival rate")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run (default: one pass over the workload)")
+    parser.add_argument("--count", type=int, default=None, help="Number of requests to send (overrides --duration)")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    workload = load_workload(args.workload)
+    cache_before = scrape_cache_counts(args.base_url, args.timeout)
+    lag_before = scrape_loop_lag(args.base_url, args.timeout)
+    report = run(
+        args.base_url,
+        workload,
+        qps=args.qps,
+        duration=args.duration,
+        count=args.count,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+    )
+    cache_after = scrape_cache_counts(args.base_url, args.timeout)
+    if cache_before is not None and cache_after is not None:
+        report["cache"] = cache_hit_rates(cache_before, cache_after)
+    lag_after = scrape_loop_lag(args.base_url, args.timeout)
+    if lag_after is not None:
+        report["event_loop_lag"] = loop_lag_stats(lag_before or {}, lag_after)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    return 0 if report["overall"]["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
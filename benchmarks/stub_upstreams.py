@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the Google Places, Directions, Distance Matrix and Ollama generate APIs.
+
+Point the app at this server to load-test without spending Maps quota or
+needing a real Ollama box:
+
+    GOOGLE_MAPS_API_KEY=AIza-stub-key
+    GOOGLE_MAPS_BASE_URL=http://localhost:9000
+    OLLAMA_HOST=http://localhost
+    OLLAMA_PORT=9000
+
+Run with: python -m benchmarks.stub_upstreams --port 9000
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class LatencyModel:
+    """Latency distribution parsed from a spec string.
+
+    Supported specs (all values in milliseconds):
+        none                     no added delay
+        fixed:50                 constant 50ms
+        uniform:20:80            uniformly distributed between 20ms and 80ms
+        lognormal:60:0.5         log-normal with a 60ms median and sigma 0.5
+    """
+
+    def __init__(self, spec: str = "none"):
+        self.spec = spec
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+
+        expected = {"none": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if self.kind not in expected:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        if len(self.params) != expected[self.kind]:
+            raise ValueError(f"Wrong number of parameters for latency spec: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        """Return one delay in seconds"""
+        if self.kind == "fixed":
+            delay_ms = self.params[0]
+        elif self.kind == "uniform":
+            delay_ms = rng.uniform(self.params[0], self.params[1])
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            delay_ms = median * rng.lognormvariate(0.0, sigma)
+        else:
+            delay_ms = 0.0
+        return max(0.0, delay_ms) / 1000.0
+
+
+class UpstreamProfile:
+    """Latency and error behaviour for one stubbed upstream"""
+
+    def __init__(self, latency: str = "none", error_rate: float = 0.0):
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+
+
+def _rng_for(*parts: str) -> random.Random:
+    """Deterministic RNG so the same query always gets the same fake payload"""
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def _fake_location(rng: random.Random) -> Dict[str, float]:
+    return {"lat": round(rng.uniform(-60, 60), 6), "lng": round(rng.uniform(-180, 180), 6)}
+
+
+def fake_places(query: str, count: int, page: int = 0) -> Dict[str, Any]:
+    """Build a Places text search response shaped like the real API"""
+    rng = _rng_for("places", query, str(page))
+    results = []
+    for i in range(page * count, (page + 1) * count):
+        results.append({
+            "place_id": f"stub-{hashlib.md5(f'{query}-{i}'.encode()).hexdigest()[:20]}",
+            "name": f"{query.title()} #{i + 1}",
+            "formatted_address": f"{rng.randint(1, 999)} Stub Street, Stub City",
+            "geometry": {"location": _fake_location(rng)},
+            "types": ["point_of_interest", "establishment"],
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "user_ratings_total": rng.randint(1, 5000),
+            "photos": [{
+                "height": 1080,
+                "width": 1920,
+                "photo_reference": "stub-photo-" + "x" * 180,
+                "html_attributions": ['<a href="https://maps.google.com">Stub</a>'],
+            }],
+        })
+    return {"html_attributions": [], "results": results, "status": "OK"}
+
+
+def make_page_token(query: str, page: int) -> str:
+    """Encode the next page's position and issue time, like an opaque next_page_token"""
+    raw = json.dumps({"q": query, "p": page, "t": time.time()})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def read_page_token(token: str) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except ValueError:
+        return None
+
+
+_DETAIL_FIELD_KEYS = {"type": "types", "photo": "photos", "geometry/location": "geometry"}
+
+
+def fake_place_details(place_id: str, fields: List[str]) -> Dict[str, Any]:
+    """Build a Place Details response limited to the requested fields"""
+    if not place_id.startswith("stub-"):
+        return {"html_attributions": [], "status": "NOT_FOUND"}
+    rng = _rng_for("details", place_id)
+    details = {
+        "place_id": place_id,
+        "name": f"Stub Place {place_id[5:11]}",
+        "formatted_address": f"{rng.randint(1, 999)} Stub Street, Stub City",
+        "geometry": {"location": _fake_location(rng)},
+        "types": ["point_of_interest", "establishment"],
+        "rating": round(rng.uniform(3.0, 5.0), 1),
+        "user_ratings_total": rng.randint(1, 5000),
+        "website": f"https://example.com/{place_id}",
+        "international_phone_number": f"+1 555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+        "opening_hours": {
+            "open_now": rng.random() < 0.7,
+            "weekday_text": [f"{day}: 9:00 AM – 6:00 PM" for day in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday")],
+        },
+    }
+    if fields:
+        # Field names in the mask differ from the keys in the result for a few fields
+        keys = {_DETAIL_FIELD_KEYS.get(f, f) for f in fields}
+        details = {k: v for k, v in details.items() if k in keys}
+    return {"html_attributions": [], "result": details, "status": "OK"}
+
+
+def fake_directions(origin: str, destination: str, mode: str, steps: int) -> Dict[str, Any]:
+    """Build a Directions response with the requested number of steps"""
+    rng = _rng_for("directions", origin, destination, mode)
+    start = _fake_location(rng)
+    point = dict(start)
+    step_list = []
+    for i in range(steps):
+        end = {"lat": point["lat"] + rng.uniform(-0.01, 0.01), "lng": point["lng"] + rng.uniform(-0.01, 0.01)}
+        meters = rng.randint(50, 3000)
+        seconds = rng.randint(10, 600)
+        step_list.append({
+            "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+            "duration": {"text": f"{seconds // 60 + 1} mins", "value": seconds},
+            "html_instructions": f"Continue onto <b>Stub Road {i + 1}</b>",
+            "polyline": {"points": "a~l~Fjk~uOwHJy@P" * 4},
+            "start_location": point,
+            "end_location": end,
+            "travel_mode": mode.upper(),
+        })
+        point = end
+
+    total_meters = sum(s["distance"]["value"] for s in step_list)
+    total_seconds = sum(s["duration"]["value"] for s in step_list)
+    leg = {
+        "distance": {"text": f"{total_meters / 1000:.1f} km", "value": total_meters},
+        "duration": {"text": f"{total_seconds // 60 + 1} mins", "value": total_seconds},
+        "start_address": origin,
+        "end_address": destination,
+        "start_location": start,
+        "end_location": point,
+        "steps": step_list,
+    }
+    route = {
+        "summary": f"Stub route from {origin} to {destination}",
+        "legs": [leg],
+        "overview_polyline": {"points": "a~l~Fjk~uOwHJy@P" * 32},
+        "warnings": [],
+        "bounds": {"northeast": point, "southwest": start},
+        "copyrights": "Stub Map Data",
+    }
+    return {"geocoded_waypoints": [], "routes": [route], "status": "OK"}
+
+
+def _city_point(place: str) -> Dict[str, float]:
+    """Where a fake stop is: a fixed point in a 12km x 12km city, so matrix times are consistent"""
+    rng = _rng_for("point", place)
+    return {"lat": 48.80 + rng.uniform(0, 0.11), "lng": 2.25 + rng.uniform(0, 0.16)}
+
+
+def fake_distance_matrix(origins: List[str], destinations: List[str], mode: str) -> Dict[str, Any]:
+    """Build a Distance Matrix response from straight-line distances, with one-way streets thrown in"""
+    speeds = {"walking": 5.0, "bicycling": 15.0, "transit": 20.0}
+    kmh = speeds.get(mode, 30.0)
+    rows = []
+    for origin in origins:
+        a = _city_point(origin)
+        elements = []
+        for destination in destinations:
+            b = _city_point(destination)
+            km = math.hypot((a["lat"] - b["lat"]) * 111.2, (a["lng"] - b["lng"]) * 73.3) * 1.3
+            # Detours differ by direction, so the matrix is asymmetric like real road networks
+            detour = 1.0 + 0.2 * _rng_for("detour", origin, destination).random()
+            seconds = int(km / kmh * 3600 * detour) + 60
+            elements.append({
+                "distance": {"text": f"{km:.1f} km", "value": int(km * 1000)},
+                "duration": {"text": f"{seconds // 60} mins", "value": seconds},
+                "status": "OK",
+            })
+        rows.append({"elements": elements})
+    return {"origin_addresses": origins, "destination_addresses": destinations, "rows": rows, "status": "OK"}
+
+
+def fake_llm_text(prompt: str, padding_words: int) -> str:
+    """Answer the way the extraction prompt in LLMClient asks the model to"""
+    # Only look at the user's part of the prompt built by LLMClient
+    user_match = re.search(r"User:\s*(.*?)\s*(?:Assistant:|$)", prompt, re.DOTALL)
+    user_prompt = user_match.group(1) if user_match else prompt
+
+    directions = re.search(r"from\s+(.+?)\s+to\s+(.+)", user_prompt, re.IGNORECASE)
+    # Follow-ups like "how do I get there by bike" leave the destination as a reference
+    follow_up = re.search(r"get (there|to it)(?: by (\w+))?", user_prompt, re.IGNORECASE)
+    if follow_up and not directions:
+        modes = {"bike": "bicycling", "bicycle": "bicycling", "foot": "walking", "bus": "transit", "train": "transit"}
+        payload = {
+            "response": "Here is how to get there.",
+            "directions_query": True,
+            "destination": follow_up.group(1),
+            "travel_mode": modes.get((follow_up.group(2) or "").lower(), "driving"),
+        }
+    elif directions:
+        payload = {
+            "response": f"Here are directions from {directions.group(1)} to {directions.group(2)}.",
+            "directions_query": True,
+            "origin": directions.group(1).strip(),
+            "destination": directions.group(2).strip(" ?."),
+            "travel_mode": "driving",
+        }
+    else:
+        location = re.sub(r"^(where is|find|show me|locate|what is|tell me about)\s+", "", user_prompt, flags=re.IGNORECASE)
+        payload = {
+            "response": f"Here is what I found for {location}.",
+            "location_query": location.strip(" ?."),
+        }
+
+    # Real models ramble around the JSON; the padding exercises the extraction path
+    rng = _rng_for("llm", user_prompt)
+    words = ["sure", "the", "location", "map", "here", "is", "result", "nearby"]
+    preamble = " ".join(rng.choice(words) for _ in range(padding_words))
+    return f"{preamble}\n{json.dumps(payload)}\n"
+
+
+def create_app(
+    places: UpstreamProfile,
+    directions: UpstreamProfile,
+    ollama: UpstreamProfile,
+    places_results: int = 20,
+    places_pages: int = 1,
+    page_token_delay: float = 2.0,
+    direction_steps: int = 40,
+    llm_padding_words: int = 50,
+    token_latency: str = "none",
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """Build the stub application serving all three upstream APIs"""
+    app = FastAPI(title="Stub upstreams")
+    rng = random.Random(seed)
+    token_delay = LatencyModel(token_latency)
+
+    async def delay(profile: UpstreamProfile) -> bool:
+        """Sleep for the profile's latency; returns True if this call should fail"""
+        await asyncio.sleep(profile.latency.sample(rng))
+        return rng.random() < profile.error_rate
+
+    @app.get("/maps/api/place/textsearch/json")
+    async def place_text_search(query: str = "", pagetoken: str = ""):
+        if await delay(places):
+            return {"results": [], "status": "UNKNOWN_ERROR", "error_message": "Injected stub failure"}
+        page = 0
+        if pagetoken:
+            # Like Google, a token is rejected until it has had time to become valid
+            token = read_page_token(pagetoken)
+            if token is None or time.time() - token["t"] < page_token_delay:
+                return {"results": [], "status": "INVALID_REQUEST"}
+            query, page = token["q"], token["p"]
+        body = fake_places(query, places_results, page)
+        if page + 1 < places_pages:
+            body["next_page_token"] = make_page_token(query, page + 1)
+        return body
+
+    @app.get("/maps/api/place/details/json")
+    async def place_details(placeid: str = "", fields: str = ""):
+        if await delay(places):
+            return {"status": "UNKNOWN_ERROR", "error_message": "Injected stub failure"}
+        return fake_place_details(placeid, [f for f in fields.split(",") if f])
+
+    @app.get("/maps/api/directions/json")
+    async def directions_api(origin: str = "", destination: str = "", mode: str = "driving", waypoints: str = ""):
+        if await delay(directions):
+            return {"routes": [], "status": "UNKNOWN_ERROR", "error_message": "Injected stub failure"}
+        stops = [origin, *(w for w in waypoints.split("|") if w), destination]
+        body = fake_directions(stops[0], stops[1], mode, direction_steps)
+        # One leg per hop, like Google
+        for start, end in zip(stops[1:], stops[2:]):
+            body["routes"][0]["legs"] += fake_directions(start, end, mode, direction_steps)["routes"][0]["legs"]
+        return body
+
+    @app.get("/maps/api/distancematrix/json")
+    async def distance_matrix_api(origins: str = "", destinations: str = "", mode: str = "driving"):
+        if await delay(directions):
+            return {"rows": [], "status": "UNKNOWN_ERROR", "error_message": "Injected stub failure"}
+        return fake_distance_matrix(origins.split("|"), destinations.split("|"), mode)
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        if await delay(ollama):
+            return JSONResponse(status_code=500, content={"error": "Injected stub failure"})
+
+        text = fake_llm_text(body.get("prompt", ""), llm_padding_words)
+        model = body.get("model", "stub")
+
+        if not body.get("stream", True):
+            return {"model": model, "response": text, "done": True}
+
+        async def stream():
+            # Split on whitespace but keep it, so the concatenated tokens equal the full text
+            for token in re.findall(r"\S+\s*|\s+", text):
+                await asyncio.sleep(token_delay.sample(rng))
+                yield json.dumps({"model": model, "response": token, "done": False}) + "\n"
+            yield json.dumps({"model": model, "response": "", "done": True}) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "stub"}
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run stub Google Maps and Ollama upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--places-latency", default="lognormal:80:0.4", help="Places latency spec (see LatencyModel)")
+    parser.add_argument("--places-error-rate", type=float, default=0.0)
+    parser.add_argument("--places-results", type=int, default=20, help="Results per page")
+    parser.add_argument("--places-pages", type=int, default=1, help="Pages per query (Google returns up to 3)")
+    parser.add_argument("--page-token-delay", type=float, default=2.0, help="Seconds before a next_page_token is accepted")
+    parser.add_argument("--directions-latency", default="lognormal:120:0.4")
+    parser.add_argument("--directions-error-rate", type=float, default=0.0)
+    parser.add_argument("--directions-steps", type=int, default=40)
+    parser.add_argument("--ollama-latency", default="lognormal:800:0.5", help="Time to first token")
+    parser.add_argument("--ollama-error-rate", type=float, default=0.0)
+    parser.add_argument("--ollama-token-latency", default="fixed:5", help="Delay between streamed tokens")
+    parser.add_argument("--llm-padding-words", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    app = create_app(
+        places=UpstreamProfile(args.places_latency, args.places_error_rate),
+        directions=UpstreamProfile(args.directions_latency, args.directions_error_rate),
+        ollama=UpstreamProfile(args.ollama_latency, args.ollama_error_rate),
+        places_results=args.places_results,
+        places_pages=args.places_pages,
+        page_token_delay=args.page_token_delay,
+        direction_steps=args.directions_steps,
+        llm_padding_words=args.llm_padding_words,
+        token_latency=args.ollama_token_latency,
+        seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
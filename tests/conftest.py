@@ -0,0 +1,14 @@
+import os
+import sys
+
+# Settings and the clients read the environment at import/construction time; keep tests off real services
+os.environ.setdefault("GOOGLE_MAPS_API_KEY", "AIza-test-key")
+os.environ.setdefault("GOOGLE_MAPS_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("OLLAMA_HOST", "http://127.0.0.1")
+os.environ.setdefault("OLLAMA_PORT", "9")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+os.environ.setdefault("WARMER_ENABLED", "false")
+# Never persist a cache warming snapshot from a test run, whatever the developer's environment says
+os.environ["WARMER_SNAPSHOT"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from app.utils.admission import AdmissionController, AdmissionRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_priority_lane_is_served_before_earlier_normal_waiters():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5)
+        order = []
+        release = asyncio.Event()
+
+        async def holder():
+            async with admission.slot():
+                await release.wait()
+
+        async def request(name, priority):
+            async with admission.slot(priority=priority):
+                order.append(name)
+
+        tasks = [asyncio.create_task(holder())]
+        await settle()
+        for name, priority in (("normal-1", False), ("normal-2", False), ("priority-1", True), ("priority-2", True)):
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await settle()
+        assert admission.waiting == 4
+        release.set()
+        await asyncio.gather(*tasks)
+        return order, admission.active, admission.waiting
+
+    order, active, waiting = run(scenario())
+    assert order == ["priority-1", "priority-2", "normal-1", "normal-2"]
+    assert (active, waiting) == (0, 0)
+
+
+def test_waiter_is_rejected_after_the_queue_timeout():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def holder():
+            async with admission.slot():
+                await release.wait()
+
+        task = asyncio.create_task(holder())
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with admission.slot():
+                pass
+        waiting = admission.waiting
+        release.set()
+        await task
+        return rejected.value, waiting, admission.active
+
+    rejected, waiting, active = run(scenario())
+    assert rejected.reason == "queue_timeout"
+    assert rejected.retry_after >= 1
+    # The timed-out waiter left the queue and took no slot with it
+    assert (waiting, active) == (0, 0)
+
+
+def test_full_queue_rejects_at_once():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def holder():
+            async with admission.slot():
+                await release.wait()
+
+        tasks = [asyncio.create_task(holder()), asyncio.create_task(holder())]
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with admission.slot(priority=True):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return rejected.value.reason, admission.active
+
+    assert run(scenario()) == ("queue_full", 0)
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=5)
+        release = asyncio.Event()
+        served = []
+
+        async def holder():
+            async with admission.slot():
+                await release.wait()
+
+        async def request(name):
+            async with admission.slot():
+                served.append(name)
+
+        first = asyncio.create_task(holder())
+        await settle()
+        cancelled = asyncio.create_task(request("cancelled"))
+        later = asyncio.create_task(request("later"))
+        await settle()
+        cancelled.cancel()
+        await settle()
+        waiting = admission.waiting
+        release.set()
+        await asyncio.gather(first, later)
+        return served, waiting, admission.active
+
+    served, waiting, active = run(scenario())
+    assert served == ["later"]
+    assert waiting == 1
+    assert active == 0
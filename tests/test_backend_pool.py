@@ -0,0 +1,101 @@
+import time
+
+import pytest
+import requests
+
+from app.config import Settings
+from app.utils.backend_pool import BackendPool
+from app.utils.llm_client import LLMClient, is_fallback
+
+
+def fail(pool, url=None):
+    with pytest.raises(RuntimeError):
+        with pool.acquire() as lease:
+            assert url is None or lease.url == url
+            raise RuntimeError("backend down")
+
+
+def test_least_outstanding_spreads_calls():
+    pool = BackendPool(["http://a", "http://b"])
+    with pool.acquire() as first, pool.acquire() as second:
+        assert {first.url, second.url} == {"http://a", "http://b"}
+
+
+def test_node_is_ejected_after_consecutive_failures():
+    pool = BackendPool(["http://a"], failure_threshold=2, ejection_seconds=60)
+    fail(pool)
+    assert pool.backends[0].ejected_until == 0.0
+    fail(pool)
+    assert pool.backends[0].ejected_until > time.monotonic()
+
+
+def test_ejected_node_gets_no_traffic_while_another_is_up():
+    pool = BackendPool(["http://a", "http://b"], failure_threshold=1, ejection_seconds=60)
+    fail(pool, None)
+    ejected = next(b for b in pool.backends if b.ejected_until)
+    for _ in range(5):
+        with pool.acquire() as lease:
+            assert lease.url != ejected.url
+
+
+def test_successful_probe_readmits():
+    pool = BackendPool(["http://a"], failure_threshold=1, ejection_seconds=0.01)
+    fail(pool)
+    time.sleep(0.02)
+    with pool.acquire() as lease:
+        assert lease.probe
+    assert pool.backends[0].ejected_until == 0.0
+
+
+def test_failed_probe_ejects_for_longer():
+    pool = BackendPool(["http://a"], failure_threshold=1, ejection_seconds=0.01)
+    fail(pool)
+    time.sleep(0.02)
+    started = time.monotonic()
+    fail(pool)
+    backend = pool.backends[0]
+    assert backend.ejections == 2
+    assert backend.ejected_until - started == pytest.approx(0.02, abs=0.01)
+
+
+def test_only_the_probe_lease_clears_probing():
+    pool = BackendPool(["http://a"], failure_threshold=1)
+    backend = pool.backends[0]
+    running = pool.acquire()
+    assert not running.__enter__().probe
+    # The node is ejected, and its cooldown is over, while that call is still running
+    backend.ejected_until, backend.ejections = time.monotonic() - 1, 1
+    probe = pool.acquire()
+    assert probe.__enter__().probe and backend.probing
+
+    # The earlier call finishing must neither end the probe nor readmit the node
+    running.__exit__(None, None, None)
+    assert backend.probing and backend.ejected_until
+    probe.__exit__(None, None, None)
+    assert not backend.probing and backend.ejected_until == 0.0
+
+
+class HangingSession:
+    def __init__(self):
+        self.timeouts = []
+
+    def post(self, url, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        raise requests.exceptions.ReadTimeout("read timed out")
+
+    def close(self):
+        pass
+
+
+def test_timeouts_are_passed_and_count_as_backend_failures(monkeypatch):
+    monkeypatch.setenv("OLLAMA_BACKENDS", "http://gpu-1:11434")
+    monkeypatch.setenv("OLLAMA_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("OLLAMA_CONNECT_TIMEOUT", "3")
+    monkeypatch.setenv("OLLAMA_READ_TIMEOUT", "30")
+    client = LLMClient(Settings())
+    client.session = HangingSession()
+
+    assert is_fallback(client.process_prompt("Where is the Eiffel Tower"))
+    assert is_fallback(client.stream_prompt("Where is the Eiffel Tower", on_token=lambda token: None))
+    assert client.session.timeouts == [(3.0, 30.0), (3.0, 30.0)]
+    assert client.pool.backends[0].ejected_until > 0
@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.cache import TTLCache, MISSING
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Loader:
+    """Counts its calls; each call waits for `release` before returning `value`"""
+
+    def __init__(self, value="loaded"):
+        self.value = value
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+def test_get_set_and_expiry():
+    cache = TTLCache("test", ttl=0.05)
+    assert cache.get("a") is MISSING
+    cache.set("a", None)
+    assert cache.get("a") is None
+    time.sleep(0.06)
+    assert cache.get("a") is MISSING
+
+
+def test_lru_eviction():
+    cache = TTLCache("test", ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_concurrent_misses_share_one_load():
+    async def scenario():
+        cache = TTLCache("test", ttl=60)
+        loader = Loader()
+        loader.release = asyncio.Event()
+        callers = [asyncio.create_task(cache.get_or_load("k", loader)) for _ in range(5)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        return await asyncio.gather(*callers), loader.calls, cache.get("k")
+
+    results, calls, cached = run(scenario())
+    assert results == ["loaded"] * 5
+    assert calls == 1
+    assert cached == "loaded"
+
+
+def test_cancelled_caller_does_not_cancel_coalesced_callers():
+    async def scenario():
+        cache = TTLCache("test", ttl=60)
+        loader = Loader()
+        loader.release = asyncio.Event()
+        first = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        loader.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, loader.calls, cache.get("k")
+
+    result, calls, cached = run(scenario())
+    assert result == "loaded"
+    assert calls == 1
+    assert cached == "loaded"
+
+
+def test_load_finishes_when_every_caller_is_cancelled():
+    async def scenario():
+        cache = TTLCache("test", ttl=60)
+        loader = Loader()
+        loader.release = asyncio.Event()
+        caller = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        caller.cancel()
+        loader.release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return cache.get("k"), len(cache._loading)
+
+    assert run(scenario()) == ("loaded", 0)
+
+
+def test_failed_load_reaches_every_caller_and_is_not_cached():
+    async def scenario():
+        cache = TTLCache("test", ttl=60)
+        loader = Loader(ValueError("upstream down"))
+        loader.release = asyncio.Event()
+        callers = [asyncio.create_task(cache.get_or_load("k", loader)) for _ in range(2)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        return await asyncio.gather(*callers, return_exceptions=True), cache.get("k")
+
+    results, cached = run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert cached is MISSING
+
+
+def test_uncacheable_result_is_returned_but_not_stored():
+    async def scenario():
+        cache = TTLCache("test", ttl=60)
+        value = await cache.get_or_load("k", Loader("fallback"), cacheable=lambda v: v != "fallback")
+        return value, cache.get("k")
+
+    assert run(scenario()) == ("fallback", MISSING)
+
+
+def test_stale_entry_is_served_and_refreshed_in_background():
+    async def scenario():
+        cache = TTLCache("test", ttl=0.05, grace=60)
+        cache.set("k", "old")
+        await asyncio.sleep(0.06)
+        loader = Loader("new")
+        served = await cache.get_or_load("k", loader)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return served, loader.calls, cache.get("k")
+
+    assert run(scenario()) == ("old", 1, "new")
+
+
+def test_failed_refresh_keeps_stale_entry():
+    async def scenario():
+        cache = TTLCache("test", ttl=0.01, grace=60)
+        cache.set("k", "old")
+        await asyncio.sleep(0.02)
+        await cache.get_or_load("k", Loader(ValueError("down")))
+        await asyncio.sleep(0.01)
+        return cache.peek("k")
+
+    assert run(scenario()) == "old"
+
+
+def test_pack_hooks_store_encoded_values_and_decode_copies():
+    cache = TTLCache("test", ttl=60, pack=lambda v: repr(v).encode(), unpack=lambda b: eval(b.decode()))
+    cache.set("k", [1, 2])
+    assert cache._entries["k"][1] == b"[1, 2]"
+    first, second = cache.get("k"), cache.get("k")
+    assert first == second == [1, 2] and first is not second
+    assert cache.is_fresh("k") and not cache.is_fresh("other")
@@ -0,0 +1,112 @@
+import pytest
+
+from app.models.location import (
+    DirectionsResponse, Geometry, Leg, LocationResponse, Place, PlaceDetails, PlaceDetailsResponse, Route, Step
+)
+from app.utils.compact import pack, unpack
+
+
+def step(distance_value=1234, polyline=None, **extra):
+    fields = dict(
+        distance={"text": "1.2 km", "value": distance_value},
+        duration={"text": "3 mins", "value": 180},
+        html_instructions="Head <b>east</b> on Jl. Sudirman",
+        polyline=polyline or {"points": "a~l~Fjk~uOwHJy@P"},
+        start_location=Geometry(lat=-6.2088, lng=106.8456),
+        end_location=Geometry(lat=-6.2146, lng=106.8451),
+        travel_mode="DRIVING",
+    )
+    fields.update(extra)
+    return Step(**fields)
+
+
+def directions():
+    leg = Leg(
+        distance={"text": "150 km", "value": 150000},
+        duration={"text": "3 hours", "value": 10800},
+        start_address="Jakarta, Indonesia",
+        end_address="Bandung, Indonesia",
+        start_location=Geometry(lat=-6.2088, lng=106.8456),
+        end_location=Geometry(lat=-6.9175, lng=107.6191),
+        steps=[
+            step(),
+            # Shapes the fixed-size step record can't hold fall back to the generic form
+            step(distance_value=2 ** 40),
+            step(polyline={"points": "abc", "levels": "BB"}),
+            step(distance={"value": 5, "text": "5 m"}),
+        ],
+    )
+    route = Route(
+        summary="Tol Cipularang",
+        legs=[leg],
+        overview_polyline={"points": "xyz"},
+        warnings=["Toll road"],
+        bounds={"northeast": {"lat": -6.1, "lng": 107.7}, "southwest": {"lat": -7.0, "lng": 106.7}},
+        copyrights="Map data ©2026",
+    )
+    return DirectionsResponse(routes=[route], status="OK", origin_place_id="ChIJ-origin")
+
+
+def search():
+    places = [
+        Place(
+            place_id=f"ChIJ-{i}",
+            name=name,
+            formatted_address=f"{name}, Jakarta",
+            geometry=Geometry(lat=-6.2 - i / 100, lng=106.8 + i / 100),
+            types=["restaurant", "food"],
+            rating=4.5 if i % 2 else None,
+            user_ratings_total=-3 if i == 2 else 1200 + i,
+            photos=[{"photo_reference": "ref", "width": 4032, "html_attributions": []}],
+            opening_hours={"open_now": i % 2 == 0},
+        )
+        for i, name in enumerate(["Sate Khas Senayan", "Pizza 🍕 Place", "Café Ñandú"])
+    ]
+    return LocationResponse(places=places, status="OK", next_cursor="token")
+
+
+def details():
+    # Only the fields asked for are set; the rest must stay unset after a round trip
+    place = PlaceDetails(place_id="ChIJ-1", name="Monas", geometry=Geometry(lat=-6.1754, lng=106.8272))
+    return PlaceDetailsResponse(place=place, status="OK")
+
+
+@pytest.mark.parametrize("build", [directions, search, details, lambda: LocationResponse(status="ZERO_RESULTS")])
+def test_pack_unpack_round_trips(build):
+    original = build()
+    packed = pack(original)
+    assert isinstance(packed, bytes)
+    restored = unpack(packed)
+    assert type(restored) is type(original)
+    assert restored == original
+    assert restored.model_dump_json() == original.model_dump_json()
+    assert restored.model_dump(exclude_unset=True) == original.model_dump(exclude_unset=True)
+
+
+def test_lone_surrogates_survive():
+    # Not valid UTF-8, but a str Python (and so a cache entry) can hold
+    original = LocationResponse(status="OK", web_url="\ud800 lone surrogate")
+    assert unpack(pack(original)) == original
+
+
+def test_unpacked_models_are_independent_and_usable():
+    packed = pack(search())
+    first, second = unpack(packed), unpack(packed)
+    first.places[0].types.append("bar")
+    assert second.places[0].types == ["restaurant", "food"]
+    assert second.model_copy(update={"next_cursor": None}).next_cursor is None
+
+
+def test_packed_form_is_smaller_than_json():
+    original = directions()
+    assert len(pack(original)) < len(original.model_dump_json())
+
+
+def test_unknown_values_and_versions_are_rejected():
+    with pytest.raises(TypeError):
+        pack(Place.model_construct(
+            place_id="x", name="x", formatted_address="x", geometry=Geometry(lat=0, lng=0),
+            opening_hours={1: "integer key"}
+        ))
+    with pytest.raises(ValueError):
+        unpack(b"\x63" + pack(details())[1:])
@@ -0,0 +1,73 @@
+import pytest
+
+from app.utils.gazetteer import Gazetteer, GazetteerEntry, build
+
+PLACES = [
+    (GazetteerEntry("Paris", 48.8566, 2.3522, 2100000, "Paris, FR", "ChIJ-paris"), ["Paname"]),
+    (GazetteerEntry("Paris", 33.6609, -95.5555, 25000, "Paris, US"), []),
+    (GazetteerEntry("Parma", 44.8015, 10.3279, 195000, "Parma, IT"), []),
+    (GazetteerEntry("Bandung", -6.9175, 107.6191, 2500000, "Bandung, ID", types=("locality",)), []),
+    # Generic names GeoNames has some tiny, unpopulated record for
+    (GazetteerEntry("Hospital", 53.3, -8.0, 0, "Hospital, IE"), []),
+    (GazetteerEntry("Pizzo", 38.7, 16.2, 9000, "Pizzo, IT"), []),
+]
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    path = str(tmp_path / "places.gaz")
+    build(iter(PLACES), path)
+    g = Gazetteer(path)
+    yield g
+    g.close()
+
+
+def test_exact_lists_the_most_populous_first(gazetteer):
+    assert [e.address for e in gazetteer.exact("paris")] == ["Paris, FR", "Paris, US"]
+    assert gazetteer.exact("Paname")[0].place_id == "ChIJ-paris"
+
+
+def test_prefix_returns_each_place_once_up_to_the_limit(gazetteer):
+    assert {e.address for e in gazetteer.prefix("par")} == {"Paris, FR", "Paris, US", "Parma, IT"}
+    assert len(gazetteer.prefix("par", limit=2)) == 2
+    assert gazetteer.prefix("") == []
+    assert gazetteer.prefix("xyz") == []
+
+
+def test_entries_round_trip(gazetteer):
+    bandung = gazetteer.exact("bandung")[0]
+    assert (bandung.name, bandung.population, bandung.types) == ("Bandung", 2500000, ("locality",))
+    assert bandung.lat == pytest.approx(-6.9175)
+    # Places without a Google id get a gazetteer one
+    assert bandung.place_id.startswith("gazetteer:")
+
+
+def test_lookup_tolerates_typos_and_qualifies_by_region(gazetteer):
+    entry, confidence = gazetteer.lookup("Bandunq")
+    assert entry.name == "Bandung" and 0.0 < confidence < 1.0
+    entry, _ = gazetteer.lookup("Paris, US")
+    assert entry.address == "Paris, US"
+    assert gazetteer.lookup("qqqqqq") is None
+
+
+def test_unpopulated_single_match_is_not_confident(gazetteer):
+    entry, confidence = gazetteer.lookup("hospital")
+    assert entry.name == "Hospital"
+    assert confidence == 0.0
+
+
+def test_small_places_are_scaled_down(gazetteer):
+    _, confidence = gazetteer.lookup("pizzo")
+    assert confidence == pytest.approx(9000 / 100000)
+    _, confidence = gazetteer.lookup("paris")
+    assert confidence == pytest.approx(2100000 / 2125000)
+
+
+def test_min_population_is_configurable(tmp_path):
+    path = str(tmp_path / "places.gaz")
+    build(iter(PLACES), path)
+    g = Gazetteer(path, min_population=0)
+    try:
+        assert g.lookup("hospital")[1] == 1.0
+    finally:
+        g.close()
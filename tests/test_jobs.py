@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.utils.admission import AdmissionRejected
+from app.utils.jobs import JobQueue
+
+
+def encode(job):
+    return json.dumps({"id": job.id, "status": job.status, "result": job.result, "error": job.error}).encode()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def returning(value, delay=0.0):
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_job_runs_and_result_is_kept():
+    async def scenario():
+        queue = JobQueue(encode, workers=1)
+        queue.start()
+        job = queue.submit(lambda: returning("answer"))
+        done = await job.wait(1)
+        queue.close()
+        return done, job.status, job.result, queue.get(job.id) is job
+
+    assert run(scenario()) == (True, "done", "answer", True)
+
+
+def test_same_key_is_deduplicated_while_unfinished():
+    async def scenario():
+        queue = JobQueue(encode, workers=1)
+        queue.start()
+        first = queue.submit(lambda: returning(1, 0.05), key="k")
+        second = queue.submit(lambda: returning(2), key="k")
+        await first.wait(1)
+        third = queue.submit(lambda: returning(3), key="k")
+        await third.wait(1)
+        queue.close()
+        return first is second, third is not first, third.result
+
+    assert run(scenario()) == (True, True, 3)
+
+
+def test_full_queue_rejects():
+    async def scenario():
+        queue = JobQueue(encode, workers=1, max_queued=1)
+        queue.start()
+        # No worker has picked it up yet, so it still counts as queued
+        queue.submit(lambda: returning(1))
+        try:
+            with pytest.raises(AdmissionRejected):
+                queue.submit(lambda: returning(2))
+        finally:
+            queue.close()
+
+    run(scenario())
+
+
+def test_failing_and_timed_out_jobs_fail():
+    async def boom():
+        raise RuntimeError("model crashed")
+
+    async def scenario():
+        queue = JobQueue(encode, workers=1, timeout=0.05)
+        queue.start()
+        failing = queue.submit(boom)
+        slow = queue.submit(lambda: returning(1, 1.0))
+        await failing.wait(1)
+        await slow.wait(1)
+        queue.close()
+        return failing.status, failing.error, slow.status
+
+    status, error, slow_status = run(scenario())
+    assert (status, error, slow_status) == ("failed", "model crashed", "failed")
+
+
+def test_cancelled_job_fails_and_worker_keeps_going():
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def scenario():
+        queue = JobQueue(encode, workers=1)
+        queue.start()
+        first = queue.submit(cancelled, key="k")
+        await first.wait(1)
+        second = queue.submit(lambda: returning("after"), key="k")
+        await second.wait(1)
+        queue.close()
+        return first.status, second is not first, second.status, second.result
+
+    assert run(scenario()) == ("failed", True, "done", "after")
+
+
+def test_close_fails_unfinished_jobs_and_shares_their_state(tmp_path):
+    directory = tmp_path / "jobs"
+
+    async def scenario():
+        queue = JobQueue(encode, workers=1, directory=str(directory))
+        queue.start()
+        job = queue.submit(lambda: returning(1, 10))
+        await asyncio.sleep(0.01)
+        queue.close()
+        return job.status, queue._read(job.id)
+
+    status, (data, done) = run(scenario())
+    assert status == "failed" and done
+    assert json.loads(data)["status"] == "failed"
+    # Job results are users' answers: private directory and files
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+    assert {stat.S_IMODE(entry.stat().st_mode) for entry in os.scandir(directory)} == {0o600}
+
+
+def test_states_are_written_in_order(tmp_path):
+    async def scenario():
+        queue = JobQueue(encode, workers=1, directory=str(tmp_path))
+        write = queue._write
+
+        def slow_queued_write(job_id, data, done):
+            # The "queued" write would otherwise land after the "running" one
+            if b'"queued"' in data:
+                time.sleep(0.1)
+            write(job_id, data, done)
+
+        queue._write = slow_queued_write
+        queue.start()
+        job = queue.submit(lambda: returning(1, 0.3))
+        await asyncio.sleep(0.2)
+        running = queue._read(job.id)
+        await job.wait(1)
+        while queue._writes:
+            await asyncio.sleep(0.01)
+        finished = queue._read(job.id)
+        queue.close()
+        return running, finished
+
+    (running, running_done), (finished, finished_done) = run(scenario())
+    assert json.loads(running)["status"] == "running" and not running_done
+    assert json.loads(finished)["status"] == "done" and finished_done
+    # Only the finished state is left, no temp or pending files
+    assert [entry.name for entry in os.scandir(tmp_path)] == [f"{json.loads(finished)['id']}.json"]
+
+
+def test_concurrent_writes_never_tear_a_file(tmp_path):
+    queue = JobQueue(encode, directory=str(tmp_path))
+    payloads = [json.dumps({"n": i, "pad": "x" * 65536}).encode() for i in range(8)]
+
+    def write(data):
+        for _ in range(20):
+            queue._write("job-id-0123456789", data, False)
+
+    with ThreadPoolExecutor(len(payloads)) as pool:
+        list(pool.map(write, payloads))
+    data, done = queue._read("job-id-0123456789")
+    assert data in payloads and not done
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,53 @@
+import json
+import re
+
+from app.models.location import DirectionsResponse, Geometry, Leg, Route, Step
+from app.utils.maps_client import MapsClient, render_directions_map_html
+
+HOSTILE_ID = "x'});alert(1);//</script><script>alert(2)</script>"
+
+
+def directions(origin_place_id=None, destination_place_id=None):
+    start, end = Geometry(lat=-6.2, lng=106.8), Geometry(lat=-6.9, lng=107.6)
+    step = Step(
+        distance={"text": "1 km"}, duration={"text": "1 min"}, html_instructions="Head east",
+        polyline={"points": ""}, start_location=start, end_location=end, travel_mode="DRIVING",
+    )
+    leg = Leg(
+        distance={"text": "150 km"}, duration={"text": "3 hours"}, start_address="Jakarta",
+        end_address="Bandung", start_location=start, end_location=end, steps=[step],
+    )
+    route = Route(summary="", legs=[leg], overview_polyline={"points": ""}, bounds={}, copyrights="")
+    return DirectionsResponse(
+        routes=[route], status="OK",
+        origin_place_id=origin_place_id, destination_place_id=destination_place_id,
+    )
+
+
+def map_args(response):
+    client = MapsClient.__new__(MapsClient)
+    client.api_key = "AIza-test"
+    return client.directions_map_args(response)
+
+
+def test_place_ids_are_emitted_as_json_literals():
+    args = map_args(directions("ChIJ-origin", "ChIJ-destination"))
+    origin_js, destination_js = args[3], args[4]
+    assert json.loads(origin_js) == {"placeId": "ChIJ-origin"}
+    assert json.loads(destination_js) == {"placeId": "ChIJ-destination"}
+
+
+def test_hostile_place_ids_cannot_break_out_of_the_script():
+    args = map_args(directions(HOSTILE_ID, HOSTILE_ID))
+    origin_js, destination_js = args[3], args[4]
+    # Still the same string once parsed, but with no quote or tag to end the literal or the <script>
+    assert json.loads(origin_js) == json.loads(destination_js) == {"placeId": HOSTILE_ID}
+    html = render_directions_map_html(*args)
+    assert "alert(1)" not in re.sub(r'"placeId": "[^"]*"', "", html)
+    assert html.count("</script>") == 2
+
+
+def test_coordinates_are_used_without_place_ids():
+    args = map_args(directions())
+    assert args[3] == "{lat: -6.2, lng: 106.8}"
+    assert args[4] == "{lat: -6.9, lng: 107.6}"
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.utils.offload import Offloader
+
+# Module-level so worker processes can unpickle them
+
+
+def where(_payload=None):
+    return os.getpid(), threading.current_thread().name
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+def die():
+    os._exit(1)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+MAIN = (os.getpid(), threading.current_thread().name)
+
+
+@pytest.fixture
+def process_offloader():
+    offloader = Offloader("process", workers=1, thresholds={"render": 10})
+    yield offloader
+    offloader.close()
+
+
+def test_payloads_below_the_threshold_run_inline():
+    offloader = Offloader("thread", workers=1, thresholds={"render": 10})
+    try:
+        assert offloader.call("render", where, size=9) == MAIN
+        # Tasks without a threshold are never offloaded
+        assert offloader.call("other", where, size=10 ** 6) == MAIN
+        assert run(offloader.run("render", where, size=9)) == MAIN
+    finally:
+        offloader.close()
+
+
+def test_payloads_at_the_threshold_go_to_a_thread():
+    offloader = Offloader("thread", workers=1, thresholds={"render": 10})
+    try:
+        pid, thread = offloader.call("render", where, size=10)
+        assert pid == os.getpid() and thread.startswith("offload")
+        pid, thread = run(offloader.run("render", where, size=10))
+        assert pid == os.getpid() and thread.startswith("offload")
+    finally:
+        offloader.close()
+
+
+def test_inline_mode_never_offloads():
+    offloader = Offloader("inline", thresholds={"render": 0})
+    assert offloader.call("render", where, size=10 ** 6) == MAIN
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Offloader("gpu")
+
+
+def test_process_mode_uses_a_process_unless_the_task_opts_out(process_offloader):
+    pid, _ = process_offloader.call("render", where, size=10)
+    assert pid != os.getpid()
+    pid, thread = process_offloader.call("render", where, size=10, allow_process=False)
+    assert pid == os.getpid() and thread.startswith("offload")
+    assert process_offloader.call("render", where, size=9) == MAIN
+
+
+def test_exception_in_a_process_reaches_the_caller_and_the_pool_keeps_working(process_offloader):
+    with pytest.raises(ValueError, match="bad payload"):
+        process_offloader.call("render", fail, "bad payload", size=10)
+    with pytest.raises(ValueError, match="bad payload"):
+        run(process_offloader.run("render", fail, "bad payload", size=10))
+    assert process_offloader.call("render", where, size=10)[0] != os.getpid()
+
+
+def test_dead_worker_process_is_replaced(process_offloader):
+    with pytest.raises(BrokenProcessPool):
+        process_offloader.call("render", die, size=10)
+    # The broken pool is dropped, so later payloads get a fresh one rather than failing forever
+    assert process_offloader.call("render", where, size=10)[0] != os.getpid()
+    with pytest.raises(BrokenProcessPool):
+        run(process_offloader.run("render", die, size=10))
+    assert run(process_offloader.run("render", where, size=10))[0] != os.getpid()
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.location import LocationResponse
+from app.utils.place_pager import InvalidCursor, PlacePager
+
+
+class FakeMaps:
+    """Two pages per query; records every (billed) call"""
+
+    def __init__(self, invalid_tokens=()):
+        self.calls = []
+        self.invalid_tokens = set(invalid_tokens)
+
+    def search_place(self, query):
+        self.calls.append(("search", query))
+        return LocationResponse(status="OK", next_cursor=f"google-token-{query}")
+
+    def search_place_page(self, token):
+        self.calls.append(("page", token))
+        if token in self.invalid_tokens:
+            return LocationResponse(status="INVALID_REQUEST")
+        return LocationResponse(status="OK")
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def pager(maps, **kwargs):
+    kwargs.setdefault("token_delay", 0.01)
+    return PlacePager(maps, secret=b"test-secret", **kwargs)
+
+
+def test_cursor_is_opaque_and_round_trips():
+    async def scenario():
+        maps = FakeMaps()
+        p = pager(maps, prefetch=False)
+        first = await p.page("pizza")
+        second = await p.page("pizza", first.next_cursor)
+        return first.next_cursor, second.status, maps.calls
+
+    cursor, status, calls = run(scenario())
+    assert "google-token" not in cursor
+    assert status == "OK"
+    assert calls == [("search", "pizza"), ("page", "google-token-pizza")]
+
+
+@pytest.mark.parametrize("cursor", ["google-token-pizza", "not.base64!", "a.b.c", ""])
+def test_foreign_cursors_are_rejected_without_a_places_call(cursor):
+    maps = FakeMaps()
+    with pytest.raises(InvalidCursor):
+        run(pager(maps).page("", cursor or "x"))
+    assert maps.calls == []
+
+
+def test_cursor_signed_with_another_secret_is_rejected():
+    maps = FakeMaps()
+    cursor = run(PlacePager(maps, secret=b"other", prefetch=False).page("pizza")).next_cursor
+    with pytest.raises(InvalidCursor):
+        run(pager(maps).page("", cursor))
+
+
+def test_expired_cursor_is_rejected():
+    maps = FakeMaps()
+    p = pager(maps, prefetch=False, cursor_ttl=0)
+    cursor = run(p.page("pizza")).next_cursor
+    time.sleep(1.1)
+    with pytest.raises(InvalidCursor):
+        run(p.page("", cursor))
+
+
+def test_old_invalid_token_is_not_retried():
+    async def scenario():
+        maps = FakeMaps(invalid_tokens={"google-token-pizza"})
+        p = pager(maps, prefetch=False, retries=3)
+        token, key, _ = p._verify((await p.page("pizza")).next_cursor)
+        # A cursor issued long enough ago that its token must have become valid
+        response = await p._fetch(token, time.time() - 60, wait_first=False)
+        return response.status, maps.calls.count(("page", "google-token-pizza"))
+
+    assert run(scenario()) == ("INVALID_REQUEST", 1)
+
+
+def test_prefetch_only_for_queries_that_get_paged():
+    async def scenario():
+        maps = FakeMaps()
+        p = pager(maps)
+        first = await p.page("pizza")
+        await asyncio.sleep(0.05)
+        before = [c for c in maps.calls if c[0] == "page"]
+        await p.page("pizza", first.next_cursor)
+        # Now the query is known to be paged: its next search prefetches page 2
+        await p.page("pizza")
+        await asyncio.sleep(0.05)
+        after = [c for c in maps.calls if c[0] == "page"]
+        return before, after
+
+    before, after = run(scenario())
+    assert before == []
+    assert len(after) == 2
+
+
+def test_prefetch_is_rate_limited():
+    async def scenario():
+        maps = FakeMaps()
+        p = pager(maps, prefetch_per_minute=2)
+        for query in ("a", "b", "c"):
+            cursor = (await p.page(query)).next_cursor
+            await p.page(query, cursor)
+        maps.calls.clear()
+        for query in ("a", "b", "c"):
+            await p.page(query)
+        await asyncio.sleep(0.05)
+        return [c for c in maps.calls if c[0] == "page"]
+
+    assert len(run(scenario())) == 2
@@ -0,0 +1,74 @@
+import math
+
+import pytest
+
+from app.models.location import Geometry, Place
+from app.utils import ranking
+from app.utils.ranking import haversine_km, rank_places
+
+# The user stands at Monas, central Jakarta
+USER = (-6.1754, 106.8272)
+
+
+def place(place_id, lat, lng, rating=None, reviews=None):
+    return Place(
+        place_id=place_id, name=place_id, formatted_address="Jakarta",
+        geometry=Geometry(lat=lat, lng=lng), rating=rating, user_ratings_total=reviews,
+    )
+
+
+@pytest.fixture(params=["python", "numpy"])
+def numpy_path(request, monkeypatch):
+    if request.param == "numpy" and not ranking.NUMPY_AVAILABLE:
+        pytest.skip("numpy is not installed")
+    monkeypatch.setattr(ranking, "NUMPY_AVAILABLE", request.param == "numpy")
+    return request.param
+
+
+def test_haversine_matches_known_distances(numpy_path):
+    # One degree along a meridian is 1/360 of the circumference; antipodes are half of it
+    distances = haversine_km(-6.2088, 106.8456, [-7.2088, -6.2088, 6.2088], [106.8456, 106.8456, -73.1544])
+    assert distances[0] == pytest.approx(math.pi * ranking.EARTH_RADIUS_KM / 180, rel=1e-9)
+    assert distances[1] == 0.0
+    assert distances[2] == pytest.approx(math.pi * ranking.EARTH_RADIUS_KM, rel=1e-9)
+
+
+def test_python_and_numpy_distances_agree(monkeypatch):
+    if not ranking.NUMPY_AVAILABLE:
+        pytest.skip("numpy is not installed")
+    lats, lngs = [-6.3, 48.85, -33.87, 0.0], [106.9, 2.29, 151.21, 180.0]
+    with_numpy = haversine_km(*USER, lats, lngs)
+    monkeypatch.setattr(ranking, "NUMPY_AVAILABLE", False)
+    assert haversine_km(*USER, lats, lngs) == pytest.approx(with_numpy, rel=1e-12)
+
+
+def test_unrated_places_are_ordered_by_distance(numpy_path):
+    places = [place("far", -6.30, 106.90), place("near", -6.18, 106.83), place("middle", -6.22, 106.85)]
+    ranked = rank_places(places, *USER)
+    assert [p.place_id for p in ranked] == ["near", "middle", "far"]
+    distances = [p.distance_km for p in ranked]
+    assert distances == sorted(distances)
+    # Inputs are left as they were
+    assert places[0].distance_km is None
+
+
+def test_ties_keep_the_upstream_order(numpy_path):
+    # Same spot, same rating: Google's relevance order decides
+    places = [place(f"p{i}", -6.20, 106.84, rating=4.0, reviews=100) for i in range(4)]
+    assert [p.place_id for p in rank_places(places, *USER)] == ["p0", "p1", "p2", "p3"]
+
+
+def test_rating_can_outweigh_a_little_distance(numpy_path):
+    places = [place("close-but-bad", -6.176, 106.828, 1.5, 2000), place("a-bit-further", -6.18, 106.83, 4.9, 2000)]
+    assert rank_places(places, *USER, distance_weight=0.5)[0].place_id == "a-bit-further"
+    assert rank_places(places, *USER, distance_weight=1.0)[0].place_id == "close-but-bad"
+
+
+def test_radius_drops_far_places(numpy_path):
+    places = [place("near", -6.18, 106.83), place("bandung", -6.9175, 107.6191)]
+    assert [p.place_id for p in rank_places(places, *USER, radius_km=20)] == ["near"]
+
+
+def test_empty_input(numpy_path):
+    assert rank_places([], *USER) == []
+    assert haversine_km(*USER, [], []) == []
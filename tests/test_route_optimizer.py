@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from app.utils import route_optimizer
+from app.utils.route_optimizer import order_stops, plan_matrix_requests, route_cost
+
+
+def random_matrix(n, seed):
+    rng = random.Random(seed)
+    return [[0.0 if a == b else rng.uniform(60, 3600) for b in range(n)] for a in range(n)]
+
+
+@pytest.mark.parametrize("numpy_path", [False, True])
+@pytest.mark.parametrize("n", [1, 2, 3, 4, 7, 12, 25, 40])
+@pytest.mark.parametrize("round_trip,fixed_end", [(False, False), (True, False), (False, True)])
+def test_order_is_a_permutation_honouring_the_fixed_stops(monkeypatch, numpy_path, n, round_trip, fixed_end):
+    if numpy_path and not route_optimizer.NUMPY_AVAILABLE:
+        pytest.skip("numpy is not installed")
+    monkeypatch.setattr(route_optimizer, "NUMPY_AVAILABLE", numpy_path)
+    monkeypatch.setattr(route_optimizer, "NUMPY_MIN_STOPS", 0 if numpy_path else 10 ** 6)
+    order = order_stops(random_matrix(n, seed=n), round_trip=round_trip, fixed_end=fixed_end)
+    assert sorted(order) == list(range(n))
+    if n:
+        assert order[0] == 0
+    if fixed_end and n > 2:
+        assert order[-1] == n - 1
+
+
+def test_numpy_and_python_paths_agree(monkeypatch):
+    if not route_optimizer.NUMPY_AVAILABLE:
+        pytest.skip("numpy is not installed")
+    matrix = random_matrix(30, seed=7)
+    monkeypatch.setattr(route_optimizer, "NUMPY_MIN_STOPS", 10 ** 6)
+    python_order = order_stops(matrix)
+    monkeypatch.setattr(route_optimizer, "NUMPY_MIN_STOPS", 0)
+    numpy_order = order_stops(matrix)
+    assert route_cost(matrix, numpy_order) == pytest.approx(route_cost(matrix, python_order))
+
+
+def test_stops_on_a_line_are_visited_in_line_order():
+    positions = [0, 5, 1, 4, 2, 3]
+    matrix = [[abs(a - b) for b in positions] for a in positions]
+    order = order_stops(matrix)
+    assert [positions[i] for i in order] == [0, 1, 2, 3, 4, 5]
+
+
+def test_matrix_requests_cover_every_missing_pair_within_the_limits():
+    missing = {(a, b) for a in range(30) for b in range(30) if a != b and (a * b) % 3}
+    requests = plan_matrix_requests(missing)
+    covered = set()
+    for origins, destinations in requests:
+        assert len(origins) <= 25 and len(destinations) <= 25
+        assert len(origins) * len(destinations) <= 100
+        covered.update((o, d) for o in origins for d in destinations)
+    assert missing <= covered
+    assert plan_matrix_requests([]) == []
@@ -0,0 +1,51 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.utils.sessions import SESSION_COOKIE
+
+EIFFEL_TOWER = {
+    "place_id": "ChIJLU7jZClu5kcR4PcOOO6p3I0",
+    "name": "Eiffel Tower",
+    "formatted_address": "Champ de Mars, Paris",
+    "geometry": {"lat": 48.8584, "lng": 2.2945},
+}
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def session_of(client):
+    return app.state.sessions.get_or_create(client.cookies[SESSION_COOKIE])[1]
+
+
+def test_session_turn_records_places_without_an_upstream_call(client, monkeypatch):
+    def no_calls(*args, **kwargs):
+        raise AssertionError("recording a turn must not call the LLM or Maps")
+
+    monkeypatch.setattr(app.state.results, "process_prompt", no_calls)
+    monkeypatch.setattr(app.state.results, "search_place", no_calls)
+    response = client.post("/api/session/turn", json={"places": [EIFFEL_TOWER]})
+    assert response.status_code == 204 and response.content == b""
+    session = session_of(client)
+    assert session.focus == "Eiffel Tower"
+    assert session.directions_endpoint("there") == f"place_id:{EIFFEL_TOWER['place_id']}"
+
+
+def test_session_turn_records_a_route(client):
+    response = client.post("/api/session/turn", json={"origin": "Louvre", "destination": "Orsay", "mode": "walking"})
+    assert response.status_code == 204
+    session = session_of(client)
+    assert (session.origin, session.destination, session.mode, session.focus) == ("Louvre", "Orsay", "walking", "Orsay")
+
+
+@pytest.mark.parametrize("turn", [
+    {"origin": "A", "destination": "B", "mode": "teleport"},
+    {"places": [EIFFEL_TOWER] * 6},
+    {"destination": "x" * 201},
+])
+def test_session_turn_rejects_unexpected_input(client, turn):
+    assert client.post("/api/session/turn", json=turn).status_code == 422
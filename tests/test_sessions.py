@@ -0,0 +1,63 @@
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.utils.metrics import SESSIONS_ACTIVE
+from app.utils.sessions import SESSION_COOKIE, SessionStore
+
+
+def request_with_cookie(value=None):
+    headers = [(b"cookie", f"{SESSION_COOKIE}={value}".encode())] if value else []
+    return Request({"type": "http", "headers": headers})
+
+
+def test_known_session_is_returned():
+    store = SessionStore()
+    session_id, state = store.get_or_create(None)
+    assert store.get_or_create(session_id) == (session_id, state)
+
+
+def test_unknown_well_formed_id_gets_a_new_id():
+    store = SessionStore()
+    planted = "attacker-chosen-id-0123456789"
+    session_id, state = store.get_or_create(planted)
+    assert session_id != planted
+    # The planted id still names nothing, so using it later starts yet another session
+    other_id, other = store.get_or_create(planted)
+    assert other_id not in (planted, session_id) and other is not state
+
+
+def test_malformed_id_gets_a_new_id():
+    store = SessionStore()
+    session_id, _ = store.get_or_create("<script>")
+    assert session_id != "<script>"
+
+
+def test_expired_session_is_replaced():
+    store = SessionStore(ttl=0.01)
+    session_id, state = store.get_or_create(None)
+    time.sleep(0.02)
+    new_id, new_state = store.get_or_create(session_id)
+    assert new_id != session_id and new_state is not state
+
+
+def test_new_session_sets_cookie_and_known_one_does_not():
+    store = SessionStore()
+    response = Response()
+    store.for_connection(request_with_cookie("attacker-chosen-id-0123456789"), response)
+    issued = response.headers["set-cookie"].split(";")[0].split("=", 1)[1]
+    assert issued != "attacker-chosen-id-0123456789"
+
+    again = Response()
+    store.for_connection(request_with_cookie(issued), again)
+    assert "set-cookie" not in again.headers
+
+
+def test_sessions_active_drops_when_sessions_expire():
+    store = SessionStore(ttl=0.01)
+    for _ in range(3):
+        store.get_or_create(None)
+    time.sleep(0.02)
+    store.get_or_create(None)
+    assert SESSIONS_ACTIVE._default.get() == 1
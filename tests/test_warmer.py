@@ -0,0 +1,38 @@
+import json
+import os
+import stat
+
+from app.config import Settings
+from app.utils.sketch import AccessHistory
+from app.utils.warmer import CacheWarmer
+
+
+def test_budget_and_rate_are_split_across_workers():
+    warmer = CacheWarmer(None, AccessHistory(capacity=100), budget=50, rate=2.0, workers=4)
+    assert warmer.budget == 13
+    assert warmer.rate == 0.5
+
+
+def test_snapshot_keeps_only_top_n_and_is_owner_only(tmp_path):
+    history = AccessHistory(capacity=100)
+    for i in range(20):
+        history.record("search", f"query {i}", count=100 - i)
+    path = str(tmp_path / "warm.json")
+    CacheWarmer(None, history, top_n=5, snapshot_path=path).save_snapshot()
+
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)["entries"]
+    assert [args for _, args, _ in entries] == [[f"query {i}"] for i in range(5)]
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_no_snapshot_path_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = AccessHistory(capacity=100)
+    history.record("search", "home address")
+    CacheWarmer(None, history).save_snapshot()
+    assert os.listdir(tmp_path) == []
+
+
+def test_snapshot_is_off_by_default():
+    assert Settings().warmer_snapshot is None
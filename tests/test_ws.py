@@ -0,0 +1,32 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.main import app
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def test_binary_frame_gets_an_error_and_the_socket_stays_open(client):
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.send_bytes(b"\x00\x01")
+        assert ws.receive_json() == {"type": "error", "id": None, "status": 400, "detail": "Messages must be text frames"}
+        ws.send_text("not json")
+        assert ws.receive_json()["detail"] == "Messages must be JSON"
+
+
+def test_same_origin_is_accepted(client):
+    with client.websocket_connect("/ws/chat", headers={"origin": "http://testserver"}) as ws:
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json()["status"] == 400
+
+
+def test_foreign_origin_is_rejected(client):
+    with pytest.raises(WebSocketDisconnect) as rejected:
+        with client.websocket_connect("/ws/chat", headers={"origin": "https://evil.example"}):
+            pass
+    assert rejected.value.code == 1008